@@ -1,6 +1,9 @@
 from django import forms
 from users.models import Student, Instructor, Admin
+from courses.gradebook import ChangedRowsFormSetMixin
 from courses.models import Unit, Course, Semester, CourseStudentStatus
+from courses.prerequisites import check_new_edges
+from courses.rollover import parse_adjustment
 
 
 class AdminStudentModificationForm(forms.ModelForm):
@@ -19,6 +22,56 @@ class AdminStudentModificationForm(forms.ModelForm):
             "verified",
         ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Derived from the student's grades (users.gpa), shown for reference only.
+        self.fields["gpa"].disabled = True
+
+class StudentImportForm(forms.Form):
+    file = forms.FileField(
+        help_text="UTF-8 CSV with 'national_id', 'email' and 'major' columns.",
+        widget=forms.ClearableFileInput(attrs={'accept': '.csv'}),
+    )
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if not file.name.lower().endswith('.csv'):
+            raise forms.ValidationError("Upload a .csv file.")
+        return file
+
+class SemesterRolloverForm(forms.Form):
+    source = forms.ModelChoiceField(queryset=Semester.objects.order_by('-codename')) # pyright: ignore
+    target = forms.ModelChoiceField(queryset=Semester.objects.order_by('-codename')) # pyright: ignore
+    units = forms.ModelMultipleChoiceField(
+        queryset=Unit.objects.order_by('name'),  # pyright: ignore
+        required=False,
+        help_text="خالی: همه‌ی دروس ترم مبدأ",
+        widget=forms.SelectMultiple(attrs={'size': 10})
+    )
+    carry_instructors = forms.BooleanField(required=False, initial=True)
+    slots_rule = forms.CharField(required=False, help_text="مثال: +5، -10%، =40")
+    price_rule = forms.CharField(required=False, help_text="مثال: +10%، =500000")
+
+    def _clean_rule(self, field_name):
+        rule = self.cleaned_data[field_name]
+        try:
+            parse_adjustment(rule)
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+        return rule
+
+    def clean_slots_rule(self):
+        return self._clean_rule('slots_rule')
+
+    def clean_price_rule(self):
+        return self._clean_rule('price_rule')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('source') is not None and cleaned_data.get('source') == cleaned_data.get('target'):
+            raise forms.ValidationError("ترم مبدأ و مقصد باید متفاوت باشند.")
+        return cleaned_data
+
 class AdminUnitCreationForm(forms.ModelForm):
     prerequisites = forms.ModelMultipleChoiceField(
         queryset=Unit.objects.all(),  # pyright: ignore
@@ -46,6 +99,13 @@ class AdminUnitModificationForm(forms.ModelForm):
             'majors': forms.SelectMultiple(attrs={'size': 5}),
         }
 
+    def clean_prerequisites(self):
+        prerequisites = self.cleaned_data["prerequisites"]
+        # Only the newly chosen ones can close a cycle.
+        current = set(self.instance.prerequisites.values_list("pk", flat=True))
+        check_new_edges([self.instance.pk], {unit.pk for unit in prerequisites} - current)
+        return prerequisites
+
 class AdminCourseCreationForm(forms.ModelForm):
     class Meta:
         model = Course
@@ -78,10 +138,14 @@ class AdminCSSInlineForm(forms.ModelForm):
             'grade': forms.NumberInput(attrs={'step': "0.25"}), # Example for decimal grades
         }
 
+class AdminCSSBaseInlineFormSet(ChangedRowsFormSetMixin, forms.BaseInlineFormSet):
+    pass
+
 AdminCSSInlineFormSet = forms.inlineformset_factory(
     Course,                    
     CourseStudentStatus,       
     form=AdminCSSInlineForm, 
+    formset=AdminCSSBaseInlineFormSet,
     extra=0,                   
     can_delete=True,          
 )
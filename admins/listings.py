@@ -0,0 +1,42 @@
+"""
+Querysets for the admin list pages.
+
+Every row of the course, instructor and unit lists shows related names
+and counts. Loading them lazily costs a few queries per row, so the
+querysets here join the related rows, annotate the counts as correlated
+subqueries and prefetch the prerequisites: a page costs the same number
+of queries however many rows it has.
+"""
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from courses.models import Course, CourseStudentStatus, Unit, WaitlistEntry
+from users.models import Instructor
+
+
+def _count(queryset, field):
+    """Number of rows of queryset whose `field` is the outer row."""
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def course_list():
+    """Courses with their unit, instructor and semester, and paid_count and waitlisted_count."""
+    return Course.objects.select_related('unit', 'instructor', 'semester').annotate( # pyright: ignore
+        paid_count=_count(CourseStudentStatus.objects.filter(paid=True, canceled=False), 'course'), # pyright: ignore
+        waitlisted_count=_count(WaitlistEntry.objects.all(), 'course'), # pyright: ignore
+    )
+
+
+def instructor_list():
+    """Instructors with active_course_count, their courses in active semesters."""
+    return Instructor.objects.annotate(
+        active_course_count=_count(Course.objects.filter(semester__active=True), 'instructor'), # pyright: ignore
+    )
+
+
+def unit_list():
+    """Units with their prerequisites prefetched."""
+    return Unit.objects.prefetch_related( # pyright: ignore
+        Prefetch('prerequisites', queryset=Unit.objects.only('id', 'name')) # pyright: ignore
+    )
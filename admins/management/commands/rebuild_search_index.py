@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from admins.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the admin full-text search index of users and units from scratch."
+
+    def handle(self, *args, **options):
+        if rebuild_search_index():
+            self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
+        else:
+            self.stdout.write(self.style.WARNING("The search index is not available on this database."))
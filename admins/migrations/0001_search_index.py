@@ -0,0 +1,38 @@
+from django.db import migrations, transaction, OperationalError
+
+# Frozen copies of admins.search.USERS_TABLE and UNITS_TABLE. The tables are
+# filled after migrating by admins.signals.search_index_created.
+TABLES = ('admins_search_users', 'admins_search_units')
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            for table in TABLES:
+                cursor.execute(f"CREATE VIRTUAL TABLE {table} USING fts5(text, tokenize='trigram')")
+    except OperationalError:
+        # SQLite built without FTS5 or its trigram tokenizer; search falls back to icontains.
+        return
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_waitlistentry'),
+        ('users', '0003_student_gpa_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,135 @@
+"""
+Keyset pagination for the admin lists.
+
+Pages are seeked by primary key (`?after=<pk>` / `?before=<pk>`) instead
+of OFFSET, so every page costs one indexed range scan however deep it
+is. Totals are counted once per filter combination and cached for
+COUNT_TIMEOUT seconds rather than counted on every page; saving or
+deleting a row of the model drops its cached totals (see admins.signals).
+
+Search results are paged in their rank order instead (`?rank=<start>`):
+the hits are a bounded list of ids that is already in memory, so a page
+is a slice of it.
+"""
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+
+PAGE_SIZE = 50
+COUNT_TIMEOUT = 5 * 60
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_previous, has_next, total):
+        self.object_list = object_list
+        self.has_previous = has_previous
+        self.has_next = has_next
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def previous_cursor(self):
+        return self.object_list[0].pk if self.object_list else None
+
+    @property
+    def next_cursor(self):
+        return self.object_list[-1].pk if self.object_list else None
+
+
+class RankedPage:
+    ranked = True
+
+    def __init__(self, object_list, start, per_page, total, truncated):
+        self.object_list = object_list
+        self.start = start
+        self.has_previous = start > 0
+        self.has_next = start + per_page < total
+        self.previous_start = max(start - per_page, 0)
+        self.next_start = start + per_page
+        self.total = total
+        self.truncated = truncated
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _cursor(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _count_version_key(model):
+    return f'admin_count_version:{model._meta.label_lower}'
+
+
+def counts_changed(model):
+    """Drops the cached counts of the model's querysets."""
+    cache.set(_count_version_key(model), uuid.uuid4().hex, None)
+
+
+def cached_count(queryset):
+    """COUNT of the queryset, cached per model and filter combination."""
+    try:
+        query = str(queryset.order_by().query)
+    except EmptyResultSet:
+        return 0
+    model = queryset.model
+    version = cache.get_or_set(_count_version_key(model), lambda: uuid.uuid4().hex, None)
+    digest = hashlib.sha256(query.encode()).hexdigest()
+    key = f'admin_count:{model._meta.label_lower}:{version}:{digest}'
+    return cache.get_or_set(key, queryset.count, COUNT_TIMEOUT)
+
+
+def keyset_page(request, queryset, per_page=PAGE_SIZE):
+    """
+    Returns the KeysetPage of the queryset, in primary key order, that
+    the request's `after` or `before` cursor points at.
+    """
+    after = _cursor(request.GET.get('after'))
+    before = _cursor(request.GET.get('before'))
+
+    if before is not None:
+        rows = list(queryset.filter(pk__lt=before).order_by('-pk')[:per_page + 1])
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    else:
+        if after is not None:
+            queryset_page = queryset.filter(pk__gt=after)
+        else:
+            queryset_page = queryset
+        rows = list(queryset_page.order_by('pk')[:per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_previous = after is not None
+
+    return KeysetPage(rows, has_previous, has_next, cached_count(queryset))
+
+
+def ranked_page(request, queryset, ranked_ids, per_page=PAGE_SIZE):
+    """
+    Returns the RankedPage, at the request's `rank` position, of the rows
+    of the queryset among `ranked_ids` (search hits, best first), in that
+    order.
+    """
+    matching = set(queryset.filter(pk__in=ranked_ids).values_list('pk', flat=True))
+    ordered = [pk for pk in ranked_ids if pk in matching]
+    start = min(max(_cursor(request.GET.get('rank')) or 0, 0), len(ordered))
+    page_ids = ordered[start:start + per_page]
+    rows = queryset.in_bulk(page_ids)
+    return RankedPage(
+        [rows[pk] for pk in page_ids if pk in rows], start, per_page, len(ordered),
+        getattr(ranked_ids, 'truncated', False),
+    )
@@ -0,0 +1,206 @@
+"""
+Full-text search index for the admin lists.
+
+Users (names, username, national ID and student ID) and units (name and
+description) are indexed in SQLite FTS5 tables with the trigram
+tokenizer. The tables are created by this app's migration, filled right
+after it and kept in sync by admins.signals; bulk writes that bypass signals call
+index_users()/index_units() themselves, and `manage.py
+rebuild_search_index` rebuilds everything.
+
+Text is normalized before indexing and searching (Arabic and Persian
+letter variants, diacritics, ZWNJ, Persian digits, case), so both
+scripts match however they were typed. Every query term is matched by
+its trigrams: a term matches a row when it is a substring of it (which
+covers prefixes) or, for terms longer than a trigram, when at least
+FUZZY_THRESHOLD of its character pairs occur in it, which tolerates a
+typo in a name. Trigrams find the candidates, pairs score them.
+
+Results are every scored candidate, best first. The index hands out at
+most MAX_CANDIDATES candidates, in FTS rank order; when it had more, the
+hits are marked as truncated so the lists can say so.
+
+Where FTS5 is not available (another database, or an SQLite build
+without the trigram tokenizer) the search functions return None and the
+views fall back to icontains filters.
+"""
+import functools
+import re
+import unicodedata
+
+from django.db import connection, transaction
+
+USERS_TABLE = 'admins_search_users'
+UNITS_TABLE = 'admins_search_units'
+MAX_CANDIDATES = 2000
+FUZZY_THRESHOLD = 0.6
+CHUNK_SIZE = 500
+
+_TRANSLATION = str.maketrans({
+    '\u064a': '\u06cc', '\u0649': '\u06cc', '\u0626': '\u06cc',  # Arabic yeh variants -> Persian yeh
+    '\u0643': '\u06a9',  # Arabic kaf -> Persian keheh
+    '\u0629': '\u0647', '\u06c0': '\u0647',  # teh marbuta, heh with yeh -> heh
+    '\u0623': '\u0627', '\u0625': '\u0627', '\u0622': '\u0627', '\u0671': '\u0627',  # alef variants
+    '\u0624': '\u0648',  # waw with hamza -> waw
+    '\u200c': ' ',  # ZWNJ separates words
+    '\u200d': '', '\u200e': '', '\u200f': '', '\u0640': '',  # joiners, direction marks, tatweel
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},  # Persian digits
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},  # Arabic-Indic digits
+})
+_DIACRITICS = re.compile('[\u064b-\u065f\u0670]')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKC', text or '').translate(_TRANSLATION)
+    return ' '.join(_DIACRITICS.sub('', text).casefold().split())
+
+
+def _ngrams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _trigrams(term):
+    return _ngrams(term, 3)
+
+
+class SearchHits(list):
+    """Matching ids, best first; `truncated` when the index had more candidates."""
+
+    def __init__(self, ids=(), truncated=False):
+        super().__init__(ids)
+        self.truncated = truncated
+
+
+@functools.lru_cache(maxsize=None)
+def _tables_exist(database_name):
+    return USERS_TABLE in connection.introspection.table_names()
+
+
+def search_available():
+    return connection.vendor == 'sqlite' and _tables_exist(str(connection.settings_dict['NAME']))
+
+
+# -- indexing --------------------------------------------------------------
+
+def _replace(table, documents):
+    documents = list(documents)
+    if not documents:
+        return
+    # One transaction: in autocommit mode every row would be a commit.
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {table} WHERE rowid = %s', [(pk,) for pk, _ in documents])
+        cursor.executemany(f'INSERT INTO {table} (rowid, text) VALUES (%s, %s)', documents)
+
+
+def _remove(table, pks):
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {table} WHERE rowid = %s', [(pk,) for pk in pks])
+
+
+def index_users(pks):
+    """(Re)indexes the given users, whichever role they have."""
+    from users.models import User
+
+    if not search_available():
+        return
+    pks = list(pks)
+    for start in range(0, len(pks), CHUNK_SIZE):
+        rows = User.objects.filter(pk__in=pks[start:start + CHUNK_SIZE]).values_list( # pyright: ignore
+            'pk', 'username', 'first_name', 'last_name', 'national_id', 'student__student_id'
+        )
+        _replace(USERS_TABLE, ((pk, normalize(' '.join(filter(None, fields)))) for pk, *fields in rows))
+
+
+def index_units(pks):
+    from courses.models import Unit
+
+    if not search_available():
+        return
+    pks = list(pks)
+    for start in range(0, len(pks), CHUNK_SIZE):
+        rows = Unit.objects.filter(pk__in=pks[start:start + CHUNK_SIZE]).values_list('pk', 'name', 'description') # pyright: ignore
+        _replace(UNITS_TABLE, ((pk, normalize(f'{name} {description or ""}')) for pk, name, description in rows))
+
+
+def unindex_users(pks):
+    if search_available():
+        _remove(USERS_TABLE, pks)
+
+
+def unindex_units(pks):
+    if search_available():
+        _remove(UNITS_TABLE, pks)
+
+
+def rebuild_search_index():
+    from courses.models import Unit
+    from users.models import User
+
+    # The tables may have been created since they were last looked for.
+    _tables_exist.cache_clear()
+    if not search_available():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {USERS_TABLE}')
+        cursor.execute(f'DELETE FROM {UNITS_TABLE}')
+    index_users(User.objects.values_list('pk', flat=True)) # pyright: ignore
+    index_units(Unit.objects.values_list('pk', flat=True)) # pyright: ignore
+    return True
+
+
+# -- searching -------------------------------------------------------------
+
+def _candidates(table, terms):
+    trigrams = set().union(*(_trigrams(term) for term in terms))
+    with connection.cursor() as cursor:
+        if trigrams:
+            match = ' OR '.join('"{}"'.format(trigram.replace('"', '""')) for trigram in trigrams)
+            cursor.execute(
+                f'SELECT rowid, text FROM {table} WHERE {table} MATCH %s ORDER BY rank LIMIT %s',
+                [match, MAX_CANDIDATES],
+            )
+        else:
+            # Only terms shorter than a trigram: a plain substring scan of the index.
+            pattern = re.sub(r'([\\%_])', r'\\\1', terms[0])
+            cursor.execute(
+                f"SELECT rowid, text FROM {table} WHERE text LIKE %s ESCAPE '\\' LIMIT %s",
+                [f'%{pattern}%', MAX_CANDIDATES],
+            )
+        return cursor.fetchall()
+
+
+def _term_score(term, text, text_bigrams):
+    if term in text:
+        return 1.0
+    if len(term) <= 3:
+        return 0.0
+    bigrams = _ngrams(term, 2)
+    return len(bigrams & text_bigrams) / len(bigrams)
+
+
+def _search(table, query):
+    if not search_available():
+        return None
+    terms = normalize(query).split()
+    if not terms:
+        return None
+
+    scored = []
+    candidates = _candidates(table, terms)
+    for pk, text in candidates:
+        text_bigrams = _ngrams(text, 2)
+        scores = [_term_score(term, text, text_bigrams) for term in terms]
+        if min(scores) >= FUZZY_THRESHOLD:
+            scored.append((sum(scores), pk))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return SearchHits([pk for _, pk in scored], truncated=len(candidates) >= MAX_CANDIDATES)
+
+
+def search_users(query):
+    """SearchHits of the matching users, or None if the index is unavailable."""
+    return _search(USERS_TABLE, query)
+
+
+def search_units(query):
+    """SearchHits of the matching units, or None if the index is unavailable."""
+    return _search(UNITS_TABLE, query)
@@ -0,0 +1,64 @@
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from courses.models import Course, Unit
+from users.models import Admin, Instructor, Student, User
+from .pagination import counts_changed
+from .search import index_units, index_users, rebuild_search_index, unindex_units, unindex_users
+
+# Multi-table inheritance sends the signals with the child class as sender.
+USER_MODELS = (User, Student, Instructor, Admin)
+
+# The fields that make up the indexed text, see admins.search.
+USER_INDEXED_FIELDS = {'username', 'first_name', 'last_name', 'national_id', 'student_id'}
+UNIT_INDEXED_FIELDS = {'name', 'description'}
+
+
+def _indexed(update_fields, indexed_fields):
+    # Logins save last_login alone, which must not reindex the user.
+    return update_fields is None or bool(indexed_fields & set(update_fields))
+
+
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if _indexed(update_fields, USER_INDEXED_FIELDS):
+        index_users([instance.pk])
+
+
+def user_deleted(sender, instance, **kwargs):
+    unindex_users([instance.pk])
+
+
+for model in USER_MODELS:
+    post_save.connect(user_saved, sender=model, dispatch_uid=f'search_index_{model.__name__}_saved')
+    post_delete.connect(user_deleted, sender=model, dispatch_uid=f'search_index_{model.__name__}_deleted')
+
+
+@receiver(post_save, sender=Unit)
+def unit_saved(sender, instance, update_fields=None, **kwargs):
+    if _indexed(update_fields, UNIT_INDEXED_FIELDS):
+        index_units([instance.pk])
+
+
+@receiver(post_delete, sender=Unit)
+def unit_deleted(sender, instance, **kwargs):
+    unindex_units([instance.pk])
+
+
+def list_changed(sender, update_fields=None, **kwargs):
+    # Logins save last_login alone, which changes no list.
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        counts_changed(sender)
+
+
+for model in (*USER_MODELS, Course, Unit):
+    post_save.connect(list_changed, sender=model, dispatch_uid=f'admin_counts_{model.__name__}_saved')
+    post_delete.connect(list_changed, sender=model, dispatch_uid=f'admin_counts_{model.__name__}_deleted')
+
+
+@receiver(post_migrate)
+def search_index_created(sender, app_config, plan=None, **kwargs):
+    # The migration only creates the tables; fill them from the current code.
+    if app_config.label == 'admins' and any(
+        migration.app_label == 'admins' and migration.name == '0001_search_index' and not backwards
+        for migration, backwards in plan or ()
+    ):
+        rebuild_search_index()
@@ -1,3 +1,223 @@
-from django.test import TestCase
+import datetime
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from courses.models import Course, CourseStudentStatus, Semester, Unit, WaitlistEntry
+from users.models import Admin, Instructor, Major, Student
+from .pagination import cached_count, keyset_page, ranked_page
+from .search import search_available, search_units, search_users
+
+
+class AdminListQueryCountTests(TestCase):
+    """The admin lists cost a fixed number of queries however many rows they show."""
+
+    def setUp(self):
+        self.semester = Semester.objects.create( # pyright: ignore
+            codename=4031,
+            start_date=datetime.date(2024, 9, 1),
+            end_date=datetime.date(2025, 1, 1),
+            active=True,
+        )
+        self.major = Major.objects.create(name="Computer Science", codename="CS") # pyright: ignore
+        admin = Admin.objects.create( # pyright: ignore
+            national_id="a1", username="a1", email="a1@example.com", title="Registrar", is_staff=True,
+        )
+        self.client.force_login(admin)
+        self.rows = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            n = self.rows = self.rows + 1
+            instructor = Instructor.objects.create( # pyright: ignore
+                national_id=f"i{n}", username=f"i{n}", email=f"i{n}@example.com",
+                specialty="Algorithms", academic_title=Instructor.AcademicTitle.PROFESSOR,
+            )
+            unit = Unit.objects.create(name=f"Unit {n}", unit_size=3) # pyright: ignore
+            if n > 1:
+                unit.prerequisites.add(Unit.objects.get(name=f"Unit {n - 1}")) # pyright: ignore
+            course = Course.objects.create( # pyright: ignore
+                unit=unit, instructor=instructor, semester=self.semester, slots=1, price=100,
+            )
+            student = Student.objects.create( # pyright: ignore
+                national_id=f"s{n}", username=f"s{n}", email=f"s{n}@example.com", gpa=0, major=self.major,
+            )
+            CourseStudentStatus.objects.create(student=student, course=course, paid=n % 2 == 0) # pyright: ignore
+            WaitlistEntry.objects.create(student=student, course=course) # pyright: ignore
+
+    def count_queries(self, url_name):
+        # The page totals are cached; count them on every request alike.
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def assertConstantQueries(self, url_name):
+        self.add_rows(2)
+        few, _ = self.count_queries(url_name)
+        self.add_rows(20)
+        many, response = self.count_queries(url_name)
+        self.assertEqual(few, many)
+        return response
+
+    def test_course_list(self):
+        response = self.assertConstantQueries('list_all_courses')
+        rows = {course.unit.name: course for course in response.context['courses']}
+        self.assertEqual(len(rows), 22)
+        self.assertEqual((rows['Unit 1'].paid_count, rows['Unit 1'].waitlisted_count), (0, 1))
+        self.assertEqual((rows['Unit 2'].paid_count, rows['Unit 2'].waitlisted_count), (1, 1))
+        self.assertEqual(rows['Unit 2'].enrolled_count, 1)
+
+    def test_instructor_list(self):
+        response = self.assertConstantQueries('list_all_instructors')
+        self.assertEqual({instructor.active_course_count for instructor in response.context['instructors']}, {1})
+
+    def test_unit_list(self):
+        response = self.assertConstantQueries('admin_list_all_units')
+        self.assertContains(response, "Unit 21")
+        self.assertEqual(
+            [unit.get_prerequisites_display() for unit in response.context['units']][:2],
+            ["بدون پیش نیاز", "Unit 1"],
+        )
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.units = [Unit.objects.create(name=f"Unit {n}", unit_size=3) for n in range(5)] # pyright: ignore
+
+    def page(self, **cursor):
+        return keyset_page(RequestFactory().get('/', cursor), Unit.objects.all(), per_page=2) # pyright: ignore
+
+    def test_after_and_before_cursors(self):
+        first = self.page()
+        self.assertEqual(first.object_list, self.units[:2])
+        self.assertEqual((first.has_previous, first.has_next, first.total), (False, True, 5))
+
+        second = self.page(after=first.next_cursor)
+        self.assertEqual(second.object_list, self.units[2:4])
+        self.assertEqual((second.has_previous, second.has_next), (True, True))
+
+        last = self.page(after=second.next_cursor)
+        self.assertEqual(last.object_list, self.units[4:])
+        self.assertEqual((last.has_previous, last.has_next), (True, False))
+
+        back = self.page(before=last.previous_cursor)
+        self.assertEqual(back.object_list, self.units[2:4])
+        self.assertEqual((back.has_previous, back.has_next), (True, True))
+        self.assertEqual(self.page(before=back.previous_cursor).object_list, self.units[:2])
+        self.assertFalse(self.page(before=back.previous_cursor).has_previous)
+
+    def test_page_boundaries(self):
+        # A last page that is exactly full has no next page.
+        full = keyset_page(RequestFactory().get('/', {'after': self.units[2].pk}), Unit.objects.all(), per_page=2) # pyright: ignore
+        self.assertEqual((full.object_list, full.has_next), (self.units[3:], False))
+        empty = self.page(after=self.units[-1].pk)
+        self.assertEqual((empty.object_list, empty.has_next, empty.next_cursor), ([], False, None))
+        self.assertEqual(self.page(after='x').object_list, self.units[:2])
+
+    def test_counts_are_cached_until_the_model_changes(self):
+        queryset = Unit.objects.filter(unit_size=3) # pyright: ignore
+        self.assertEqual(cached_count(queryset), 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(cached_count(Unit.objects.filter(unit_size=3)), 5) # pyright: ignore
+        self.assertEqual(cached_count(Unit.objects.filter(unit_size=4)), 0) # pyright: ignore
+        self.assertEqual(cached_count(Unit.objects.none()), 0) # pyright: ignore
+
+        Unit.objects.create(name="Unit 5", unit_size=3) # pyright: ignore
+        self.assertEqual(cached_count(queryset), 6)
+        self.units[0].unit_size = 4
+        self.units[0].save()
+        self.assertEqual(cached_count(queryset), 5)
+        self.units[1].delete()
+        self.assertEqual(cached_count(queryset), 4)
+
+
+class AdminSearchTests(TestCase):
+    def setUp(self):
+        if not search_available():
+            self.skipTest("SQLite has no FTS5 trigram tokenizer")
+        admin = Admin.objects.create( # pyright: ignore
+            national_id="a1", username="a1", email="a1@example.com", title="Registrar", is_staff=True,
+        )
+        self.client.force_login(admin)
+        # The misspelt unit comes first by primary key but ranks below the others.
+        self.typo = Unit.objects.create(name="Databse Systems", unit_size=3) # pyright: ignore
+        self.exact = [Unit.objects.create(name=f"Database {n}", unit_size=3) for n in range(4)] # pyright: ignore
+
+    def test_hits_are_paged_in_rank_order(self):
+        hits = search_units("database")
+        self.assertEqual(list(hits), [unit.pk for unit in self.exact] + [self.typo.pk])
+
+        def page(rank):
+            return ranked_page(RequestFactory().get('/', {'rank': rank}), Unit.objects.all(), hits, per_page=2) # pyright: ignore
+
+        first, last = page(0), page(4)
+        self.assertEqual(first.object_list, self.exact[:2])
+        self.assertEqual((first.has_previous, first.has_next, first.next_start, first.total), (False, True, 2, 5))
+        self.assertEqual(last.object_list, [self.typo])
+        self.assertEqual((last.has_previous, last.has_next, last.previous_start), (True, False, 2))
+
+        response = self.client.get(reverse('admin_list_all_units'), {'q': 'database'})
+        self.assertEqual(list(response.context['units'])[-1], self.typo)
+
+    def test_courses_rank_by_their_unit_or_instructor(self):
+        semester = Semester.objects.create( # pyright: ignore
+            codename=4031, start_date=datetime.date(2024, 9, 1), end_date=datetime.date(2025, 1, 1), active=True,
+        )
+        instructor = Instructor.objects.create( # pyright: ignore
+            national_id="i1", username="i1", email="i1@example.com", last_name="Databaseian",
+            specialty="Algorithms", academic_title=Instructor.AcademicTitle.PROFESSOR,
+        )
+        courses = [
+            Course.objects.create(unit=unit, instructor=instructor, semester=semester, slots=1, price=100) # pyright: ignore
+            for unit in (self.typo, self.exact[0])
+        ]
+        response = self.client.get(reverse('list_all_courses'), {'q': 'database'})
+        self.assertEqual(list(response.context['courses']), courses)
+
+        instructor.last_name = "Smith"
+        instructor.save()
+        response = self.client.get(reverse('list_all_courses'), {'q': 'database'})
+        self.assertEqual(list(response.context['courses']), courses[::-1])
+
+    def test_arabic_and_persian_yeh_and_kaf_match(self):
+        # Stored with the Persian forms, searched with the Arabic ones.
+        unit = Unit.objects.create(name="\u0633\u06cc\u0633\u062a\u0645 \u06a9\u0627\u0645\u067e\u06cc\u0648\u062a\u0631\u06cc", unit_size=3) # pyright: ignore
+        self.assertEqual(list(search_units("\u0643\u0627\u0645\u067e\u064a\u0648\u062a\u0631\u064a")), [unit.pk])
+        response = self.client.get(reverse('admin_list_all_units'), {'q': "\u0633\u064a\u0633\u062a\u0645"})
+        self.assertEqual(list(response.context['units']), [unit])
+
+        # Stored with the Arabic forms, searched with the Persian ones.
+        instructor = Instructor.objects.create( # pyright: ignore
+            national_id="i1", username="i1", email="i1@example.com",
+            first_name="\u0639\u0644\u064a", last_name="\u0643\u0631\u064a\u0645\u064a",
+            specialty="Algorithms", academic_title=Instructor.AcademicTitle.PROFESSOR,
+        )
+        self.assertEqual(list(search_users("\u06a9\u0631\u06cc\u0645\u06cc")), [instructor.pk])
+
+    def test_truncated_hits_are_shown(self):
+        self.assertFalse(search_units("database").truncated) # pyright: ignore
+        with mock.patch('admins.search.MAX_CANDIDATES', 2):
+            self.assertTrue(search_units("database").truncated) # pyright: ignore
+            response = self.client.get(reverse('admin_list_all_units'), {'q': 'database'})
+        self.assertTrue(response.context['page'].truncated)
+        self.assertContains(response, "فقط بهترین نتایج جستجو")
+
+    def test_only_indexed_fields_reindex(self):
+        user = Admin.objects.get(username="a1") # pyright: ignore
+        with mock.patch('admins.signals.index_users') as index_users:
+            user.save(update_fields=['last_login'])
+            self.assertFalse(index_users.called)
+            user.first_name = "Sara"
+            user.save(update_fields=['first_name'])
+            index_users.assert_called_once_with([user.pk])
+        with mock.patch('admins.signals.index_units') as index_units:
+            self.typo.unit_size = 4
+            self.typo.save(update_fields=['unit_size'])
+            self.assertFalse(index_units.called)
@@ -7,6 +7,8 @@ urlpatterns = [
     # Student management
     path('students/', views.list_all_students, name='list_all_students'),
     path('students/<int:pk>/edit/', views.admin_student_modification, name='admin_student_modification'),
+    path('students/import/', views.admin_student_import, name='admin_student_import'),
+    path('students/degree-audit/', views.admin_degree_audit, name='admin_degree_audit'),
     
     # Unit management
     path('units/', views.admin_list_all_units, name='admin_list_all_units'),
@@ -28,5 +30,6 @@ urlpatterns = [
     # Semester management
     path('semesters/', views.admin_list_all_semesters, name='admin_list_all_semesters'),
     path('semesters/create/', views.admin_semester_creation, name='admin_semester_creation'),
+    path('semesters/rollover/', views.admin_semester_rollover, name='admin_semester_rollover'),
     path('semesters/<int:codename>/edit/', views.admin_semester_modification, name='admin_semester_modification'),
 ]
@@ -1,8 +1,17 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.db.models import Q
 from django.db import transaction
-from users.models import Instructor, Student, Admin 
-from courses.models import Unit, Course, Semester
+from django.core.paginator import Paginator
+from users.models import Instructor, Major, Student, Admin 
+from courses.audit import Category, get_requirements, major_cohort
+from courses.gradebook import gradebook_page
+from courses.models import Unit, Course, CourseStudentStatus, PrerequisiteClosure, Semester
+from courses.prerequisites import unlocked_units
+from courses.rollover import roll_over
+from users.student_import import StudentImportError, import_students
+from .listings import course_list, instructor_list, unit_list
+from .pagination import keyset_page, ranked_page
+from .search import SearchHits, search_units, search_users
 from .forms import (
     AdminStudentModificationForm,
     AdminUnitCreationForm,
@@ -13,13 +22,31 @@ from .forms import (
     AdminInstructorModificationForm,
     AdminModificationForm,
     AdminSemesterCreationForm,
-    AdminSemesterModificationForm
+    AdminSemesterModificationForm,
+    SemesterRolloverForm,
+    StudentImportForm
 )
 
+import io
 from functools import wraps
 from django.shortcuts import render 
 from django.contrib import messages
 
+GRADEBOOK_PREFIX = 'grades'
+AUDIT_PAGE_SIZE = 100
+
+def _search_q(ids, field, fallback):
+    """Filters `field` by the search index hits, or by `fallback` where there is no index."""
+    if ids is None:
+        return fallback
+    return Q(**{f"{field}__in": ids})
+
+def _list_page(request, queryset, hits):
+    """Search hits are paged in rank order, everything else by primary key."""
+    if hits is None:
+        return keyset_page(request, queryset)
+    return ranked_page(request, queryset, hits)
+
 def admin_required(view_func):
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
@@ -44,13 +71,18 @@ def list_all_students(request):
     verified = request.GET.get('verified', '')
 
     students = Student.objects.all()
+    hits = None
 
     if query:
-        students = students.filter(
+        hits = search_users(query)
+        students = students.filter(_search_q(
+            hits, 'pk',
             Q(username__icontains=query) |  # pyright: ignore
             Q(first_name__icontains=query) | 
-            Q(last_name__icontains=query)
-        )
+            Q(last_name__icontains=query) |
+            Q(national_id__icontains=query) |
+            Q(student_id__icontains=query)
+        ))
 
     if first_semester:
         students = students.filter(first_semester__codename=first_semester)
@@ -61,7 +93,8 @@ def list_all_students(request):
     if verified in ["yes", "no"]:
         students = students.filter(verified=(verified == "yes"))
 
-    return render(request, "admin/students/list.html", {"students": students})
+    page = _list_page(request, students.select_related('first_semester', 'major'), hits)
+    return render(request, "admin/students/list.html", {"students": page, "page": page})
 
 @admin_required
 def admin_student_modification(request, pk):
@@ -77,6 +110,50 @@ def admin_student_modification(request, pk):
 
     return render(request, "admin/students/edit.html", {"form": form, "student": student})
 
+@admin_required
+def admin_student_import(request):
+    form = StudentImportForm(request.POST or None, request.FILES or None)
+    result = None
+
+    if request.method == "POST" and form.is_valid():
+        # The upload is streamed through the importer, never read whole.
+        lines = io.TextIOWrapper(form.cleaned_data["file"].file, encoding="utf-8-sig", newline="")
+        try:
+            # Passwords are only hashed by `manage.py import_students`,
+            # which can take minutes for a large file.
+            result = import_students(lines, workers=0, passwords=False)
+        except (StudentImportError, UnicodeDecodeError) as e:
+            form.add_error("file", str(e))
+        else:
+            if not result.errors:
+                messages.success(request, f"{result.imported} دانشجو با موفقیت ثبت شدند.")
+                return redirect("list_all_students")
+
+    return render(request, "admin/students/import.html", {"form": form, "result": result})
+
+
+@admin_required
+def admin_degree_audit(request):
+    major_id = request.GET.get('major', '')
+    major = Major.objects.filter(pk=major_id).first() if major_id.isdigit() else None # pyright: ignore
+    context = {
+        "majors": Major.objects.order_by('name'), # pyright: ignore
+        "major": major,
+        "categories": Category.labels,
+    }
+    if major is not None:
+        cohort = major_cohort(major.pk)
+        page = Paginator(cohort.ranking, AUDIT_PAGE_SIZE).get_page(request.GET.get('page'))
+        students = Student.objects.in_bulk(page.object_list)
+        context.update({
+            "page": page,
+            # Students deleted since the report was cached are left out.
+            "rows": [(students[pk], cohort.audits[pk]) for pk in page.object_list if pk in students],
+            "required": get_requirements(major.pk).audit(0).remaining_by_category(),
+            "average_remaining": cohort.average_remaining,
+            "complete_count": cohort.complete_count,
+        })
+    return render(request, "admin/students/degree_audit.html", context)
 
 # Unit management 
 @admin_required
@@ -84,21 +161,29 @@ def admin_list_all_units(request):
     query = request.GET.get('q', '')
     prereq_query = request.GET.get('prereq_q', '')
     
-    units = Unit.objects.all() # pyright: ignore
+    units = unit_list()
+    hits = None
 
     if query:
-        units = units.filter(
+        hits = search_units(query)
+        units = units.filter(_search_q(
+                hits, 'pk',
                 Q(name__icontains=query) |
                 Q(description__icontains=query) 
-                )
+                ))
 
     if prereq_query:
-        units = units.filter(
-            prerequisites__name__icontains=prereq_query
-        ).distinct()
-
+        # Units with a matching direct prerequisite, from the closure table.
+        required = PrerequisiteClosure.objects.filter(depth=1).filter(_search_q( # pyright: ignore
+            search_units(prereq_query), 'ancestor_id',
+            Q(ancestor__name__icontains=prereq_query)
+        ))
+        units = units.filter(pk__in=required.values('descendant_id'))
+
+    page = _list_page(request, units, hits)
     return render(request, "admin/units/list.html", {
-        "units": units,
+        "units": page,
+        "page": page,
         "query": query,
         "prereq_query": prereq_query
         })
@@ -129,7 +214,11 @@ def admin_unit_modification(request, pk):
     else:
         form = AdminUnitModificationForm(instance=unit)
 
-    return render(request, "admin/units/edit.html", {"form": form, "unit": unit})
+    return render(request, "admin/units/edit.html", {
+        "form": form,
+        "unit": unit,
+        "unlocks": unlocked_units([unit.pk]).order_by("name"),
+    })
 
 
 # Course management 
@@ -139,13 +228,18 @@ def list_all_courses(request):
     active = request.GET.get('active', '')
     semester = request.GET.get('semester', '')
     
-    courses = Course.objects.all() # pyright: ignore
+    courses = course_list()
+    unit_hits = user_hits = None
 
     if query:
+        unit_hits, user_hits = search_units(query), search_users(query)
         courses = courses.filter(
-            Q(unit__name__icontains=query) | # pyright: ignore
-            Q(instructor__first_name__icontains=query) |
-            Q(instructor__last_name__icontains=query)
+            _search_q(unit_hits, 'unit_id', Q(unit__name__icontains=query)) | # pyright: ignore
+            _search_q(
+                user_hits, 'instructor_id',
+                Q(instructor__first_name__icontains=query) |
+                Q(instructor__last_name__icontains=query)
+            )
         )
 
     if active == "yes":
@@ -156,7 +250,22 @@ def list_all_courses(request):
     if semester:
         courses = courses.filter(semester__codename=semester)
 
-    return render(request, "admin/courses/list.html", {"courses": courses})
+    hits = None
+    if unit_hits is not None and user_hits is not None:
+        hits = _course_hits(courses, unit_hits, user_hits)
+    page = _list_page(request, courses, hits)
+    return render(request, "admin/courses/list.html", {"courses": page, "page": page})
+
+def _course_hits(courses, unit_hits, user_hits):
+    """Course ids ranked by the better of their unit's and their instructor's rank."""
+    unit_rank = {pk: rank for rank, pk in enumerate(unit_hits)}
+    user_rank = {pk: rank for rank, pk in enumerate(user_hits)}
+    missing = len(unit_rank) + len(user_rank)
+    rows = sorted(
+        courses.values_list('pk', 'unit_id', 'instructor_id'),
+        key=lambda row: (min(unit_rank.get(row[1], missing), user_rank.get(row[2], missing)), row[0]),
+    )
+    return SearchHits([pk for pk, _, _ in rows], unit_hits.truncated or user_hits.truncated)
 
 @admin_required
 def admin_course_creation(request):
@@ -173,13 +282,14 @@ def admin_course_creation(request):
 @admin_required
 def admin_course_modification(request, pk):
     course = get_object_or_404(Course, pk=pk)
-    
+    page, students = gradebook_page(request, CourseStudentStatus.objects.filter(course=course), GRADEBOOK_PREFIX) # pyright: ignore
+
     # Handle POST request
     if request.method == "POST":
         # Create instances of both forms
         course_form = AdminCourseModificationForm(request.POST, instance=course)
         # Create the formset instance, bound to the POST data and the specific course instance
-        css_formset = AdminCSSInlineFormSet(request.POST, instance=course)
+        css_formset = AdminCSSInlineFormSet(request.POST, instance=course, queryset=students, prefix=GRADEBOOK_PREFIX)
         
         # Validate both forms
         if course_form.is_valid() and css_formset.is_valid():
@@ -206,12 +316,13 @@ def admin_course_modification(request, pk):
             messages.error(request, "Please correct the errors below.")
     else:
         course_form = AdminCourseModificationForm(instance=course)
-        css_formset = AdminCSSInlineFormSet(instance=course)
+        css_formset = AdminCSSInlineFormSet(instance=course, queryset=students, prefix=GRADEBOOK_PREFIX)
     
     # Render the template with both the course form and the formset
     return render(request, "admin/courses/edit.html", {
         "form": course_form,      # Main course form
-        "css_formset": css_formset, # CourseStudentStatus formset
+        "css_formset": css_formset, # CourseStudentStatus formset (one page of it)
+        "page": page,
         "course": course          # Pass the course object for context if needed
     })
 
@@ -222,21 +333,25 @@ def list_all_instructors(request):
     query = request.GET.get('q', '')
     verified = request.GET.get('verified', '')
 
-    instructors = Instructor.objects.all()
-    
+    instructors = instructor_list()
+    hits = None
+
     if query:
-        instructors = instructors.filter(
+        hits = search_users(query)
+        instructors = instructors.filter(_search_q(
+            hits, 'pk',
             Q(username__icontains=query) |  # pyright: ignore
             Q(first_name__icontains=query) |
             Q(last_name__icontains=query)
-        )
+        ))
 
     if verified == "yes":
         instructors = instructors.filter(verified=True)
     elif verified == "no":
         instructors = instructors.filter(verified=False)
 
-    return render(request, "admin/instructors/list.html", {"instructors": instructors})
+    page = _list_page(request, instructors, hits)
+    return render(request, "admin/instructors/list.html", {"instructors": page, "page": page})
 
 
 @admin_required
@@ -303,3 +418,24 @@ def admin_semester_modification(request, codename):
     else:
         form = AdminSemesterModificationForm(instance=semester)
     return render(request, "admin/semesters/edit.html", {"form": form, "semester": semester})
+
+@admin_required
+def admin_semester_rollover(request):
+    form = SemesterRolloverForm(request.POST or None)
+    if request.method == "POST" and form.is_valid():
+        units = form.cleaned_data["units"]
+        result = roll_over(
+            form.cleaned_data["source"], form.cleaned_data["target"],
+            unit_ids=[unit.pk for unit in units] if units else None,
+            carry_instructors=form.cleaned_data["carry_instructors"],
+            slots_rule=form.cleaned_data["slots_rule"],
+            price_rule=form.cleaned_data["price_rule"],
+        )
+        message = f"{len(result.courses)} درس به ترم {form.cleaned_data['target'].codename} منتقل شد."
+        if result.skipped:
+            message += f" {result.skipped} درس با همان واحد و استاد از قبل در ترم مقصد ارائه شده بود."
+        if result.also_offered:
+            message += f" {result.also_offered} درس منتقل‌شده در ترم مقصد با استاد دیگری هم ارائه می‌شود؛ آن‌ها را بررسی کنید."
+        messages.success(request, message)
+        return redirect("admin_list_all_semesters")
+    return render(request, "admin/semesters/rollover.html", {"form": form})
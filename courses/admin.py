@@ -7,3 +7,4 @@ admin.site.register(Unit)
 admin.site.register(CourseStudentStatus)
 
 
+admin.site.register(WaitlistEntry)
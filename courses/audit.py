@@ -0,0 +1,164 @@
+"""
+Degree audit: how many units a student still has to pass in each
+requirement category of their major.
+
+A major's MajorUnit rows are loaded once into a requirement matrix. Every
+unit of the major gets a bit, and every (category, unit size) pair is one
+integer bitset of the units it holds. A student's passed units are one
+bitset over the same bits, so the units left in a category are
+
+    sum(size * (mask & ~passed).bit_count() for size, mask in category)
+
+a few integer operations however many units the major has. A whole major
+is audited with one query for the passed units of all of its students,
+and students with the same passed units share one computation.
+
+Requirements are cached per catalog version, which MajorUnit and Unit
+changes bump (see courses.catalog). Audits are cached per student next to
+the registration state and dropped with it (see courses.state). The
+ranked report of a whole major is cached once per catalog version,
+state generation and registrations stamp, so it is recomputed after a
+registration changes rather than on every view; students added or moved
+between majors show up within COHORT_TIMEOUT.
+"""
+from django.core.cache import cache
+
+from .catalog import catalog_version
+from .models import CourseStudentStatus, MajorUnit
+from .state import STATE_TIMEOUT, audit_key, current_generation, registrations_stamp
+
+Category = MajorUnit.UnitMajorState
+REQUIREMENTS_TIMEOUT = 60 * 60
+COHORT_TIMEOUT = 5 * 60
+
+
+class Audit:
+    def __init__(self, required, remaining):
+        # Category value -> units
+        self.required = required
+        self.remaining = remaining
+
+    @property
+    def remaining_total(self):
+        return sum(self.remaining.values())
+
+    @property
+    def complete(self):
+        return self.remaining_total == 0
+
+    def remaining_by_category(self):
+        """Remaining units of every category, in Category order."""
+        return [self.remaining.get(category, 0) for category in Category.values]
+
+
+class Requirements:
+    """The requirement matrix of a major. Units without a category aren't requirements."""
+
+    def __init__(self, rows):
+        self.bits = {}
+        # category -> {unit size: bitset of the category's units of that size}
+        self.masks = {}
+        for unit_id, category, unit_size in rows:
+            if category is None:
+                continue
+            bit = self.bits.setdefault(unit_id, len(self.bits))
+            sizes = self.masks.setdefault(category, {})
+            sizes[unit_size] = sizes.get(unit_size, 0) | 1 << bit
+
+    def passed_mask(self, unit_ids):
+        mask = 0
+        for unit_id in unit_ids:
+            bit = self.bits.get(unit_id)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def audit(self, passed):
+        required, remaining = {}, {}
+        for category, sizes in self.masks.items():
+            required[category] = sum(size * mask.bit_count() for size, mask in sizes.items())
+            remaining[category] = sum(size * (mask & ~passed).bit_count() for size, mask in sizes.items())
+        return Audit(required, remaining)
+
+
+class Cohort:
+    """The audits of a major's students, ranked by remaining units, most first."""
+
+    def __init__(self, audits):
+        self.audits = audits
+        self.ranking = sorted(audits, key=lambda pk: (-audits[pk].remaining_total, pk))
+        size = len(audits) or 1
+        self.average_remaining = [
+            round(sum(audit.remaining.get(category, 0) for audit in audits.values()) / size, 1)
+            for category in Category.values
+        ]
+        self.complete_count = sum(audit.complete for audit in audits.values())
+
+
+def get_requirements(major_id, version=None):
+    if version is None:
+        version = catalog_version()
+    key = f'degree_audit:requirements:{version}:{major_id}'
+    requirements = cache.get(key)
+    if requirements is None:
+        requirements = Requirements(MajorUnit.objects.filter( # pyright: ignore
+            major_id=major_id
+        ).values_list('unit_id', 'state', 'unit__unit_size'))
+        cache.set(key, requirements, REQUIREMENTS_TIMEOUT)
+    return requirements
+
+
+def _passed():
+    return CourseStudentStatus.objects.filter(passed=True, canceled=False) # pyright: ignore
+
+
+def audit_student(student):
+    version = catalog_version()
+    key = audit_key(student.pk, current_generation())
+    cached = cache.get(key)
+    # The stamp catches requirement changes and a change of major.
+    stamp = (version, student.major_id)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    requirements = get_requirements(student.major_id, version)
+    audit = requirements.audit(requirements.passed_mask(
+        _passed().filter(student=student).values_list('course__unit_id', flat=True)
+    ))
+    cache.set(key, (stamp, audit), STATE_TIMEOUT)
+    return audit
+
+
+def audit_major(major_id, version=None):
+    """
+    {student pk: Audit} for every student of a major, from one query for
+    their passed units.
+    """
+    from users.models import Student
+
+    requirements = get_requirements(major_id, version)
+    passed = dict.fromkeys(Student.objects.filter(major_id=major_id).values_list('pk', flat=True), 0) # pyright: ignore
+    rows = _passed().filter(student__major_id=major_id).values_list('student_id', 'course__unit_id')
+    for student_id, unit_id in rows.iterator(chunk_size=5000):
+        bit = requirements.bits.get(unit_id)
+        if bit is not None and student_id in passed:
+            passed[student_id] |= 1 << bit
+
+    by_mask = {}
+    audits = {}
+    for student_id, mask in passed.items():
+        audit = by_mask.get(mask)
+        if audit is None:
+            audit = by_mask[mask] = requirements.audit(mask)
+        audits[student_id] = audit
+    return audits
+
+
+def major_cohort(major_id):
+    version = catalog_version()
+    key = f'degree_audit:cohort:{version}:{current_generation()}:{registrations_stamp()}:{major_id}'
+    cohort = cache.get(key)
+    if cohort is None:
+        cohort = Cohort(audit_major(major_id, version))
+        cache.set(key, cohort, COHORT_TIMEOUT)
+    return cohort
@@ -0,0 +1,113 @@
+"""
+Versioned snapshot of the active semester's course catalog.
+
+The catalog barely changes during registration, so it is built once per
+version and shared through Django's cache. Anything that changes what the
+snapshot contains (semesters, courses, their time slots, units and their
+prerequisites or majors) bumps the version from courses.signals.
+
+After a bump only one worker rebuilds the snapshot: the others keep
+serving the previous one until the new version is in the cache. Seat
+counts change all the time, so they are not part of the snapshot and are
+read fresh by the callers.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Course, MajorUnit, PrerequisiteClosure, format_prerequisites
+
+VERSION_KEY = 'catalog:version'
+LATEST_KEY = 'catalog:latest'
+SNAPSHOT_TIMEOUT = 60 * 60
+REBUILD_LOCK_TIMEOUT = 30
+COLD_START_WAIT = 5
+
+
+def _new_version():
+    return int(time.time() * 1000)
+
+
+def catalog_version():
+    return cache.get_or_set(VERSION_KEY, _new_version, None)
+
+
+def bump_catalog_version():
+    """Starts a new catalog version once the current transaction commits."""
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, _new_version(), None))
+
+
+def prerequisite_map(unit_ids):
+    """
+    Loads the direct prerequisites of the given units in one indexed
+    lookup of the closure table (see courses.prerequisites).
+    Returns {unit_id: [(prerequisite_id, prerequisite_name), ...]}.
+    """
+    edges = PrerequisiteClosure.objects.filter( # pyright: ignore
+        descendant_id__in=unit_ids, depth=1
+    ).values_list('descendant_id', 'ancestor_id', 'ancestor__name')
+
+    prereqs = {}
+    for unit_id, prereq_id, prereq_name in edges:
+        prereqs.setdefault(unit_id, []).append((prereq_id, prereq_name))
+    return prereqs
+
+
+def build_catalog():
+    """
+    Loads the active semester's courses with their unit, instructor and
+    time slots, and attaches `major_ids`, `prerequisites` (a list of
+    (unit_id, name) pairs) and `prerequisites_display` to each of them.
+    """
+    courses = list(Course.objects.filter( # pyright: ignore
+        semester__active=True
+    ).select_related(
+        'unit', 'instructor'
+    ).prefetch_related(
+        'time_slot'
+    ).order_by('unit__name', 'id'))
+
+    unit_ids = {course.unit_id for course in courses if course.unit_id}
+    majors = {}
+    for unit_id, major_id in MajorUnit.objects.filter(unit_id__in=unit_ids).values_list('unit_id', 'major_id'): # pyright: ignore
+        majors.setdefault(unit_id, set()).add(major_id)
+    prereqs = prerequisite_map(unit_ids)
+
+    for course in courses:
+        course.major_ids = majors.get(course.unit_id, set())
+        course.prerequisites = prereqs.get(course.unit_id, [])
+        course.prerequisites_display = format_prerequisites([name for _, name in course.prerequisites])
+    return courses
+
+
+def get_active_catalog():
+    version = catalog_version()
+    key = f'catalog:{version}'
+    courses = cache.get(key)
+    if courses is not None:
+        return courses
+
+    lock_key = f'catalog:lock:{version}'
+    if cache.add(lock_key, 1, REBUILD_LOCK_TIMEOUT):
+        try:
+            courses = build_catalog()
+            cache.set(key, courses, SNAPSHOT_TIMEOUT)
+            cache.set(LATEST_KEY, courses, SNAPSHOT_TIMEOUT)
+            return courses
+        finally:
+            cache.delete(lock_key)
+
+    # Someone else is rebuilding: serve the previous snapshot meanwhile.
+    courses = cache.get(LATEST_KEY)
+    if courses is not None:
+        return courses
+
+    # Cold start, there is nothing to fall back on yet.
+    deadline = time.monotonic() + COLD_START_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        courses = cache.get(key)
+        if courses is not None:
+            return courses
+    return build_catalog()
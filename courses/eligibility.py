@@ -0,0 +1,45 @@
+from .catalog import get_active_catalog
+from .models import Course
+from .state import get_registration_state
+
+
+def _seat_counts():
+    return Course.objects.filter( # pyright: ignore
+        semester__active=True
+    ).values_list('id', 'enrolled_count')
+
+
+def _filter_eligible(catalog, seats, major_id, state, excluded):
+    passed, selected = state.passed_unit_ids, state.selected_course_ids
+    occupied = state.occupied_mask()
+    courses = []
+    for course in catalog:
+        if course.id in excluded or major_id not in course.major_ids:
+            continue
+        # The student's own courses are shown; others only if they fit their week.
+        if course.id not in selected and course.occupancy & occupied:
+            continue
+        if all(prereq_id in passed for prereq_id, _ in course.prerequisites):
+            course.enrolled_count = seats.get(course.id, course.enrolled_count)
+            courses.append(course)
+    return courses
+
+
+def eligible_courses(student, exclude_taken=False):
+    """
+    Returns (courses, selected_course_ids) for the student's major in the
+    active semester, keeping only courses whose prerequisites are all passed
+    and, unless the student already selected them, that don't clash with
+    the student's week. With `exclude_taken`, selected courses are left out.
+
+    Courses come from the cached catalog snapshot with their time slots
+    and `prerequisites_display` attached, and fresh seat counts laid over
+    them, so templates don't hit the database.
+    """
+    state = get_registration_state(student)
+    catalog = get_active_catalog()
+    seats = dict(_seat_counts())
+
+    excluded = state.selected_course_ids if exclude_taken else set()
+    courses = _filter_eligible(catalog, seats, student.major_id, state, excluded)
+    return courses, state.selected_course_ids
@@ -0,0 +1,18 @@
+class RegistrationError(Exception):
+    """Base class for errors raised while registering a student in a course."""
+
+
+class CourseFull(RegistrationError):
+    pass
+
+
+class AlreadyRegistered(RegistrationError):
+    pass
+
+
+class AlreadyPassed(RegistrationError):
+    pass
+
+
+class ScheduleConflict(RegistrationError):
+    pass
@@ -0,0 +1,58 @@
+"""
+Paged gradebook formsets.
+
+The instructor and admin gradebooks used to build one form per enrolled
+student on every request. Here they only show one page of registrations,
+loaded with the students' names in the same query. A submit binds and
+validates exactly the rows that were posted, and rows the user did not
+touch are neither validated nor saved.
+"""
+from django.core.paginator import Paginator
+
+PAGE_SIZE = 50
+
+
+class ChangedRowsFormSetMixin:
+    """
+    Mixin for model formsets: every form may stay empty, so unchanged
+    forms skip validation (see Form.full_clean) and saving (see
+    BaseModelFormSet.save_existing_objects).
+    """
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index) # pyright: ignore
+        kwargs['empty_permitted'] = True
+        return kwargs
+
+
+def _posted_pks(data, prefix):
+    try:
+        total = int(data.get(f'{prefix}-TOTAL_FORMS', 0))
+    except ValueError:
+        return []
+    pks = []
+    for index in range(min(total, PAGE_SIZE)):
+        value = data.get(f'{prefix}-{index}-id', '')
+        if value.isdigit():
+            pks.append(int(value))
+    return pks
+
+
+def gradebook_page(request, queryset, prefix, per_page=PAGE_SIZE):
+    """
+    Returns (page, rows) for a CourseStudentStatus queryset: the requested
+    page and a queryset to build the formset from. On POST the rows are
+    the ones whose ids the formset posted, so a submit validates the
+    page that was shown even if registrations changed meanwhile.
+    """
+    queryset = queryset.select_related('student').order_by(
+        'student__last_name', 'student__first_name', 'pk'
+    )
+    page = Paginator(queryset, per_page).get_page(request.GET.get('page'))
+    if request.method == 'POST':
+        pks = _posted_pks(request.POST, prefix)
+    else:
+        # Inline formsets filter their queryset, which a sliced one can't be.
+        start = max(page.start_index() - 1, 0)
+        pks = list(queryset.values_list('pk', flat=True)[start:page.end_index()])
+    return page, queryset.filter(pk__in=pks)
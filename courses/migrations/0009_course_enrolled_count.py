@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+
+def populate_enrolled_count(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    CourseStudentStatus = apps.get_model('courses', 'CourseStudentStatus')
+    counts = {}
+    for course_id in CourseStudentStatus.objects.filter(canceled=False).values_list('course_id', flat=True):
+        counts[course_id] = counts.get(course_id, 0) + 1
+    for course_id, count in counts.items():
+        Course.objects.filter(pk=course_id).update(enrolled_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_merge_20250911_1113'),
+        ('users', '0002_alter_student_options_remove_student_enrollment_year_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='enrolled_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_enrolled_count, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='coursestudentstatus',
+            constraint=models.UniqueConstraint(fields=('student', 'course'), name='unique_student_course'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:38
+
+from django.db import migrations, models
+
+# Existing slots are free text only, so each gets its own bit past the
+# 7 * 48 half-hour cells of the week (see courses.timetable).
+WEEK_CELLS = 7 * 48
+
+
+def populate_occupancy_mask(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    for course in Course.objects.prefetch_related('time_slot'):
+        mask = 0
+        for slot in course.time_slot.all():
+            mask |= 1 << (WEEK_CELLS + slot.id)
+        if mask:
+            Course.objects.filter(pk=course.pk).update(occupancy_mask=format(mask, 'x'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_course_enrolled_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='occupancy_mask',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='timeslots',
+            name='day',
+            field=models.PositiveSmallIntegerField(blank=True, choices=[(0, 'Saturday'), (1, 'Sunday'), (2, 'Monday'), (3, 'Tuesday'), (4, 'Wednesday'), (5, 'Thursday'), (6, 'Friday')], null=True),
+        ),
+        migrations.AddField(
+            model_name='timeslots',
+            name='end_time',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='timeslots',
+            name='start_time',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='timeslots',
+            name='time',
+            field=models.CharField(blank=True, verbose_name=255),
+        ),
+        migrations.RunPython(populate_occupancy_mask, migrations.RunPython.noop),
+    ]
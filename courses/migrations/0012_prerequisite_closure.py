@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:11
+
+from collections import deque
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_closure(apps, schema_editor):
+    Unit = apps.get_model('courses', 'Unit')
+    PrerequisiteClosure = apps.get_model('courses', 'PrerequisiteClosure')
+    graph = {}
+    for unit_id, prerequisite_id in Unit.prerequisites.through.objects.values_list('from_unit_id', 'to_unit_id'):
+        graph.setdefault(unit_id, []).append(prerequisite_id)
+
+    rows = []
+    for unit_id in graph:
+        depths = {}
+        queue = deque([(unit_id, 0)])
+        while queue:
+            current, depth = queue.popleft()
+            for prerequisite_id in graph.get(current, ()):
+                if prerequisite_id != unit_id and prerequisite_id not in depths:
+                    depths[prerequisite_id] = depth + 1
+                    queue.append((prerequisite_id, depth + 1))
+        rows.extend(
+            PrerequisiteClosure(ancestor_id=ancestor_id, descendant_id=unit_id, depth=depth)
+            for ancestor_id, depth in depths.items()
+        )
+    PrerequisiteClosure.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_waitlistentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrerequisiteClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='courses.unit')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='courses.unit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='prereq_closure_descendant'), models.Index(fields=['ancestor', 'depth'], name='prereq_closure_ancestor')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_prerequisite_closure')],
+            },
+        ),
+        migrations.RunPython(populate_closure, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,14 @@
-from django.db import models
-from users.models import Instructor, Student
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import F
+from users.models import Instructor, Student, save_fields_without
+from .exceptions import CourseFull
+from . import seats, timetable
+
+def format_prerequisites(names):
+    if names:
+        return '، '.join(names)
+    return "بدون پیش نیاز"
 
 class Unit(models.Model):
     name = models.CharField(max_length=50)
@@ -22,12 +31,46 @@ class Unit(models.Model):
     def __str__(self): # pyright: ignore
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_unit_size = dict(zip(field_names, values)).get('unit_size')
+        return instance
+
+    def save(self, *args, **kwargs):
+        saves_size = self.unit_size_changed(kwargs.get('update_fields'))
+        super().save(*args, **kwargs)
+        if saves_size:
+            self._loaded_unit_size = self.unit_size
+
+    def unit_size_changed(self, update_fields=None):
+        """Whether the save being made changes the unit size as last loaded."""
+        if update_fields is not None and 'unit_size' not in update_fields:
+            return False
+        return getattr(self, '_loaded_unit_size', None) != self.unit_size
+
     def get_prerequisites_display(self):
-        prereq = self.prerequisites.all()  # pyright: ignore
-        if prereq:
-            return '، '.join([p.name for p in prereq]) 
-        else:
-            return "بدون پیش نیاز"
+        return format_prerequisites([p.name for p in self.prerequisites.all()])  # pyright: ignore
+
+class PrerequisiteClosure(models.Model):
+    """
+    Transitive closure of Unit.prerequisites: `ancestor` is required,
+    directly (depth 1) or through a chain of `depth` edges, before
+    `descendant`. Maintained by courses.prerequisites.
+    """
+    ancestor = models.ForeignKey(Unit, on_delete=models.CASCADE, related_name='+')
+    descendant = models.ForeignKey(Unit, on_delete=models.CASCADE, related_name='+')
+    # Length of the shortest chain from ancestor to descendant.
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_prerequisite_closure'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='prereq_closure_descendant'),
+            models.Index(fields=['ancestor', 'depth'], name='prereq_closure_ancestor'),
+        ]
 
 class Semester(models.Model):
     codename = models.PositiveSmallIntegerField(primary_key=True)
@@ -55,11 +98,42 @@ class MajorUnit(models.Model):
     state = models.PositiveSmallIntegerField(choices=UnitMajorState.choices, null=True) 
 
 class TimeSlots(models.Model):
+    class Weekday(models.IntegerChoices):
+        SATURDAY = 0, 'Saturday'
+        SUNDAY = 1, 'Sunday'
+        MONDAY = 2, 'Monday'
+        TUESDAY = 3, 'Tuesday'
+        WEDNESDAY = 4, 'Wednesday'
+        THURSDAY = 5, 'Thursday'
+        FRIDAY = 6, 'Friday'
+
     id = models.PositiveSmallIntegerField(primary_key=True)
-    time = models.CharField(255)
+    time = models.CharField(255, blank=True)
+    day = models.PositiveSmallIntegerField(choices=Weekday.choices, null=True, blank=True)
+    start_time = models.TimeField(null=True, blank=True)
+    end_time = models.TimeField(null=True, blank=True)
 
     def __str__(self):
-        return str(self.time)
+        if self.time or not self.is_structured:
+            return str(self.time)
+        return f"{self.get_day_display()} {self.start_time:%H:%M}-{self.end_time:%H:%M}" # pyright: ignore
+
+    @property
+    def is_structured(self):
+        return self.day is not None and self.start_time is not None and self.end_time is not None
+
+    @property
+    def mask(self):
+        return timetable.slot_mask(self.id, self.day, self.start_time, self.end_time)
+
+    def clean(self):
+        values = (self.day, self.start_time, self.end_time)
+        if any(v is not None for v in values) and not self.is_structured:
+            raise ValidationError("Day, start time and end time must be given together.")
+        if self.is_structured and self.start_time >= self.end_time: # pyright: ignore
+            raise ValidationError("The time slot must end after it starts.")
+        if not self.is_structured and not self.time:
+            raise ValidationError("Give either a day and times or a label.")
 
 class Course(models.Model):
     unit = models.ForeignKey(Unit, null=True, on_delete=models.SET_NULL) 
@@ -68,6 +142,66 @@ class Course(models.Model):
     slots = models.PositiveSmallIntegerField() 
     time_slot = models.ManyToManyField(TimeSlots)
     price = models.PositiveIntegerField()
+    # Number of non-canceled registrations, kept in step by CourseStudentStatus.
+    enrolled_count = models.PositiveIntegerField(default=0, editable=False) # pyright: ignore
+    # Hex encoded weekly occupancy bitmask, see courses.timetable.
+    occupancy_mask = models.TextField(default='', blank=True, editable=False)
+
+    # Only ever changed with atomic updates, see reserve_seat and refresh_occupancy.
+    MAINTAINED_FIELDS = ('enrolled_count', 'occupancy_mask')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_unit_id = dict(zip(field_names, values)).get('unit_id')
+        return instance
+
+    def unit_changed(self, update_fields=None):
+        """Whether the save being made moves the course to another unit than last loaded."""
+        if update_fields is not None and 'unit' not in update_fields and 'unit_id' not in update_fields:
+            return False
+        return getattr(self, '_loaded_unit_id', None) != self.unit_id
+
+    @property
+    def occupancy(self):
+        return timetable.decode(self.occupancy_mask)
+
+    def refresh_occupancy(self):
+        self.occupancy_mask = timetable.encode(timetable.combine(slot.mask for slot in self.time_slot.all())) # pyright: ignore
+        Course.objects.filter(pk=self.pk).update(occupancy_mask=self.occupancy_mask) # pyright: ignore
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            old_slots = None
+            if not self._state.adding:
+                old_slots = Course.objects.filter(pk=self.pk).values_list('slots', flat=True).first() # pyright: ignore
+                kwargs['update_fields'] = save_fields_without(self, self.MAINTAINED_FIELDS, kwargs.get('update_fields'))
+            saves_unit = self.unit_changed(kwargs.get('update_fields'))
+            super().save(*args, **kwargs)
+            if saves_unit:
+                self._loaded_unit_id = self.unit_id
+            if old_slots is not None and self.slots > old_slots:
+                from .registration import promote_waitlist
+                promote_waitlist(self)
+
+    @staticmethod
+    def reserve_seat(course_id):
+        """Takes one seat if any is left. Returns False when the course is full."""
+        reserved = Course.objects.filter( # pyright: ignore
+            pk=course_id,
+            enrolled_count__lt=F('slots')
+        ).update(enrolled_count=F('enrolled_count') + 1) == 1
+        if reserved:
+            seats.seats_changed([course_id])
+        return reserved
+
+    @staticmethod
+    def release_seat(course_id):
+        Course.objects.filter( # pyright: ignore
+            pk=course_id,
+            enrolled_count__gt=0
+        ).update(enrolled_count=F('enrolled_count') - 1)
+        seats.seats_changed([course_id])
 
 class CourseStudentStatus(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
@@ -78,6 +212,23 @@ class CourseStudentStatus(models.Model):
     canceled = models.BooleanField(default=False) # pyright: ignore
     registered_at = models.DateTimeField(null=True, blank=True, verbose_name="تاریخ ثبت‌نام")
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'course'], name='unique_student_course'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def _held_seat(self):
+        """Whether the row, as last loaded from the database, holds a seat."""
+        if self._state.adding:
+            return False
+        return not getattr(self, '_loaded_values', {}).get('canceled', False)
+
     def save(self, *args, **kwargs):
         if self.grade is not None:
             if self.grade > 20:
@@ -86,9 +237,55 @@ class CourseStudentStatus(models.Model):
                 self.passed = True 
             else:
                 self.passed=False
-        super().save(*args, **kwargs)
 
-        self.student.calculate_gpa()  # pyright: ignore
+        held_seat = self._held_seat()
+        loaded = getattr(self, '_loaded_values', {}) if not self._state.adding else {}
+        with transaction.atomic():
+            if not held_seat and not self.canceled:
+                if not Course.reserve_seat(self.course_id): # pyright: ignore
+                    raise CourseFull("Course is full.")
+            elif held_seat and self.canceled:
+                Course.release_seat(self.course_id) # pyright: ignore
+            super().save(*args, **kwargs)
+            if held_seat and self.canceled:
+                from .registration import promote_waitlist
+                promote_waitlist(self.course)
+            self._apply_gpa_change(loaded, self._values())
+        self._loaded_values = self._values()
+
+    def _values(self):
+        return {f.attname: getattr(self, f.attname) for f in self._meta.concrete_fields}
+
+    def _apply_gpa_change(self, before, after):
+        """Moves the student's GPA totals by the difference between two versions of the row."""
+        from users.gpa import apply_gpa_delta, counted_grade
+
+        old = counted_grade(before.get('grade'), before.get('passed'), before.get('canceled'))
+        new = counted_grade(after.get('grade'), after.get('passed'), after.get('canceled'))
+        if old == new:
+            return
+
+        unit_size = Unit.objects.filter(course=self.course_id).values_list('unit_size', flat=True).first() # pyright: ignore
+        if not unit_size:
+            return
+        points = ((new or 0) - (old or 0)) * unit_size
+        units = ((new is not None) - (old is not None)) * unit_size
+        apply_gpa_delta(self.student_id, points, units) # pyright: ignore
+
+class WaitlistEntry(models.Model):
+    """A student waiting for a seat in a full course, served first come first served."""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='waitlist')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'course'], name='unique_waitlist_student_course'),
+        ]
+
+    def __str__(self):
+        return f"{self.student} waiting for {self.course_id}" # pyright: ignore
 
 class CourseAttachment(models.Model):
 
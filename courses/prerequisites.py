@@ -0,0 +1,107 @@
+"""
+Prerequisite closure table.
+
+Unit.prerequisites only stores direct edges (from_unit requires
+to_unit). PrerequisiteClosure holds every (ancestor, descendant) pair
+of the graph with the length of the shortest chain between them, so
+"what does this unit require", "what does it unlock" and cycle checks
+are single indexed lookups instead of recursive walks.
+
+The table is kept in step from courses.signals whenever prerequisite
+edges change or a unit is deleted. Only the rows of the units whose
+chains changed (the edited units and everything that requires them) are
+recomputed. Bulk writes to the edge table bypass the signals; call
+refresh_closure() or rebuild_closure() after them.
+"""
+from collections import deque
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import PrerequisiteClosure, Unit
+
+Edge = Unit.prerequisites.through
+
+
+def _prerequisite_graph():
+    graph = {}
+    for unit_id, prerequisite_id in Edge.objects.values_list('from_unit_id', 'to_unit_id'): # pyright: ignore
+        graph.setdefault(unit_id, []).append(prerequisite_id)
+    return graph
+
+
+def _ancestors(graph, unit_id):
+    """{ancestor_id: depth} of a unit, breadth first so depths are the shortest."""
+    depths = {}
+    queue = deque([(unit_id, 0)])
+    while queue:
+        current, depth = queue.popleft()
+        for prerequisite_id in graph.get(current, ()):
+            if prerequisite_id != unit_id and prerequisite_id not in depths:
+                depths[prerequisite_id] = depth + 1
+                queue.append((prerequisite_id, depth + 1))
+    return depths
+
+
+def descendant_ids(unit_ids):
+    """Ids of the units that require any of the given units, directly or not."""
+    return set(PrerequisiteClosure.objects.filter( # pyright: ignore
+        ancestor_id__in=unit_ids
+    ).values_list('descendant_id', flat=True))
+
+
+def refresh_closure(unit_ids):
+    """Recomputes the closure rows of the given units and of every unit that requires them."""
+    unit_ids = set(unit_ids)
+    if not unit_ids:
+        return
+    # Editing a unit's prerequisites doesn't change who requires it, so
+    # the current table still knows every unit whose chains changed.
+    affected = unit_ids | descendant_ids(unit_ids)
+    graph = _prerequisite_graph()
+    with transaction.atomic():
+        PrerequisiteClosure.objects.filter(descendant_id__in=affected).delete() # pyright: ignore
+        PrerequisiteClosure.objects.bulk_create([ # pyright: ignore
+            PrerequisiteClosure(ancestor_id=ancestor_id, descendant_id=unit_id, depth=depth)
+            for unit_id in affected
+            for ancestor_id, depth in _ancestors(graph, unit_id).items()
+        ], batch_size=500)
+
+
+def rebuild_closure():
+    graph = _prerequisite_graph()
+    with transaction.atomic():
+        PrerequisiteClosure.objects.all().delete() # pyright: ignore
+        PrerequisiteClosure.objects.bulk_create([ # pyright: ignore
+            PrerequisiteClosure(ancestor_id=ancestor_id, descendant_id=unit_id, depth=depth)
+            for unit_id in graph
+            for ancestor_id, depth in _ancestors(graph, unit_id).items()
+        ], batch_size=500)
+
+
+def check_new_edges(unit_ids, prerequisite_ids):
+    """
+    Raises ValidationError if making each of `unit_ids` require each of
+    `prerequisite_ids` would close a cycle, i.e. if one of the new
+    prerequisites already requires (or is) one of the units.
+    """
+    unit_ids, prerequisite_ids = set(unit_ids), set(prerequisite_ids)
+    offending = unit_ids & prerequisite_ids
+    offending |= set(PrerequisiteClosure.objects.filter( # pyright: ignore
+        ancestor_id__in=unit_ids, descendant_id__in=prerequisite_ids
+    ).values_list('descendant_id', flat=True))
+    if offending:
+        names = Unit.objects.filter(pk__in=offending).order_by('name').values_list('name', flat=True) # pyright: ignore
+        raise ValidationError(
+            "این پیش‌نیازها یک چرخه ایجاد می‌کنند: %(names)s",
+            code='prerequisite_cycle',
+            params={'names': '، '.join(names)},
+        )
+
+
+def unlocked_units(unit_ids, direct=False):
+    """Units that require any of the given units; with direct=True only those requiring them directly."""
+    closure = PrerequisiteClosure.objects.filter(ancestor_id__in=unit_ids) # pyright: ignore
+    if direct:
+        closure = closure.filter(depth=1)
+    return Unit.objects.filter(pk__in=closure.values('descendant_id')) # pyright: ignore
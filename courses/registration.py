@@ -0,0 +1,219 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .catalog import prerequisite_map
+from .exceptions import AlreadyPassed, AlreadyRegistered, CourseFull, ScheduleConflict
+from .seats import seats_changed
+from .models import Course, CourseStudentStatus, WaitlistEntry
+from .state import invalidate_registration_state, load_registration_state
+from . import timetable
+from .timetable import occupied_mask
+
+
+def register_student(student, course):
+    """
+    Registers the student in the course. The seat is taken with a conditional
+    increment of Course.enrolled_count, so concurrent registrations can never
+    oversell the course; duplicates are rejected by the unique constraint.
+
+    Raises CourseFull or AlreadyRegistered.
+    """
+    try:
+        with transaction.atomic():
+            status = CourseStudentStatus.objects.create( # pyright: ignore
+                student=student,
+                course=course,
+                paid=False,
+                canceled=False
+            )
+            WaitlistEntry.objects.filter(student=student, course=course).delete() # pyright: ignore
+            return status
+    except IntegrityError:
+        raise AlreadyRegistered("You are already registered in this course.")
+    except CourseFull:
+        # A full course is checked before the unique constraint; report
+        # the duplicate instead when that is what really happened.
+        if CourseStudentStatus.objects.filter(student=student, course=course).exists(): # pyright: ignore
+            raise AlreadyRegistered("You are already registered in this course.")
+        raise
+
+
+def register_checked(student, course):
+    """
+    Registers the student after checking that they haven't passed the
+    unit and that the course doesn't clash with their week. The checks
+    read the database inside the registering transaction, not the cached
+    state, which another worker may have changed.
+
+    Raises AlreadyPassed, ScheduleConflict, CourseFull or AlreadyRegistered.
+    """
+    with transaction.atomic():
+        state = load_registration_state(student)
+        if course.unit_id in state.passed_unit_ids:
+            raise AlreadyPassed("You have already passed this course.")
+        if course.occupancy & state.occupied_mask(exclude_course_id=course.pk):
+            raise ScheduleConflict("Schedule conflict with another course.")
+        return register_student(student, course)
+
+
+def register_courses(student, course_ids):
+    """
+    Registers the student in several courses at once. Every course is
+    validated up front with a fixed number of queries (duplicates, passed
+    units, prerequisites, time clashes and capacity), and the registrations
+    are written in one transaction: either all of them succeed or none.
+
+    Returns (registered, results) where results maps each course id to an
+    error message, or None for courses that were (or could have been)
+    registered.
+    """
+    course_ids = list(dict.fromkeys(course_ids))
+    courses = Course.objects.filter( # pyright: ignore
+        pk__in=course_ids,
+        semester__active=True
+    ).select_related('unit').in_bulk()
+    prereqs = prerequisite_map({course.unit_id for course in courses.values()})
+
+    try:
+        with transaction.atomic():
+            # Checked against the database in the writing transaction, see
+            # courses.state.
+            state = load_registration_state(student)
+            already_registered = state.selected_course_ids
+            passed = state.passed_unit_ids
+            occupied = state.occupied_mask()
+
+            results = {}
+            for course_id in course_ids:
+                course = courses.get(course_id)
+                if course is None:
+                    results[course_id] = "Course not found."
+                elif course_id in already_registered:
+                    results[course_id] = "You are already registered in this course."
+                elif course.unit_id in passed:
+                    results[course_id] = "You have already passed this course."
+                elif any(prereq_id not in passed for prereq_id, _ in prereqs.get(course.unit_id, [])):
+                    results[course_id] = "Prerequisites are not passed."
+                elif course.occupancy & occupied:
+                    results[course_id] = "Schedule conflict with another course."
+                else:
+                    results[course_id] = None
+                    occupied |= course.occupancy
+
+            if any(results.values()):
+                return False, results
+
+            seats = Course.objects.select_for_update().filter( # pyright: ignore
+                pk__in=course_ids
+            ).values_list('pk', 'enrolled_count', 'slots')
+            full = [pk for pk, enrolled, slots in seats if enrolled >= slots]
+            if full:
+                for course_id in full:
+                    results[course_id] = "Course is full."
+                return False, results
+
+            Course.objects.filter(pk__in=course_ids).update(enrolled_count=F('enrolled_count') + 1) # pyright: ignore
+            seats_changed(course_ids)
+            CourseStudentStatus.objects.bulk_create([ # pyright: ignore
+                CourseStudentStatus(student=student, course_id=course_id, paid=False, canceled=False)
+                for course_id in course_ids
+            ])
+            WaitlistEntry.objects.filter(student=student, course_id__in=course_ids).delete() # pyright: ignore
+            invalidate_registration_state(student.pk)
+    except IntegrityError:
+        raise AlreadyRegistered("You are already registered in one of these courses.")
+
+    return True, results
+
+
+def pay_outstanding(student):
+    """
+    Pays all of the student's unpaid registrations in the active semester
+    in one transaction. The unpaid courses are checked for time clashes
+    against the paid ones (and each other) in a single pass and the rows
+    are marked paid with one bulk update: either all of them are paid or
+    none.
+
+    Returns (paid, results) where results maps each unpaid
+    CourseStudentStatus to an error message, or None.
+    """
+    with transaction.atomic():
+        statuses = list(CourseStudentStatus.objects.filter( # pyright: ignore
+            student=student,
+            paid=False,
+            canceled=False,
+            course__semester__active=True
+        ).select_related('course__unit').order_by('id'))
+        occupied = occupied_mask(student, paid_only=True)
+
+        results = {}
+        for status in statuses:
+            if status.course.occupancy & occupied:
+                results[status] = "Schedule conflict with another course."
+            else:
+                results[status] = None
+                occupied |= status.course.occupancy
+
+        if not statuses or any(results.values()):
+            return False, results
+
+        now = timezone.now()
+        for status in statuses:
+            status.paid = True
+            status.registered_at = now
+        CourseStudentStatus.objects.bulk_update(statuses, ['paid', 'registered_at']) # pyright: ignore
+        # bulk_update sends no post_save.
+        invalidate_registration_state(student.pk)
+
+    return True, results
+
+
+def join_waitlist(student, course):
+    """Puts the student at the end of the course's waitlist and returns their position."""
+    entry, _ = WaitlistEntry.objects.get_or_create(student=student, course=course) # pyright: ignore
+    return WaitlistEntry.objects.filter(course=course, id__lte=entry.id).count() # pyright: ignore
+
+
+def waitlist_positions(student):
+    """The student's waitlist entries, each annotated with its 1-based `position`."""
+    ahead = WaitlistEntry.objects.filter( # pyright: ignore
+        course=OuterRef('course'),
+        id__lt=OuterRef('id')
+    ).values('course').annotate(count=Count('id')).values('count')
+
+    return WaitlistEntry.objects.filter( # pyright: ignore
+        student=student
+    ).select_related('course__unit').annotate(
+        position=Coalesce(Subquery(ahead), Value(0)) + 1
+    )
+
+
+def promote_waitlist(course):
+    """
+    Fills free seats of the course from its waitlist, in order, skipping
+    students who meanwhile got a schedule conflict. Runs in the caller's
+    transaction, so the seat that was freed and the promotion commit together.
+    """
+    with transaction.atomic():
+        entries = list(WaitlistEntry.objects.filter(course=course).select_related('student')) # pyright: ignore
+        if not entries:
+            return
+        # The weeks of every waiting student, read in one query.
+        occupied = {}
+        for student_id, mask in CourseStudentStatus.objects.filter( # pyright: ignore
+            student_id__in=[entry.student_id for entry in entries],
+            course__semester__active=True,
+            canceled=False
+        ).values_list('student_id', 'course__occupancy_mask'):
+            occupied[student_id] = occupied.get(student_id, 0) | timetable.decode(mask)
+
+        for entry in entries:
+            if course.occupancy & occupied.get(entry.student_id, 0):
+                continue
+            try:
+                register_student(entry.student, course)
+            except CourseFull:
+                break
+            except AlreadyRegistered:
+                entry.delete()
@@ -0,0 +1,108 @@
+"""
+Semester rollover: copying a semester's course offerings into another.
+
+The source offerings are read with one query and their time slots with
+another, and the copies are written with one batched insert for the
+courses and one for their time slot rows, all in a single transaction
+(IMMEDIATE on SQLite, see settings), so two rollovers can't both copy. bulk_create
+doesn't send the save and m2m signals, so their work is done here: each
+copy takes its occupancy mask along with its time slots, starts with no
+registrations, and the catalog version is bumped.
+
+A source offering is skipped when the target semester already has a
+course of the same unit with the instructor the copy would get, one
+target course per source offering, so an interrupted or partial rollover
+can simply be run again and units with several sections keep all of
+them. Copies of units that the target already offered under another
+instructor are made, and counted separately for the admin to review.
+"""
+import re
+from collections import Counter
+
+from django.db import transaction
+
+from .catalog import bump_catalog_version
+from .models import Course
+
+TimeSlotLink = Course.time_slot.through
+ADJUSTMENT = re.compile(r'^(?P<op>[-+=]?)(?P<amount>\d+)(?P<percent>%?)$')
+
+
+def parse_adjustment(rule):
+    """
+    Turns a rule into a function of the old value. '' keeps it, '+5' and
+    '-5' add to it, '+10%' and '-10%' scale it (rounded), '=40' or '40'
+    replaces it. Results never go below zero. Raises ValueError for
+    anything else.
+    """
+    rule = (rule or '').replace(' ', '')
+    if not rule:
+        return lambda value: value
+    match = ADJUSTMENT.match(rule)
+    if match is None or (match['percent'] and match['op'] in ('', '=')):
+        raise ValueError(f"'{rule}' is not a valid adjustment.")
+
+    amount = int(match['amount'])
+    if match['op'] == '-':
+        amount = -amount
+    if match['percent']:
+        return lambda value: max((value * (100 + amount) + 50) // 100, 0)
+    if match['op'] in ('', '='):
+        return lambda value: amount
+    return lambda value: max(value + amount, 0)
+
+
+class RolloverResult:
+    def __init__(self, courses, skipped, also_offered):
+        self.courses = courses
+        # Source offerings the target semester already has a copy of.
+        self.skipped = skipped
+        # Copies of units the target semester offered under another instructor.
+        self.also_offered = also_offered
+
+
+def roll_over(source, target, unit_ids=None, carry_instructors=True, slots_rule='', price_rule=''):
+    """
+    Copies the offerings of `source` (only those of `unit_ids` if given)
+    into `target`, adjusting their slots and price by the given rules
+    (see parse_adjustment). Returns a RolloverResult.
+    """
+    if source.pk == target.pk:
+        raise ValueError("The source and target semesters must differ.")
+    adjust_slots, adjust_price = parse_adjustment(slots_rule), parse_adjustment(price_rule)
+
+    with transaction.atomic():
+        offerings = Course.objects.filter(semester=source).exclude(unit=None) # pyright: ignore
+        if unit_ids is not None:
+            offerings = offerings.filter(unit_id__in=unit_ids)
+        existing = Counter(Course.objects.filter(semester=target).values_list('unit_id', 'instructor_id')) # pyright: ignore
+        offered_units = {unit_id for unit_id, _ in existing}
+
+        sources, copies, skipped, also_offered = [], [], 0, 0
+        for pk, unit_id, instructor_id, slots, price, mask in offerings.order_by('pk').values_list(
+            'pk', 'unit_id', 'instructor_id', 'slots', 'price', 'occupancy_mask'
+        ):
+            if not carry_instructors:
+                instructor_id = None
+            if existing[unit_id, instructor_id]:
+                existing[unit_id, instructor_id] -= 1
+                skipped += 1
+                continue
+            also_offered += unit_id in offered_units
+            sources.append(pk)
+            copies.append(Course(
+                unit_id=unit_id, instructor_id=instructor_id, semester=target,
+                slots=adjust_slots(slots), price=adjust_price(price), occupancy_mask=mask,
+            ))
+        if not copies:
+            return RolloverResult([], skipped, also_offered)
+
+        slot_rows = TimeSlotLink.objects.filter(course__in=offerings).values_list('course_id', 'timeslots_id') # pyright: ignore
+        copies = Course.objects.bulk_create(copies, batch_size=500) # pyright: ignore
+        copy_of = {source_pk: copy.pk for source_pk, copy in zip(sources, copies)}
+        TimeSlotLink.objects.bulk_create([ # pyright: ignore
+            TimeSlotLink(course_id=copy_of[course_id], timeslots_id=slot_id)
+            for course_id, slot_id in slot_rows if course_id in copy_of
+        ], batch_size=500)
+        bump_catalog_version()
+    return RolloverResult(copies, skipped, also_offered)
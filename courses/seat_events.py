@@ -0,0 +1,115 @@
+"""
+In-process publisher of live seat counts.
+
+Registration code paths report which courses changed (courses.seats).
+The publisher coalesces those reports for a short moment, reads the new
+counts of all changed courses with a single query and fans the result out
+to every subscriber's queue. However many clients are connected to the
+SSE stream or long-poll endpoint, a change costs one query.
+
+Subscribers are asyncio queues owned by the event loop that serves the
+connection (the ASGI loop); reports may come from any thread.
+"""
+import asyncio
+import collections
+import threading
+
+from django.db import close_old_connections, connection
+
+COALESCE_SECONDS = 0.25
+HISTORY_SIZE = 256
+
+
+class SeatEvent:
+    def __init__(self, seq, seats):
+        self.seq = seq
+        # course_id -> remaining seats
+        self.seats = seats
+
+
+class SeatPublisher:
+    def __init__(self, coalesce_seconds=COALESCE_SECONDS):
+        self.coalesce_seconds = coalesce_seconds
+        self.seq = 0
+        self.history = collections.deque(maxlen=HISTORY_SIZE)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._timer = None
+        self._subscribers = {}
+
+    # -- producers ---------------------------------------------------------
+
+    def seats_changed(self, course_ids):
+        """Records changed courses; a flush follows after the coalescing delay."""
+        with self._lock:
+            self._pending.update(course_ids)
+            if self._timer is None and self.coalesce_seconds:
+                self._timer = threading.Timer(self.coalesce_seconds, self._flush_in_thread)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_in_thread(self):
+        close_old_connections()
+        try:
+            self.flush()
+        finally:
+            connection.close()
+
+    def flush(self):
+        """Reads the pending courses once and publishes the result to every subscriber."""
+        with self._lock:
+            course_ids, self._pending = self._pending, set()
+            self._timer = None
+        if not course_ids:
+            return None
+
+        from .models import Course
+        seats = {
+            pk: max(slots - enrolled, 0)
+            for pk, slots, enrolled in Course.objects.filter( # pyright: ignore
+                pk__in=course_ids
+            ).values_list('id', 'slots', 'enrolled_count')
+        }
+        with self._lock:
+            self.seq += 1
+            event = SeatEvent(self.seq, seats)
+            self.history.append(event)
+            subscribers = list(self._subscribers.items())
+
+        for queue, loop in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+        return event
+
+    # -- consumers ---------------------------------------------------------
+
+    def subscribe(self, loop=None):
+        queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers[queue] = loop or asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def events_since(self, seq):
+        """
+        Events after `seq` still in the history, or None when the client
+        has to reload the full counts: it is too far behind, or ahead of
+        this publisher because it was counting with another process or
+        with this one before a restart.
+        """
+        with self._lock:
+            if seq > self.seq:
+                return None
+            events = [event for event in self.history if event.seq > seq]
+            if seq < self.seq and (not events or events[0].seq != seq + 1):
+                return None
+            return events
+
+
+publisher = SeatPublisher()
@@ -0,0 +1,35 @@
+"""
+Change tracking for seat counts.
+
+Every change to Course.enrolled_count is reported here. Once the
+transaction commits the version is bumped, so pollers can be answered
+from the cache alone while nothing has changed (see
+student.views.seat_availability), and the live publisher pushes the
+new counts to the stream subscribers (see courses.seat_events).
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .seat_events import publisher
+
+VERSION_KEY = 'seats:version'
+
+
+def _new_version():
+    return int(time.time() * 1000)
+
+
+def seats_version():
+    return cache.get_or_set(VERSION_KEY, _new_version, None)
+
+
+def seats_changed(course_ids):
+    course_ids = list(course_ids)
+
+    def publish():
+        cache.set(VERSION_KEY, _new_version(), None)
+        publisher.seats_changed(course_ids)
+
+    transaction.on_commit(publish)
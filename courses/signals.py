@@ -0,0 +1,166 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from users.gpa import recalculate_gpas
+from users.models import Instructor
+from .catalog import bump_catalog_version
+from .prerequisites import check_new_edges, descendant_ids, refresh_closure
+from .models import Course, CourseStudentStatus, MajorUnit, Semester, TimeSlots, Unit
+from .registration import promote_waitlist
+from .state import invalidate_all_registration_states, invalidate_registration_state
+
+
+@receiver(post_delete, sender=CourseStudentStatus)
+def release_seat_on_delete(sender, instance, origin=None, **kwargs):
+    invalidate_registration_state(instance.student_id)
+    if instance._held_seat():
+        Course.release_seat(instance.course_id)
+        # Nothing to promote into a course that is itself being deleted.
+        if isinstance(origin, Course) or getattr(origin, 'model', None) is Course:
+            return
+        course = Course.objects.filter(pk=instance.course_id).first() # pyright: ignore
+        if course is not None:
+            promote_waitlist(course)
+
+
+@receiver(post_delete, sender=CourseStudentStatus)
+def remove_grade_on_delete(sender, instance, **kwargs):
+    instance._apply_gpa_change(getattr(instance, '_loaded_values', None) or instance._values(), {})
+
+
+@receiver(post_save, sender=Unit)
+def unit_saved(sender, instance, created, update_fields=None, **kwargs):
+    # The unit size weighs every grade of the unit.
+    if not created and instance.unit_size_changed(update_fields):
+        recalculate_gpas(CourseStudentStatus.objects.filter( # pyright: ignore
+            course__unit=instance
+        ).values('student_id'))
+
+
+@receiver(m2m_changed, sender=Unit.prerequisites.through)
+def prerequisites_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Forward: instance's prerequisites are pk_set. Reverse: instance
+    # becomes (or stops being) a prerequisite of the units in pk_set.
+    if action == 'pre_add':
+        if reverse:
+            check_new_edges(pk_set, [instance.pk])
+        else:
+            check_new_edges([instance.pk], pk_set)
+    elif action == 'pre_clear' and reverse:
+        instance._required_by_ids = list(Unit.prerequisites.through.objects.filter( # pyright: ignore
+            to_unit=instance
+        ).values_list('from_unit_id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            refresh_closure([instance.pk])
+        elif action == 'post_clear':
+            refresh_closure(instance._required_by_ids)
+        else:
+            refresh_closure(pk_set)
+
+
+def graded_student_ids(**filters):
+    return list(CourseStudentStatus.objects.filter( # pyright: ignore
+        grade__isnull=False, **filters
+    ).values_list('student_id', flat=True).distinct())
+
+
+@receiver(pre_delete, sender=Unit)
+def unit_deleting(sender, instance, **kwargs):
+    instance._descendant_ids = descendant_ids([instance.pk])
+    instance._graded_student_ids = graded_student_ids(course__unit=instance)
+
+
+@receiver(post_delete, sender=Unit)
+def unit_deleted(sender, instance, **kwargs):
+    # The unit's edges are gone; chains that ran through it are broken.
+    refresh_closure(instance._descendant_ids)
+    # Its courses are left without a unit, so their grades stop counting.
+    if instance._graded_student_ids:
+        recalculate_gpas(instance._graded_student_ids)
+
+
+@receiver(post_save, sender=CourseStudentStatus)
+def registration_saved(sender, instance, **kwargs):
+    invalidate_registration_state(instance.student_id)
+
+
+@receiver(post_save, sender=Semester)
+def semester_saved(sender, instance, **kwargs):
+    invalidate_all_registration_states()
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, created, update_fields=None, **kwargs):
+    if not created:
+        invalidate_enrolled_students([instance.pk])
+        # The grades are now weighed by the other unit's size.
+        if instance.unit_changed(update_fields):
+            student_ids = graded_student_ids(course=instance)
+            if student_ids:
+                recalculate_gpas(student_ids)
+
+
+def invalidate_enrolled_students(course_ids):
+    invalidate_registration_state(*CourseStudentStatus.objects.filter( # pyright: ignore
+        course_id__in=course_ids
+    ).values_list('student_id', flat=True).distinct())
+
+
+def refresh_occupancy(course_ids):
+    for course in Course.objects.filter(pk__in=course_ids).prefetch_related('time_slot'): # pyright: ignore
+        course.refresh_occupancy()
+    invalidate_enrolled_students(course_ids)
+
+
+@receiver(m2m_changed, sender=Course.time_slot.through)
+def time_slots_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            instance.refresh_occupancy()
+            invalidate_enrolled_students([instance.pk])
+    elif action == 'pre_clear':
+        instance._cleared_course_ids = list(instance.course_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        refresh_occupancy(instance._cleared_course_ids)
+    elif action in ('post_add', 'post_remove'):
+        refresh_occupancy(pk_set)
+
+
+@receiver(post_save, sender=TimeSlots)
+def time_slot_saved(sender, instance, created, **kwargs):
+    if not created:
+        refresh_occupancy(instance.course_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=TimeSlots)
+def time_slot_deleting(sender, instance, **kwargs):
+    instance._deleted_course_ids = list(instance.course_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=TimeSlots)
+def time_slot_deleted(sender, instance, **kwargs):
+    refresh_occupancy(instance._deleted_course_ids)
+
+
+def catalog_changed(sender, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        bump_catalog_version()
+
+
+# The catalog only shows an instructor's name.
+CATALOG_INSTRUCTOR_FIELDS = {'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Instructor)
+def instructor_saved(sender, update_fields=None, **kwargs):
+    # Logins save last_login alone, which must not throw the snapshot away.
+    if update_fields is None or CATALOG_INSTRUCTOR_FIELDS & set(update_fields):
+        bump_catalog_version()
+
+
+for model in (Semester, Course, Unit, MajorUnit, TimeSlots):
+    post_save.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_saved_{model.__name__}')
+for model in (Semester, Course, Unit, MajorUnit, TimeSlots, Instructor):
+    post_delete.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_deleted_{model.__name__}')
+for through in (Course.time_slot.through, Unit.prerequisites.through, MajorUnit):
+    m2m_changed.connect(catalog_changed, sender=through, dispatch_uid=f'catalog_m2m_{through.__name__}')
@@ -0,0 +1,117 @@
+"""
+Per-student registration state kept in Django's cache.
+
+The student views keep asking the same questions: which units has the
+student passed, which courses did they select, what does their week in
+the active semester look like. RegistrationState answers all of them
+from a single query and is cached until one of the student's
+CourseStudentStatus rows changes (see courses.signals) or the active
+semester changes.
+
+The cache may be local to each process, so another worker's invalidation
+can miss it: the cached state is only good for showing pages. Decisions
+that write (registering, paying) use load_registration_state() inside
+their transaction instead, which always reads the database. The
+student's degree audit (courses.audit) is built from the same rows and
+is cached and dropped alongside it; every invalidation also moves
+registrations_stamp(), which the per-major audit reports are cached by.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import timetable
+from .models import CourseStudentStatus
+
+STATE_TIMEOUT = 15 * 60
+GENERATION_KEY = 'registration_state:generation'
+CHANGED_KEY = 'registration_state:changed'
+
+
+class RegistrationState:
+    def __init__(self, rows):
+        self.passed_unit_ids = set()
+        self.selected_course_ids = set()
+        # course_id -> (occupancy mask, paid) for non-canceled active-semester courses
+        self.active_courses = {}
+
+        for course_id, unit_id, passed, canceled, paid, active, mask in rows:
+            self.selected_course_ids.add(course_id)
+            if passed and unit_id is not None:
+                self.passed_unit_ids.add(unit_id)
+            if active and not canceled:
+                self.active_courses[course_id] = (timetable.decode(mask), paid)
+
+    def occupied_mask(self, exclude_course_id=None, paid_only=False):
+        return timetable.combine(
+            mask for course_id, (mask, paid) in self.active_courses.items()
+            if course_id != exclude_course_id and (paid or not paid_only)
+        )
+
+
+def _rows(student):
+    return CourseStudentStatus.objects.filter( # pyright: ignore
+        student=student
+    ).values_list(
+        'course_id', 'course__unit_id', 'passed', 'canceled', 'paid',
+        'course__semester__active', 'course__occupancy_mask'
+    )
+
+
+def _key(student_id, generation):
+    return f'registration_state:{generation}:{student_id}'
+
+
+def audit_key(student_id, generation):
+    return f'degree_audit:{generation}:{student_id}'
+
+
+def _new_generation():
+    # Never reuse an old generation if the counter was evicted from the cache.
+    return int(time.time() * 1000)
+
+
+def current_generation():
+    return cache.get_or_set(GENERATION_KEY, _new_generation, None)
+
+
+def registrations_stamp():
+    """Changes whenever any student's cached state is dropped."""
+    return cache.get_or_set(CHANGED_KEY, _new_generation, None)
+
+
+def load_registration_state(student):
+    """The student's state read from the database, bypassing the cache."""
+    return RegistrationState(_rows(student))
+
+
+def get_registration_state(student):
+    generation = current_generation()
+    key = _key(student.pk, generation)
+    state = cache.get(key)
+    if state is None:
+        state = RegistrationState(_rows(student))
+        cache.set(key, state, STATE_TIMEOUT)
+    return state
+
+
+def invalidate_registration_state(*student_ids):
+    """Drops the cached state of the given students once the current transaction commits."""
+    def invalidate():
+        generation = current_generation()
+        cache.delete_many([
+            key for student_id in student_ids
+            for key in (_key(student_id, generation), audit_key(student_id, generation))
+        ])
+        cache.set(CHANGED_KEY, _new_generation(), None)
+
+    if student_ids:
+        transaction.on_commit(invalidate)
+
+
+def invalidate_all_registration_states():
+    def invalidate():
+        cache.set(GENERATION_KEY, _new_generation(), None)
+
+    transaction.on_commit(invalidate)
@@ -1,3 +1,686 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from admins.forms import AdminUnitModificationForm
+from users.gpa import recalculate_gpas
+from users.models import Instructor, Major, Student
+from . import timetable
+from .audit import Category, audit_major, audit_student, major_cohort
+from .catalog import LATEST_KEY, catalog_version, get_active_catalog, prerequisite_map
+from .eligibility import eligible_courses
+from .exceptions import AlreadyRegistered, CourseFull, RegistrationError, ScheduleConflict
+from .models import Course, CourseStudentStatus, MajorUnit, PrerequisiteClosure, Semester, TimeSlots, Unit, WaitlistEntry
+from .prerequisites import unlocked_units
+from .registration import join_waitlist, promote_waitlist, register_checked, register_courses, register_student
+from .rollover import parse_adjustment, roll_over
+from .seat_events import SeatPublisher
+from .state import audit_key, current_generation, get_registration_state
+
+
+def make_student(major, n):
+    return Student.objects.create( # pyright: ignore
+        national_id=f"s{n}", username=f"s{n}", email=f"s{n}@example.com",
+        gpa=0, major=major,
+    )
+
+
+class CourseFixtureMixin:
+    def make_course(self, slots):
+        self.semester = Semester.objects.create( # pyright: ignore
+            codename=4031,
+            start_date=datetime.date(2024, 9, 1),
+            end_date=datetime.date(2025, 1, 1),
+            active=True,
+        )
+        self.major = Major.objects.create(name="Computer Science", codename="CS") # pyright: ignore
+        instructor = Instructor.objects.create( # pyright: ignore
+            national_id="i1", username="i1", email="i1@example.com",
+            specialty="Algorithms", academic_title=Instructor.AcademicTitle.PROFESSOR,
+        )
+        unit = Unit.objects.create(name="Algorithms", unit_size=3) # pyright: ignore
+        return Course.objects.create( # pyright: ignore
+            unit=unit, instructor=instructor, semester=self.semester, slots=slots, price=100,
+        )
+
+
+class EligibilityTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.course = self.make_course(slots=10)
+        past = Semester.objects.create( # pyright: ignore
+            codename=4022, start_date=datetime.date(2024, 2, 1), end_date=datetime.date(2024, 6, 1), active=False,
+        )
+        intro, networks, databases, compilers, graphics = (
+            Unit.objects.create(name=name, unit_size=3) # pyright: ignore
+            for name in ("Intro", "Networks", "Databases", "Compilers", "Graphics")
+        )
+        networks.prerequisites.add(intro)
+        databases.prerequisites.add(self.course.unit)
+        MajorUnit.objects.bulk_create([ # pyright: ignore
+            MajorUnit(major=self.major, unit=unit, state=Category.SPECIALITY)
+            for unit in (self.course.unit, intro, networks, databases, compilers)
+        ])
+
+        def offer(unit, semester, slot=None):
+            course = Course.objects.create( # pyright: ignore
+                unit=unit, instructor=self.course.instructor, semester=semester, slots=10, price=100,
+            )
+            if slot is not None:
+                course.time_slot.add(slot)
+            return course
+
+        monday = TimeSlots.Weekday.MONDAY
+        self.course.time_slot.add(TimeSlots.objects.create( # pyright: ignore
+            id=1, day=monday, start_time=datetime.time(8), end_time=datetime.time(10),
+        ))
+        after = TimeSlots.objects.create(id=2, day=monday, start_time=datetime.time(10), end_time=datetime.time(12)) # pyright: ignore
+        overlapping = TimeSlots.objects.create(id=3, day=monday, start_time=datetime.time(9), end_time=datetime.time(11)) # pyright: ignore
+        self.networks = offer(networks, self.semester, after)
+        offer(databases, self.semester, after)  # Needs Algorithms passed, not just taken.
+        offer(compilers, self.semester, overlapping)  # Clashes with Algorithms.
+        offer(graphics, self.semester)  # Not in the major.
+
+        self.student = make_student(self.major, 0)
+        CourseStudentStatus.objects.create(student=self.student, course=offer(intro, past), paid=True, grade=15) # pyright: ignore
+        register_student(self.student, Course.objects.get(pk=self.course.pk)) # pyright: ignore
+
+    def test_eligible_courses(self):
+        courses, selected = eligible_courses(self.student)
+        self.assertEqual([course.pk for course in courses], [self.course.pk, self.networks.pk])
+        self.assertIn(self.course.pk, selected)
+        self.assertEqual(courses[0].enrolled_count, 1)
+
+        others, _ = eligible_courses(self.student, exclude_taken=True)
+        self.assertEqual([course.pk for course in others], [self.networks.pk])
+
+    def test_warm_queries(self):
+        eligible_courses(self.student)
+        # Only the seat counts are read; the catalog and the student's state are cached.
+        with self.assertNumQueries(1):
+            courses, _ = eligible_courses(self.student)
+            for course in courses:
+                list(course.time_slot.all())
+                course.unit.name, course.instructor.pk, course.prerequisites_display
+
+
+class TimetableTests(CourseFixtureMixin, TestCase):
+    def mask(self, day, start, end, slot_id=1):
+        return timetable.slot_mask(slot_id, day, datetime.time(*start), datetime.time(*end))
+
+    def test_overlaps(self):
+        monday = TimeSlots.Weekday.MONDAY
+        eight_to_ten = self.mask(monday, (8, 0), (10, 0))
+        self.assertTrue(eight_to_ten & self.mask(monday, (9, 30), (11, 0)))
+        self.assertTrue(eight_to_ten & self.mask(monday, (8, 30), (9, 0)))
+        # Back to back, and the same hours on another day, don't clash.
+        self.assertFalse(eight_to_ten & self.mask(monday, (10, 0), (12, 0)))
+        self.assertFalse(eight_to_ten & self.mask(monday, (6, 0), (8, 0)))
+        self.assertFalse(eight_to_ten & self.mask(TimeSlots.Weekday.TUESDAY, (8, 0), (10, 0)))
+        # Odd minutes round out to whole cells.
+        self.assertTrue(self.mask(monday, (9, 50), (10, 10)) & eight_to_ten)
+
+    def test_week_boundaries(self):
+        first = self.mask(TimeSlots.Weekday.SATURDAY, (0, 0), (0, 30))
+        last = self.mask(TimeSlots.Weekday.FRIDAY, (23, 30), (23, 59))
+        self.assertEqual((first, last), (1, 1 << (timetable.WEEK_CELLS - 1)))
+        self.assertFalse(last & self.mask(TimeSlots.Weekday.SATURDAY, (0, 0), (23, 59)))
+
+    def test_labelled_slots_clash_only_with_themselves(self):
+        labelled = timetable.slot_mask(5, None, None, None)
+        self.assertEqual(labelled, timetable.slot_mask(5, None, None, None))
+        self.assertFalse(labelled & timetable.slot_mask(6, None, None, None))
+        self.assertFalse(labelled & self.mask(TimeSlots.Weekday.FRIDAY, (0, 0), (23, 59)))
+
+    def test_encoding(self):
+        for mask in (0, 1, (1 << timetable.WEEK_CELLS) | 5):
+            self.assertEqual(timetable.decode(timetable.encode(mask)), mask)
+        self.assertEqual(timetable.encode(0), '')
+
+    def test_course_mask_follows_its_time_slots(self):
+        course = self.make_course(slots=5)
+        monday = TimeSlots.objects.create( # pyright: ignore
+            id=1, day=TimeSlots.Weekday.MONDAY, start_time=datetime.time(8), end_time=datetime.time(10),
+        )
+        tuesday = TimeSlots.objects.create( # pyright: ignore
+            id=2, day=TimeSlots.Weekday.TUESDAY, start_time=datetime.time(8), end_time=datetime.time(10),
+        )
+
+        def occupancy():
+            return Course.objects.get(pk=course.pk).occupancy # pyright: ignore
+
+        course.time_slot.add(monday, tuesday)
+        self.assertEqual(occupancy(), monday.mask | tuesday.mask)
+        tuesday.end_time = datetime.time(12)
+        tuesday.save()
+        self.assertEqual(occupancy(), monday.mask | tuesday.mask)
+        monday.course_set.remove(course)
+        self.assertEqual(occupancy(), tuesday.mask)
+        tuesday.delete()
+        self.assertEqual(occupancy(), 0)
+
+
+class CatalogSnapshotTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.course = self.make_course(slots=5)
+
+    def bump(self, func):
+        version = catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            func()
+        return catalog_version() != version
+
+    def test_snapshot_is_rebuilt_once_per_version(self):
+        self.assertEqual([course.pk for course in get_active_catalog()], [self.course.pk])
+        with self.assertNumQueries(0):
+            get_active_catalog()
+
+        def add_course():
+            Course.objects.create( # pyright: ignore
+                unit=self.course.unit, instructor=self.course.instructor, semester=self.semester, slots=5, price=100,
+            )
+        self.assertTrue(self.bump(add_course))
+        self.assertEqual(len(get_active_catalog()), 2)
+
+    def test_only_shown_instructor_fields_bump(self):
+        instructor = self.course.instructor
+        instructor.last_login = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        self.assertFalse(self.bump(lambda: instructor.save(update_fields=['last_login'])))
+        instructor.first_name = "Ada"
+        self.assertTrue(self.bump(lambda: instructor.save(update_fields=['first_name'])))
+        self.assertTrue(self.bump(instructor.save))
+
+    def test_previous_snapshot_is_served_while_another_worker_rebuilds(self):
+        previous = get_active_catalog()
+        self.bump(lambda: self.course.save())
+        cache.add(f'catalog:lock:{catalog_version()}', 1)
+        with self.assertNumQueries(0):
+            self.assertEqual([course.pk for course in get_active_catalog()], [course.pk for course in previous])
+
+    @mock.patch('courses.catalog.COLD_START_WAIT', 0.1)
+    def test_cold_start_builds_after_waiting_for_the_lock(self):
+        cache.add(f'catalog:lock:{catalog_version()}', 1)
+        self.assertIsNone(cache.get(LATEST_KEY))
+        self.assertEqual([course.pk for course in get_active_catalog()], [self.course.pk])
+
+
+class SeatAccountingTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        self.course = self.make_course(slots=2)
+        self.students = [make_student(self.major, n) for n in range(3)]
+
+    def test_counter_follows_registrations(self):
+        register_student(self.students[0], self.course)
+        register_student(self.students[1], self.course)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 2)
+
+        with self.assertRaises(CourseFull):
+            register_student(self.students[2], self.course)
+
+    def test_duplicate_registration_is_rejected(self):
+        register_student(self.students[0], self.course)
+        with self.assertRaises(AlreadyRegistered):
+            register_student(self.students[0], self.course)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 1)
+
+    def test_cancel_and_delete_release_seats(self):
+        first = register_student(self.students[0], self.course)
+        second = register_student(self.students[1], self.course)
+
+        first.canceled = True
+        first.save()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 1)
+
+        second.delete()
+        first.delete()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 0)
+
+    def test_saving_a_stale_course_keeps_the_counter(self):
+        stale = Course.objects.get(pk=self.course.pk) # pyright: ignore
+        register_student(self.students[0], self.course)
+        register_student(self.students[1], self.course)
+
+        stale.price = 200
+        stale.save()
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.enrolled_count, self.course.price), (2, 200))
+        with self.assertRaises(CourseFull):
+            register_student(self.students[2], self.course)
+
+
+class RegistrationStateTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.course = self.make_course(slots=5)
+        slot = TimeSlots.objects.create( # pyright: ignore
+            id=1, day=TimeSlots.Weekday.MONDAY, start_time=datetime.time(8), end_time=datetime.time(10),
+        )
+        self.course.time_slot.add(slot)
+        self.course.refresh_from_db()
+        self.clashing = Course.objects.create( # pyright: ignore
+            unit=Unit.objects.create(name="Databases", unit_size=3), # pyright: ignore
+            instructor=self.course.instructor, semester=self.semester, slots=5, price=100,
+        )
+        self.clashing.time_slot.add(slot)
+        self.clashing.refresh_from_db()
+        self.student = make_student(self.major, 0)
+
+    def test_registration_invalidates_the_cached_state(self):
+        self.assertEqual(get_registration_state(self.student).selected_course_ids, set())
+        with self.captureOnCommitCallbacks(execute=True):
+            register_student(self.student, self.course)
+        self.assertEqual(get_registration_state(self.student).selected_course_ids, {self.course.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            CourseStudentStatus.objects.filter(student=self.student).get().delete() # pyright: ignore
+        self.assertEqual(get_registration_state(self.student).selected_course_ids, set())
+
+    def test_a_stale_state_does_not_allow_a_clash(self):
+        get_registration_state(self.student)
+        # Written without signals, as another worker's cache would miss it.
+        CourseStudentStatus.objects.bulk_create([ # pyright: ignore
+            CourseStudentStatus(student=self.student, course=self.clashing, paid=False, canceled=False),
+        ])
+        with self.assertRaises(ScheduleConflict):
+            register_checked(self.student, self.course)
+        registered, results = register_courses(self.student, [self.course.pk])
+        self.assertFalse(registered)
+        self.assertEqual(results[self.course.pk], "Schedule conflict with another course.")
+
+    def test_a_stale_state_does_not_refuse(self):
+        register_student(self.student, self.clashing)
+        get_registration_state(self.student)
+        CourseStudentStatus.objects.filter(student=self.student).update(canceled=True) # pyright: ignore
+        register_checked(self.student, self.course)
+        self.assertTrue(CourseStudentStatus.objects.filter(student=self.student, course=self.course).exists()) # pyright: ignore
+
+
+class WaitlistTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        self.course = self.make_course(slots=1)
+        slot = TimeSlots.objects.create( # pyright: ignore
+            id=1, day=TimeSlots.Weekday.MONDAY, start_time=datetime.time(8), end_time=datetime.time(10),
+        )
+        self.course.time_slot.add(slot)
+        self.course.refresh_from_db()
+        self.clashing = Course.objects.create( # pyright: ignore
+            unit=Unit.objects.create(name="Databases", unit_size=3), # pyright: ignore
+            instructor=self.course.instructor, semester=self.semester, slots=100, price=100,
+        )
+        self.clashing.time_slot.add(slot)
+        self.holder = register_student(make_student(self.major, 0), self.course)
+        self.next_student = 1
+
+    def wait(self, clashing=False):
+        student = make_student(self.major, self.next_student)
+        self.next_student += 1
+        if clashing:
+            register_student(student, self.clashing)
+        join_waitlist(student, self.course)
+        return student
+
+    def registered(self):
+        return set(CourseStudentStatus.objects.filter( # pyright: ignore
+            course=self.course, canceled=False
+        ).values_list('student_id', flat=True))
+
+    def test_released_seat_goes_to_the_first_student_without_a_clash(self):
+        busy, free, later = self.wait(clashing=True), self.wait(), self.wait()
+        self.holder.canceled = True
+        self.holder.save()
+        self.assertEqual(self.registered(), {free.pk})
+        self.assertEqual(set(WaitlistEntry.objects.values_list('student_id', flat=True)), {busy.pk, later.pk}) # pyright: ignore
+
+    def test_raising_the_slots_promotes(self):
+        first, second = self.wait(), self.wait()
+        self.course.slots = 3
+        self.course.save()
+        self.assertEqual(self.registered(), {self.holder.student_id, first.pk, second.pk})
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 3)
+
+    def test_queries_dont_grow_with_the_waitlist(self):
+        def count():
+            with CaptureQueriesContext(connection) as queries:
+                promote_waitlist(self.course)
+            return len(queries)
+
+        self.wait(clashing=True)
+        few = count()
+        for _ in range(5):
+            self.wait(clashing=True)
+        self.assertEqual(count(), few)
+
+
+class GpaTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        self.course = self.make_course(slots=10)
+        self.other = Course.objects.create( # pyright: ignore
+            unit=Unit.objects.create(name="Databases", unit_size=2), # pyright: ignore
+            instructor=self.course.instructor, semester=self.semester, slots=10, price=100,
+        )
+        self.students = [make_student(self.major, n) for n in range(3)]
+
+    def grade(self, student, course, grade):
+        status = CourseStudentStatus.objects.get(student=student, course=course) # pyright: ignore
+        status.grade = grade
+        status.save()
+        return status
+
+    def assertTotalsMatchRecalculation(self):
+        self.assertEqual(recalculate_gpas(fix=False), [])
+
+    def test_incremental_totals_match_a_recalculation(self):
+        for student in self.students:
+            register_student(student, self.course)
+            register_student(student, self.other)
+        first, second, third = self.students
+
+        self.grade(first, self.course, 18)
+        self.grade(first, self.other, 12)
+        self.grade(second, self.course, 8)
+        self.grade(third, self.other, 25)
+        self.assertTotalsMatchRecalculation()
+        first.refresh_from_db()
+        self.assertAlmostEqual(first.gpa, (18 * 3 + 12 * 2) / 5)
+
+        # Regrading, failing and canceling.
+        self.grade(first, self.other, 9)
+        self.grade(second, self.course, 15)
+        status = self.grade(third, self.course, 11)
+        status.canceled = True
+        status.save()
+        self.assertTotalsMatchRecalculation()
+
+        unit = Unit.objects.get(pk=self.course.unit_id) # pyright: ignore
+        unit.unit_size = 4
+        unit.save()
+        self.assertTotalsMatchRecalculation()
+        first.refresh_from_db()
+        self.assertAlmostEqual(first.gpa, 18)
+
+    def test_only_unit_size_changes_recalculate(self):
+        unit = Unit.objects.get(pk=self.course.unit_id) # pyright: ignore
+        with mock.patch('courses.signals.recalculate_gpas') as recalculate:
+            unit.name = "Advanced Algorithms"
+            unit.save()
+            unit.unit_size = 3
+            unit.save(update_fields=['unit_size'])
+            self.assertFalse(recalculate.called)
+            unit.unit_size = 4
+            unit.save(update_fields=['name'])
+            self.assertFalse(recalculate.called)
+            unit.save()
+            self.assertEqual(recalculate.call_count, 1)
+
+
+    def test_moving_a_course_to_another_unit_recalculates(self):
+        first, second = self.students[:2]
+        register_student(first, self.course)
+        register_student(second, self.course)
+        self.grade(first, self.course, 18)
+
+        course = Course.objects.get(pk=self.course.pk) # pyright: ignore
+        with mock.patch('courses.signals.recalculate_gpas') as recalculate:
+            course.price = 200
+            course.save()
+            self.assertFalse(recalculate.called)
+        course.unit = self.other.unit
+        course.save()
+        self.assertTotalsMatchRecalculation()
+        first.refresh_from_db()
+        self.assertEqual((first.gpa_points, first.gpa_units), (36, 2))
+
+    def test_deleting_a_unit_recalculates(self):
+        first = self.students[0]
+        register_student(first, self.course)
+        register_student(first, self.other)
+        self.grade(first, self.course, 18)
+        self.grade(first, self.other, 12)
+
+        Unit.objects.filter(pk=self.course.unit_id).delete() # pyright: ignore
+        self.assertTotalsMatchRecalculation()
+        first.refresh_from_db()
+        self.assertAlmostEqual(first.gpa, 12)
+        self.assertIsNone(Course.objects.get(pk=self.course.pk).unit) # pyright: ignore
+
+
+class ConcurrentRegistrationTests(CourseFixtureMixin, TransactionTestCase):
+    SLOTS = 5
+    THREADS = 25
+
+    def test_seats_are_never_oversold(self):
+        course = self.make_course(slots=self.SLOTS)
+        students = [make_student(self.major, n) for n in range(self.THREADS)]
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def worker(student):
+            barrier.wait()
+            try:
+                register_student(student, course)
+                results.append(True)
+            except RegistrationError:
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(s,)) for s in students]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        course.refresh_from_db()
+        registered = CourseStudentStatus.objects.filter(course=course).count() # pyright: ignore
+        self.assertEqual(results.count(True), self.SLOTS)
+        self.assertEqual(registered, self.SLOTS)
+        self.assertEqual(course.enrolled_count, self.SLOTS)
+
+
+class SeatPublisherTests(CourseFixtureMixin, TestCase):
+    SUBSCRIBERS = 500
+
+    def test_one_query_reaches_every_subscriber(self):
+        course = self.make_course(slots=10)
+        student = make_student(self.major, 0)
+        publisher = SeatPublisher(coalesce_seconds=0)
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        queues = [publisher.subscribe(loop) for _ in range(self.SUBSCRIBERS)]
+
+        register_student(student, course)
+        publisher.seats_changed([course.pk])
+        publisher.seats_changed([course.pk])
+        with self.assertNumQueries(1):
+            event = publisher.flush()
+
+        async def receive():
+            return await asyncio.gather(*(queue.get() for queue in queues))
+
+        received = loop.run_until_complete(receive())
+        self.assertEqual(len(received), self.SUBSCRIBERS)
+        self.assertTrue(all(item is event for item in received))
+        self.assertEqual(event.seats, {course.pk: 9})
+
+        publisher.unsubscribe(queues[0])
+        self.assertEqual(publisher.subscriber_count, self.SUBSCRIBERS - 1)
+
+    def test_events_since(self):
+        course = self.make_course(slots=10)
+        publisher = SeatPublisher(coalesce_seconds=0)
+        for _ in range(3):
+            publisher.seats_changed([course.pk])
+            publisher.flush()
+
+        self.assertEqual([event.seq for event in publisher.events_since(1)], [2, 3])
+        self.assertEqual(publisher.events_since(3), [])
+        # A sequence this publisher never reached came from another process.
+        self.assertIsNone(publisher.events_since(4))
+        publisher.history.popleft()
+        self.assertIsNone(publisher.events_since(0))
+
+
+class PrerequisiteClosureTests(TestCase):
+    def setUp(self):
+        self.a, self.b, self.c, self.d = (
+            Unit.objects.create(name=name, unit_size=3) for name in "ABCD" # pyright: ignore
+        )
+        # D requires C requires B requires A.
+        self.b.prerequisites.add(self.a)
+        self.c.prerequisites.add(self.b)
+        self.a.is_prerequisite_for.add(self.d)  # reverse side: D requires A
+        self.d.prerequisites.add(self.c)
+
+    def closure(self):
+        return set(PrerequisiteClosure.objects.values_list( # pyright: ignore
+            'ancestor__name', 'descendant__name', 'depth'
+        ))
+
+    def test_chains_are_closed(self):
+        self.assertEqual(self.closure(), {
+            ('A', 'B', 1), ('B', 'C', 1), ('A', 'C', 2),
+            ('C', 'D', 1), ('B', 'D', 2), ('A', 'D', 1),
+        })
+        self.assertEqual(prerequisite_map([self.d.pk]), {self.d.pk: [(self.a.pk, 'A'), (self.c.pk, 'C')]})
+        self.assertEqual(set(unlocked_units([self.b.pk]).values_list('name', flat=True)), {'C', 'D'})
+
+    def test_removing_and_deleting_reopens_chains(self):
+        self.d.prerequisites.remove(self.a)
+        self.assertIn(('A', 'D', 3), self.closure())
+        self.c.delete()
+        self.assertEqual(self.closure(), {('A', 'B', 1)})
+
+    def test_cycles_are_rejected(self):
+        # add() doesn't use a savepoint, so each failure gets its own.
+        with self.assertRaises(ValidationError), transaction.atomic():
+            self.a.prerequisites.add(self.d)
+        with self.assertRaises(ValidationError), transaction.atomic():
+            self.d.is_prerequisite_for.add(self.b)
+        with self.assertRaises(ValidationError), transaction.atomic():
+            self.a.prerequisites.add(self.a)
+        self.assertEqual(len(self.closure()), 6)
+
+        form = AdminUnitModificationForm(instance=self.a, data={
+            'name': 'A', 'unit_size': 3, 'prerequisites': [self.c.pk],
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('prerequisites', form.errors)
+
+
+class DegreeAuditTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.course = self.make_course(slots=5)
+        self.calculus = Unit.objects.create(name="Calculus", unit_size=3) # pyright: ignore
+        self.persian = Unit.objects.create(name="Persian", unit_size=2) # pyright: ignore
+        MajorUnit.objects.bulk_create([ # pyright: ignore
+            MajorUnit(major=self.major, unit=self.course.unit, state=Category.SPECIALITY),
+            MajorUnit(major=self.major, unit=self.calculus, state=Category.PRIMARY),
+            MajorUnit(major=self.major, unit=self.persian, state=Category.GENERAL),
+        ])
+        self.students = [make_student(self.major, n) for n in range(2)]
+
+    def test_remaining_units_per_category(self):
+        CourseStudentStatus.objects.create(student=self.students[0], course=self.course, paid=True, grade=15) # pyright: ignore
+        CourseStudentStatus.objects.create(student=self.students[1], course=self.course, paid=True, grade=5) # pyright: ignore
+
+        audits = audit_major(self.major.pk)
+        self.assertEqual(audits[self.students[0].pk].remaining_by_category(), [0, 3, 0, 2])
+        self.assertEqual(audits[self.students[1].pk].remaining_by_category(), [3, 3, 0, 2])
+        self.assertEqual(audits[self.students[1].pk].required, {1: 3, 2: 3, 4: 2})
+        self.assertEqual(audit_student(self.students[0]).remaining, audits[self.students[0].pk].remaining)
+
+    def test_cached_audit_follows_changes(self):
+        self.assertEqual(audit_student(self.students[0]).remaining_total, 8)
+        with self.captureOnCommitCallbacks(execute=True):
+            CourseStudentStatus.objects.create(student=self.students[0], course=self.course, paid=True, grade=15) # pyright: ignore
+        self.assertEqual(audit_student(self.students[0]).remaining_total, 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            MajorUnit.objects.filter(unit=self.persian).delete() # pyright: ignore
+        self.assertEqual(audit_student(self.students[0]).remaining_total, 3)
+
+    def test_cohort_is_cached_until_a_registration_changes(self):
+        cohort = major_cohort(self.major.pk)
+        self.assertEqual(cohort.ranking, [student.pk for student in self.students])
+        self.assertEqual((cohort.average_remaining, cohort.complete_count), ([3, 3, 0, 2], 0))
+        # The report doesn't fill the students' own cache entries.
+        self.assertIsNone(cache.get(audit_key(self.students[0].pk, current_generation())))
+        with self.assertNumQueries(0):
+            major_cohort(self.major.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CourseStudentStatus.objects.create(student=self.students[0], course=self.course, paid=True, grade=15) # pyright: ignore
+        cohort = major_cohort(self.major.pk)
+        self.assertEqual(cohort.ranking, [self.students[1].pk, self.students[0].pk])
+        self.assertEqual(cohort.average_remaining, [1.5, 3, 0, 2])
+
+
+class SemesterRolloverTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        self.course = self.make_course(slots=40)
+        self.course.time_slot.add(TimeSlots.objects.create( # pyright: ignore
+            id=1, day=TimeSlots.Weekday.SATURDAY,
+            start_time=datetime.time(8), end_time=datetime.time(10),
+        ))
+        self.course.refresh_from_db()
+        register_student(make_student(self.major, 0), self.course)
+        self.target = Semester.objects.create( # pyright: ignore
+            codename=4032,
+            start_date=datetime.date(2025, 2, 1),
+            end_date=datetime.date(2025, 6, 1),
+            active=False,
+        )
+
+    def test_courses_are_copied_with_their_time_slots(self):
+        result = roll_over(self.semester, self.target, carry_instructors=False, slots_rule='+10%', price_rule='=250')
+        copy = Course.objects.get(semester=self.target) # pyright: ignore
+        self.assertEqual(result.courses, [copy])
+        self.assertEqual((copy.unit_id, copy.instructor_id), (self.course.unit_id, None))
+        self.assertEqual((copy.slots, copy.price, copy.enrolled_count), (44, 250, 0))
+        self.assertEqual(list(copy.time_slot.values_list('id', flat=True)), [1])
+        self.assertEqual(copy.occupancy_mask, self.course.occupancy_mask)
+
+        # Offerings the target semester already has are not copied twice.
+        again = roll_over(self.semester, self.target, carry_instructors=False)
+        self.assertEqual((again.courses, again.skipped, again.also_offered), ([], 1, 0))
+
+    def test_sections_are_matched_by_unit_and_instructor(self):
+        other = Instructor.objects.create( # pyright: ignore
+            national_id="i2", username="i2", email="i2@example.com",
+            specialty="Algorithms", academic_title=Instructor.AcademicTitle.PROFESSOR,
+        )
+        for instructor in (other, None):
+            Course.objects.create( # pyright: ignore
+                unit=self.course.unit, instructor=instructor, semester=self.semester, slots=40, price=100,
+            )
+        # The target already offers the unit, but under another instructor.
+        Course.objects.create(unit=self.course.unit, instructor=other, semester=self.target, slots=40, price=100) # pyright: ignore
+
+        result = roll_over(self.semester, self.target)
+        self.assertEqual(
+            sorted((copy.instructor_id or 0) for copy in result.courses),
+            sorted([0, self.course.instructor_id]),
+        )
+        self.assertEqual((result.skipped, result.also_offered), (1, 2))
+        self.assertEqual(Course.objects.filter(semester=self.target).count(), 3) # pyright: ignore
+
+        again = roll_over(self.semester, self.target)
+        self.assertEqual((again.courses, again.skipped, again.also_offered), ([], 3, 0))
+
+    def test_adjustments(self):
+        self.assertEqual([parse_adjustment(rule)(40) for rule in ('', '+5', '-50', '-10%', '=7', '30')], [40, 45, 0, 36, 7, 30])
+        for rule in ('10%', '*2', '+-3'):
+            with self.assertRaises(ValueError):
+                parse_adjustment(rule)
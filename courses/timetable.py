@@ -0,0 +1,62 @@
+"""
+Weekly occupancy bitmasks.
+
+The week is cut into 30 minute cells, one bit each, starting on Saturday
+00:00. A course's mask is the OR of its time slots, so two courses clash
+exactly when their masks share a bit, which also catches slots that
+overlap without being identical. Slots that only have a free-text label
+get a bit of their own past the end of the week, so they keep clashing
+with themselves as before.
+"""
+CELL_MINUTES = 30
+CELLS_PER_DAY = 24 * 60 // CELL_MINUTES
+WEEK_CELLS = 7 * CELLS_PER_DAY
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def slot_mask(slot_id, day, start_time, end_time):
+    if day is None or start_time is None or end_time is None:
+        return 1 << (WEEK_CELLS + slot_id)
+
+    first = _minutes(start_time) // CELL_MINUTES
+    last = -(-_minutes(end_time) // CELL_MINUTES)  # round up
+    offset = day * CELLS_PER_DAY
+    return ((1 << (last - first)) - 1) << (offset + first)
+
+
+def combine(masks):
+    mask = 0
+    for value in masks:
+        mask |= value
+    return mask
+
+
+def encode(mask):
+    return format(mask, 'x') if mask else ''
+
+
+def decode(value):
+    return int(value, 16) if value else 0
+
+
+def occupied_mask(student, exclude_course=None, paid_only=False):
+    """
+    OR of the masks of the student's non-canceled courses in the active
+    semester, read with a single query.
+    """
+    from .models import CourseStudentStatus
+
+    rows = CourseStudentStatus.objects.filter( # pyright: ignore
+        student=student,
+        course__semester__active=True,
+        canceled=False
+    )
+    if paid_only:
+        rows = rows.filter(paid=True)
+    if exclude_course is not None:
+        rows = rows.exclude(course=exclude_course)
+
+    return combine(decode(m) for m in rows.values_list('course__occupancy_mask', flat=True))
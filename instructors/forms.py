@@ -1,7 +1,31 @@
 from django import forms
+from courses.gradebook import ChangedRowsFormSetMixin
 from courses.models import CourseStudentStatus
 
 class InstructorCSSForm(forms.ModelForm):
     class Meta:
         model = CourseStudentStatus 
         fields = ['grade', 'canceled']
+
+class InstructorCSSBaseFormSet(ChangedRowsFormSetMixin, forms.BaseModelFormSet):
+    pass
+
+InstructorCSSFormSet = forms.modelformset_factory(
+    CourseStudentStatus,
+    form=InstructorCSSForm,
+    formset=InstructorCSSBaseFormSet,
+    extra=0,
+)
+
+
+class GradeImportForm(forms.Form):
+    file = forms.FileField(
+        help_text="CSV or XLSX with 'student_id' and 'grade' columns.",
+        widget=forms.ClearableFileInput(attrs={'accept': '.csv,.xlsx'}),
+    )
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if not file.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError("Upload a .csv or .xlsx file.")
+        return file
@@ -0,0 +1,149 @@
+"""
+Bulk grade import for a course.
+
+Instructors upload a CSV or XLSX sheet with a `student_id` and a `grade`
+column. Every row is validated before anything is written; if any row is
+wrong nothing is saved and the row-level errors are reported. Otherwise
+the grades and `passed` flags are written with one bulk_update and the
+GPAs of the graded students are recomputed in one set-based pass, instead
+of one save and one GPA update per student.
+"""
+import csv
+import io
+
+from django.db import transaction
+
+from courses.models import CourseStudentStatus
+from courses.state import invalidate_registration_state
+from users.gpa import recalculate_gpas
+
+MAX_GRADE = 20
+PASSING_GRADE = 10
+MAX_ROWS = 5000
+STUDENT_ID_COLUMN = 'student_id'
+GRADE_COLUMN = 'grade'
+
+
+class GradeImportError(Exception):
+    """The uploaded file can't be read as a grade sheet at all."""
+
+
+def _csv_rows(uploaded_file):
+    try:
+        text = uploaded_file.read().decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise GradeImportError("The CSV file must be UTF-8 encoded.")
+    yield from csv.reader(io.StringIO(text))
+
+
+def _xlsx_rows(uploaded_file):
+    try:
+        import openpyxl
+    except ImportError:
+        raise GradeImportError("XLSX files are not supported on this server; upload a CSV file instead.")
+
+    try:
+        workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+    except Exception:
+        raise GradeImportError("The XLSX file could not be read.")
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield ['' if value is None else str(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def _cell(row, index):
+    return row[index].strip() if index < len(row) else ''
+
+
+def read_grade_sheet(uploaded_file):
+    """
+    Returns [(row_number, student_id, grade), ...] with the raw cell
+    values of the sheet's `student_id` and `grade` columns.
+    """
+    if uploaded_file.name.lower().endswith('.xlsx'):
+        rows = _xlsx_rows(uploaded_file)
+    else:
+        rows = _csv_rows(uploaded_file)
+
+    header = [cell.strip().lower() for cell in next(rows, [])]
+    if STUDENT_ID_COLUMN not in header or GRADE_COLUMN not in header:
+        raise GradeImportError(f"The first row must name the '{STUDENT_ID_COLUMN}' and '{GRADE_COLUMN}' columns.")
+    id_index, grade_index = header.index(STUDENT_ID_COLUMN), header.index(GRADE_COLUMN)
+
+    sheet = []
+    for row_number, row in enumerate(rows, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(sheet) == MAX_ROWS:
+            raise GradeImportError(f"A sheet may have at most {MAX_ROWS} rows.")
+        sheet.append((row_number, _cell(row, id_index), _cell(row, grade_index)))
+    return sheet
+
+
+def _parse_grade(value):
+    if not value:
+        raise ValueError("Grade is missing.")
+    try:
+        grade = float(value)
+    except ValueError:
+        raise ValueError(f"'{value}' is not a number.")
+    if not 0 <= grade <= MAX_GRADE:
+        raise ValueError(f"Grade must be between 0 and {MAX_GRADE}.")
+    return grade
+
+
+def import_grades(course, sheet):
+    """
+    Validates every row of the sheet against the course's registrations
+    and, if all of them are valid, writes the grades.
+
+    Returns (imported, errors) where imported is the number of graded
+    students and errors is a list of (row_number, message); nothing is
+    written when there are errors.
+    """
+    statuses = {
+        status.student.student_id: status
+        for status in CourseStudentStatus.objects.filter( # pyright: ignore
+            course=course
+        ).select_related('student').only('id', 'grade', 'passed', 'canceled', 'student', 'student__student_id')
+    }
+
+    errors = []
+    graded = {}
+    for row_number, student_id, value in sheet:
+        status = statuses.get(student_id)
+        if not student_id:
+            errors.append((row_number, "Student ID is missing."))
+        elif status is None:
+            errors.append((row_number, f"Student {student_id} is not registered in this course."))
+        elif status.canceled:
+            errors.append((row_number, f"The registration of student {student_id} is canceled."))
+        elif student_id in graded:
+            errors.append((row_number, f"Student {student_id} appears more than once."))
+        else:
+            try:
+                graded[student_id] = (status, _parse_grade(value))
+            except ValueError as e:
+                errors.append((row_number, str(e)))
+
+    if errors:
+        return 0, errors
+    if not graded:
+        return 0, [(1, "The sheet has no grades.")]
+
+    changed = []
+    for status, grade in graded.values():
+        if status.grade != grade or status.passed != (grade >= PASSING_GRADE):
+            status.grade = grade
+            status.passed = grade >= PASSING_GRADE
+            changed.append(status)
+
+    student_ids = [status.student_id for status in changed]
+    with transaction.atomic():
+        CourseStudentStatus.objects.bulk_update(changed, ['grade', 'passed'], batch_size=500) # pyright: ignore
+        # bulk_update bypasses save(), so the GPAs are recomputed here in one pass.
+        recalculate_gpas(student_ids)
+        invalidate_registration_state(*student_ids)
+    return len(graded), []
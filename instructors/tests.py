@@ -1,3 +1,90 @@
+import io
+import unittest
+
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from django.urls import reverse
+
+from courses.models import CourseStudentStatus
+from courses.registration import register_student
+from courses.tests import CourseFixtureMixin, make_student
+from .grades import GradeImportError, read_grade_sheet
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+class GradebookTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        self.course = self.make_course(slots=1)
+        self.client.force_login(self.course.instructor)
+        self.canceled = register_student(make_student(self.major, 0), self.course)
+        self.canceled.canceled = True
+        self.canceled.save()
+        register_student(make_student(self.major, 1), self.course)
+
+    def post_rows(self, rows):
+        data = {'grades-TOTAL_FORMS': len(rows), 'grades-INITIAL_FORMS': len(rows)}
+        for index, (status, values) in enumerate(rows):
+            data[f'grades-{index}-id'] = status.pk
+            data.update({f'grades-{index}-{key}': value for key, value in values.items()})
+        return self.client.post(reverse('instructor_course_management', args=[self.course.pk]), data)
+
+    def test_uncanceling_into_a_full_course_is_a_form_error(self):
+        response = self.post_rows([(self.canceled, {'grade': ''})])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['formset'].forms[0].errors['canceled'])
+        self.assertTrue(CourseStudentStatus.objects.get(pk=self.canceled.pk).canceled) # pyright: ignore
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 1)
+
+
+class GradeImportTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        self.course = self.make_course(slots=5)
+        self.client.force_login(self.course.instructor)
+        self.statuses = [register_student(make_student(self.major, n), self.course) for n in range(2)]
+        self.ids = [status.student.student_id for status in self.statuses]
+
+    def csv_file(self, text):
+        return SimpleUploadedFile('grades.csv', text.encode('utf-8-sig'))
+
+    def test_csv_sheets(self):
+        sheet = read_grade_sheet(self.csv_file(f"Grade,Student_ID\n17,{self.ids[0]}\n,\n 9.5 ,{self.ids[1]}\n"))
+        self.assertEqual(sheet, [(2, self.ids[0], '17'), (4, self.ids[1], '9.5')])
+        with self.assertRaises(GradeImportError):
+            read_grade_sheet(self.csv_file("id,score\n1,2\n"))
+
+    @unittest.skipIf(openpyxl is None, "openpyxl is not installed")
+    def test_xlsx_sheets(self):
+        workbook = openpyxl.Workbook() # pyright: ignore
+        worksheet = workbook.active
+        worksheet.append(['student_id', 'name', 'grade']) # pyright: ignore
+        worksheet.append([self.ids[0], 'A', 17]) # pyright: ignore
+        worksheet.append([None, None, None]) # pyright: ignore
+        worksheet.append([self.ids[1], 'B', 9.5]) # pyright: ignore
+        content = io.BytesIO()
+        workbook.save(content)
+
+        sheet = read_grade_sheet(SimpleUploadedFile('grades.xlsx', content.getvalue()))
+        self.assertEqual(sheet, [(2, self.ids[0], '17'), (4, self.ids[1], '9.5')])
+
+    def test_one_bad_row_writes_nothing(self):
+        upload = self.csv_file(f"student_id,grade\n{self.ids[0]}\t,18\n{self.ids[1]},twenty\n")
+        response = self.client.post(reverse('instructor_grade_import', args=[self.course.pk]), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['import_errors'], [(3, "'twenty' is not a number.")])
+        self.assertEqual(
+            list(CourseStudentStatus.objects.filter(course=self.course).values_list('grade', flat=True)), # pyright: ignore
+            [None, None],
+        )
 
-# Create your tests here.
+        upload = self.csv_file(f"student_id,grade\n{self.ids[0]},18\n{self.ids[1]},7\n")
+        response = self.client.post(reverse('instructor_grade_import', args=[self.course.pk]), {'file': upload})
+        self.assertRedirects(response, reverse('instructor_course_management', args=[self.course.pk]), fetch_redirect_response=False)
+        graded = CourseStudentStatus.objects.get(pk=self.statuses[0].pk) # pyright: ignore
+        self.assertEqual((graded.grade, graded.passed), (18, True))
+        self.statuses[0].student.refresh_from_db()
+        self.assertEqual(self.statuses[0].student.gpa, 18)
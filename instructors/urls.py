@@ -6,4 +6,5 @@ from . import views
 urlpatterns = [
     path('courses/', views.instructor_courses, name='instructor_courses'),
     path('courses/<int:pk>/manage/', views.instructor_course_management, name='instructor_course_management'),
+    path('courses/<int:pk>/grades/import/', views.instructor_grade_import, name='instructor_grade_import'),
 ]
@@ -1,24 +1,39 @@
 from django.contrib.auth.decorators import login_required
+from django.contrib import messages
 from django.shortcuts import render, get_object_or_404, redirect
+from django.db import transaction
 from django.db.models import Q
-from django.http import HttpResponse
-from django.forms import modelformset_factory
-from users.models import User
-from courses.models import Course, CourseStudentStatus 
-from .forms import InstructorCSSForm
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from users.models import Instructor
+from courses.exceptions import CourseFull
+from courses.gradebook import gradebook_page
+from courses.models import Course, CourseStudentStatus
+from .forms import GradeImportForm, InstructorCSSFormSet
+from .grades import GradeImportError, import_grades, read_grade_sheet
+
+GRADEBOOK_PREFIX = 'grades'
+
+
+def _instructor_course(request, pk):
+    # request.profile is None for users without an instructor row, which
+    # must not match the courses that have no instructor.
+    if not isinstance(request.profile, Instructor):
+        raise Http404("No such course.")
+    return get_object_or_404(Course.objects.select_related('unit', 'semester'), pk=pk, instructor=request.profile)
 
 
 @login_required(login_url="login")
 def instructor_courses(request):
-    user = request.user
+    instructor = request.profile
 
-    if user.role != User.Role.INSTRUCTOR:
+    if not isinstance(instructor, Instructor):
         return HttpResponse('401 Unauthorized: You are likely not permitted to see this page with your current authorization.', status=401) # pyright: ignore
 
     query = request.GET.get('q', '')
     active = request.GET.get('active', '')
     
-    current_courses = Course.objects.filter(instructor=user) # pyright: ignore
+    current_courses = Course.objects.filter(instructor=instructor) # pyright: ignore
 
     if query:
         current_courses = current_courses.filter(
@@ -36,25 +51,51 @@ def instructor_courses(request):
 
 @login_required(login_url='login')
 def instructor_course_management(request, pk):
-    course = get_object_or_404(Course, pk=pk, instructor=request.user)
-    students = CourseStudentStatus.objects.filter(course=course).select_related("student") # pyright: ignore
-
-    CourseStudentStatusFormSet = modelformset_factory(
-        CourseStudentStatus,
-        form=InstructorCSSForm,
-        extra=0
-    )
+    course = _instructor_course(request, pk)
+    page, students = gradebook_page(request, CourseStudentStatus.objects.filter(course=course), GRADEBOOK_PREFIX) # pyright: ignore
 
     if request.method == 'POST':
-        formset = CourseStudentStatusFormSet(request.POST, queryset=students)
+        formset = InstructorCSSFormSet(request.POST, queryset=students, prefix=GRADEBOOK_PREFIX)
         if formset.is_valid():
-            formset.save()
-            return redirect('instructor_course_management', pk=course.pk)
+            try:
+                with transaction.atomic():
+                    for form in formset.forms:
+                        if form.has_changed():
+                            form.save()
+            except CourseFull:
+                # Un-canceling needs a seat; nothing on the page is saved.
+                form.add_error('canceled', "The course is full, so this registration can't be restored.")
+            else:
+                return redirect(f"{reverse('instructor_course_management', args=[course.pk])}?page={page.number}")
     else:
-        formset = CourseStudentStatusFormSet(queryset=students)
+        formset = InstructorCSSFormSet(queryset=students, prefix=GRADEBOOK_PREFIX)
 
     return render(request, 'instructors/instructors_course_management.html', {
         'course': course,
         'formset': formset,
-        'students': students
+        'page': page,
+        'import_form': GradeImportForm(),
+    })
+
+@login_required(login_url='login')
+def instructor_grade_import(request, pk):
+    course = _instructor_course(request, pk)
+    form = GradeImportForm(request.POST or None, request.FILES or None)
+    import_errors = []
+
+    if request.method == 'POST' and form.is_valid():
+        try:
+            sheet = read_grade_sheet(form.cleaned_data['file'])
+            imported, import_errors = import_grades(course, sheet)
+        except GradeImportError as e:
+            form.add_error('file', str(e))
+        else:
+            if not import_errors:
+                messages.success(request, f"{imported} grades were imported.")
+                return redirect('instructor_course_management', pk=course.pk)
+
+    return render(request, 'instructors/grade_import.html', {
+        'course': course,
+        'import_form': form,
+        'import_errors': import_errors,
     })
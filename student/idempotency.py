@@ -0,0 +1,144 @@
+"""
+Idempotency keys for the registration and payment views.
+
+Clients send a key with the `Idempotency-Key` header or an
+`idempotency_key` parameter; the templates render one per page, so a
+double click or a browser retry reuses it. The first request with a key
+runs the view, and a successful (2xx) or redirect (3xx) response is kept
+in Django's cache for `KEY_TIMEOUT` seconds, with its cookies and flashed
+messages; replays get it without running the view. Client and server
+errors are not kept: the view runs again for the retry, and its own
+checks (already registered, already paid) keep that safe. A duplicate
+that arrives while the first request is still running waits up to
+`LOCK_WAIT` seconds for its response and gets a 409 after that, and
+reusing a key for a request with different parameters gets a 422.
+"""
+import functools
+import hashlib
+import time
+import uuid
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseBadRequest
+
+KEY_TIMEOUT = 10 * 60
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+WAIT_INTERVAL = 0.1
+MAX_KEY_LENGTH = 128
+FORM_CONTENT_TYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+# Parameters that differ between renders of the same page.
+IGNORED_PARAMS = {'idempotency_key', 'csrfmiddlewaretoken'}
+
+
+def new_key():
+    return uuid.uuid4().hex
+
+
+def _client_key(request):
+    return (
+        request.headers.get('Idempotency-Key')
+        or request.POST.get('idempotency_key')
+        or request.GET.get('idempotency_key')
+    )
+
+
+def _fingerprint(request):
+    """Hash of the query string and body, without the per-render parameters."""
+    digest = hashlib.sha256()
+    params = [('GET', request.GET)]
+    if request.content_type in FORM_CONTENT_TYPES:
+        params.append(('POST', request.POST))
+    else:
+        digest.update(request.body)
+    for source, query in params:
+        for name, values in sorted(query.lists()):
+            if name not in IGNORED_PARAMS:
+                digest.update(repr((source, name, values)).encode())
+    return digest.hexdigest()
+
+
+def _freeze(request, response):
+    # Flashed messages are written by the middleware after the view; write
+    # them now so that the replay carries their cookie. The middleware
+    # writing them again is harmless.
+    storage = getattr(request, '_messages', None)
+    if storage is not None:
+        storage.update(response)
+    return response.status_code, list(response.items()), response.cookies, response.content
+
+
+def _thaw(stored):
+    status, headers, cookies, content = stored
+    response = HttpResponse(content, status=status)
+    for header, value in headers:
+        response[header] = value
+    response.cookies = cookies
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _wait_for_response(response_key, lock_key):
+    """
+    Takes the lock, or waits for the request holding it to store its
+    response. Returns the stored response, or None once the lock is taken.
+    """
+    deadline = time.monotonic() + LOCK_WAIT
+    while not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        stored = cache.get(response_key)
+        if stored is not None:
+            return _thaw(stored)
+        if time.monotonic() >= deadline:
+            response = HttpResponse("The original request is still being processed.", status=409)
+            response['Retry-After'] = '1'
+            return response
+        time.sleep(WAIT_INTERVAL)
+    return None
+
+
+def idempotent(view):
+    """
+    Makes a view answer repeated requests with the same idempotency key
+    from the stored response. Keys are scoped to the user, the method and
+    the path, and are bound to the parameters of the first request.
+    Requests without a key are not affected.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        client_key = _client_key(request)
+        if not client_key:
+            return view(request, *args, **kwargs)
+        if len(client_key) > MAX_KEY_LENGTH:
+            return HttpResponseBadRequest("Invalid idempotency key.")
+
+        scope = f'{request.user.pk}:{request.method}:{request.path}:{client_key}'
+        base = f'idempotency:{hashlib.sha256(scope.encode()).hexdigest()}'
+        response_key, lock_key = f'{base}:response', f'{base}:lock'
+        fingerprint_key, fingerprint = f'{base}:fingerprint', _fingerprint(request)
+
+        # The first request binds the key to its parameters.
+        cache.add(fingerprint_key, fingerprint, KEY_TIMEOUT)
+        if cache.get(fingerprint_key, fingerprint) != fingerprint:
+            return HttpResponse("The idempotency key was already used for a different request.", status=422)
+
+        stored = cache.get(response_key)
+        if stored is not None:
+            return _thaw(stored)
+        response = _wait_for_response(response_key, lock_key)
+        if response is not None:
+            return response
+
+        try:
+            # The first request may have finished between the lookup and the lock.
+            stored = cache.get(response_key)
+            if stored is not None:
+                return _thaw(stored)
+
+            response = view(request, *args, **kwargs)
+            if not response.streaming and 200 <= response.status_code < 400:
+                cache.set(response_key, _freeze(request, response), KEY_TIMEOUT)
+            return response
+        finally:
+            cache.delete(lock_key)
+
+    return wrapper
@@ -0,0 +1,157 @@
+import asyncio
+import datetime
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from courses.models import Course, CourseStudentStatus, MajorUnit, Semester, TimeSlots, Unit
+from courses.prerequisites import rebuild_closure
+from users.models import Instructor, Major, Student
+
+ENDPOINTS = [
+    'available_courses',
+    'other_courses',
+    'check_scores',
+    'student_weekly_program',
+    'payment_panel',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds a synthetic dataset in a throwaway test database and compares "
+        "requests per second and p99 latency of the student views served "
+        "through the WSGI handler from a thread pool and through the ASGI "
+        "handler, which runs the (sync) views in its thread executor."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=100)
+        parser.add_argument('--courses', type=int, default=1500)
+        parser.add_argument('--requests', type=int, default=500, help="Requests per handler.")
+        parser.add_argument('--concurrency', type=int, default=16)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(WAITING_ROOM={'ENABLED': False}, DEBUG=False):
+                students = self.build_dataset(options['students'], options['courses'])
+                paths = [reverse(name) for name in ENDPOINTS]
+                requests = [paths[i % len(paths)] for i in range(options['requests'])]
+
+                results = [
+                    ('sync (WSGI)', self.run_sync(students, requests, options['concurrency'])),
+                    ('async (ASGI)', asyncio.run(self.run_async(students, requests, options['concurrency']))),
+                ]
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"{'handler':<14}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for label, (elapsed, latencies) in results:
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(
+                f"{label:<14}{len(latencies):>10}{len(latencies) / elapsed:>10.1f}"
+                f"{statistics.median(latencies) * 1000:>10.1f}{p99 * 1000:>10.1f}"
+            )
+
+    def build_dataset(self, student_count, course_count):
+        semester = Semester.objects.create( # pyright: ignore
+            codename=4031,
+            start_date=datetime.date(2024, 9, 1),
+            end_date=datetime.date(2025, 1, 1),
+            active=True,
+        )
+        major = Major.objects.create(name="Benchmark", codename="BM") # pyright: ignore
+        instructor = Instructor.objects.create( # pyright: ignore
+            national_id="bench-instructor", username="bench-instructor", email="instructor@bench.local",
+            specialty="Benchmarks", academic_title=Instructor.AcademicTitle.PROFESSOR,
+        )
+        slots = TimeSlots.objects.bulk_create([ # pyright: ignore
+            TimeSlots(id=i + 1, day=i % 6, start_time=datetime.time(8 + 2 * (i // 6)),
+                      end_time=datetime.time(10 + 2 * (i // 6)))
+            for i in range(24)
+        ])
+        units = Unit.objects.bulk_create([ # pyright: ignore
+            Unit(name=f"Unit {i}", unit_size=3) for i in range(course_count)
+        ])
+        MajorUnit.objects.bulk_create([MajorUnit(major=major, unit=unit, state=1) for unit in units]) # pyright: ignore
+        Unit.prerequisites.through.objects.bulk_create([ # pyright: ignore
+            Unit.prerequisites.through(from_unit_id=unit.id, to_unit_id=units[i - 1].id)
+            for i, unit in enumerate(units) if i % 3
+        ])
+        rebuild_closure()
+        courses = Course.objects.bulk_create([ # pyright: ignore
+            Course(unit=unit, instructor=instructor, semester=semester, slots=60, price=1000)
+            for unit in units
+        ])
+        Course.time_slot.through.objects.bulk_create([ # pyright: ignore
+            Course.time_slot.through(course_id=course.id, timeslots_id=slots[i % len(slots)].id)
+            for i, course in enumerate(courses)
+        ])
+        for course in courses:
+            course.refresh_occupancy()
+
+        students = [
+            Student.objects.create( # pyright: ignore
+                national_id=f"bench-{i}", username=f"bench-{i}", email=f"{i}@bench.local",
+                gpa=0, major=major, first_semester=semester,
+            )
+            for i in range(student_count)
+        ]
+        CourseStudentStatus.objects.bulk_create([ # pyright: ignore
+            CourseStudentStatus(student=student, course=courses[(i * 7 + j) % course_count],
+                                paid=bool(j % 2), grade=15 if j == 0 else None, passed=j == 0)
+            for i, student in enumerate(students) for j in range(5)
+        ])
+        return students
+
+    def run_sync(self, students, requests, concurrency):
+        local = threading.local()
+        counter = iter(range(len(students) * 1000))
+        lock = threading.Lock()
+
+        def fetch(path):
+            if not hasattr(local, 'client'):
+                with lock:
+                    student = students[next(counter) % len(students)]
+                local.client = Client()
+                local.client.force_login(student)
+            start = time.perf_counter()
+            response = local.client.get(path)
+            assert response.status_code == 200, (path, response.status_code)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(fetch, requests))
+        return time.perf_counter() - start, latencies
+
+    async def run_async(self, students, requests, concurrency):
+        queue = asyncio.Queue()
+        for path in requests:
+            queue.put_nowait(path)
+        latencies = []
+
+        async def worker(student):
+            client = AsyncClient()
+            await client.aforce_login(student)
+            while not queue.empty():
+                path = queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.get(path)
+                assert response.status_code == 200, (path, response.status_code)
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(students[i % len(students)]) for i in range(concurrency)))
+        return time.perf_counter() - start, latencies
@@ -0,0 +1,47 @@
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import redirect
+from django.utils.deprecation import MiddlewareMixin
+from .waiting_room import check_admission, get_config, in_post_grace
+
+# Views of the waiting room itself and cheap polling endpoints are never queued.
+EXEMPT_URL_NAMES = {
+    'waiting_room', 'waiting_room_status',
+    'seat_availability', 'seat_stream', 'seat_updates',
+}
+
+
+class WaitingRoomMiddleware(MiddlewareMixin):
+    """
+    Sends students to the waiting room until their ticket is admitted.
+    Only the views of the `student` app are guarded.
+
+    MiddlewareMixin keeps the middleware async-capable, so under ASGI the
+    async student views run on the server's event loop instead of being
+    pushed into a worker thread.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        config = get_config()
+        if not config['ENABLED'] or view_func.__module__ != 'student.views':
+            return None
+        if request.resolver_match.url_name in EXEMPT_URL_NAMES:
+            return None
+
+        if request.method == 'POST' and in_post_grace(request.session):
+            # The form was filled in while admitted; don't throw it away.
+            return None
+        position = check_admission(request.session)
+        if position == 0:
+            return None
+
+        wants_json = request.accepts('application/json') and not request.accepts('text/html')
+        if wants_json or request.method != 'GET':
+            # A redirect would drop whatever was submitted; ask the client to retry.
+            if wants_json:
+                response = JsonResponse({'admitted': False, 'position': position}, status=503)
+            else:
+                response = HttpResponse(f"Registration is busy, you are number {position} in the queue.", status=503)
+            response['Retry-After'] = str(config['POLL_INTERVAL'])
+            return response
+        request.session['waiting_room_next'] = request.get_full_path()
+        return redirect('waiting_room')
@@ -1,3 +1,391 @@
-from django.test import TestCase
+import datetime
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseRedirect
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from courses.models import Course, CourseStudentStatus, Semester, TimeSlots, Unit, WaitlistEntry
+from courses.registration import join_waitlist, pay_outstanding, register_student
+from courses.tests import CourseFixtureMixin, make_student
+from .idempotency import idempotent
+from .waiting_room import BaseQueueBackend, InProcessQueueBackend, reset_backend
+
+# Nobody is ever admitted from this queue.
+CLOSED_ROOM = {
+    'ENABLED': True,
+    'BACKEND': 'student.waiting_room.InProcessQueueBackend',
+    'ADMIT_RATE': 0,
+    'BURST': 0,
+}
+
+
+class QueueBackendTests(TestCase):
+    def test_backends_must_implement_the_queue(self):
+        with self.assertRaises(TypeError):
+            BaseQueueBackend(admit_rate=1, burst=1) # pyright: ignore
+
+    @mock.patch('student.waiting_room.time.monotonic')
+    def test_tickets_are_admitted_in_order_at_the_rate(self, monotonic):
+        monotonic.return_value = 100.0
+        backend = InProcessQueueBackend(admit_rate=2, burst=1)
+        tickets = [backend.join() for _ in range(4)]
+        self.assertEqual([backend.position(ticket) for ticket in tickets], [0, 1, 2, 3])
+        monotonic.return_value = 101.0
+        self.assertEqual([backend.position(ticket) for ticket in tickets], [0, 0, 0, 1])
+        self.assertIsNone(backend.position(99))
+
+
+@override_settings(WAITING_ROOM=CLOSED_ROOM)
+class WaitingRoomMiddlewareTests(TestCase):
+    def setUp(self):
+        reset_backend()
+        self.addCleanup(reset_backend)
+
+    def set_admitted_until(self, value):
+        session = self.client.session
+        session['waiting_room_admitted_until'] = value
+        session.save()
+
+    def test_pages_wait_in_the_room(self):
+        response = self.client.get(reverse('available_courses'))
+        self.assertRedirects(response, reverse('waiting_room'), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse('waiting_room_status')).json()['position'], 1)
+
+    def test_posts_are_not_redirected(self):
+        response = self.client.post(reverse('register_cart'), {'course_ids': [1]})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+
+    def test_posts_started_while_admitted_go_through(self):
+        self.set_admitted_until(time.time() - 60)
+        response = self.client.post(reverse('register_cart'), {'course_ids': [1]})
+        self.assertNotEqual(response.status_code, 503)
+        # Pages still wait once the admission is over.
+        self.assertRedirects(self.client.get(reverse('available_courses')), reverse('waiting_room'), fetch_redirect_response=False)
+
+        self.set_admitted_until(time.time() - 60 * 60)
+        self.assertEqual(self.client.post(reverse('register_cart')).status_code, 503)
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.response = HttpResponse("registered")
+
+        @idempotent
+        def view(request):
+            self.calls += 1
+            return self.response
+        self.view = view
+
+    def post(self, key='k1', **data):
+        request = RequestFactory().post('/register/', {'idempotency_key': key, **data})
+        request.user = SimpleNamespace(pk=1)
+        return self.view(request)
+
+    def test_successful_responses_are_replayed(self):
+        self.assertEqual(self.post(course_ids=[1]).content, b"registered")
+        replay = self.post(course_ids=[1])
+        self.assertEqual(replay.content, b"registered")
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.calls, 1)
+        self.post(key='k2', course_ids=[1])
+        self.assertEqual(self.calls, 2)
+
+    def test_redirects_are_replayed_with_their_cookies(self):
+        self.response = HttpResponseRedirect('/courses/')
+        self.response.set_cookie('messages', 'registered')
+        self.post()
+        replay = self.post()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(replay.status_code, 302)
+        self.assertEqual(replay['Location'], '/courses/')
+        self.assertEqual(replay.cookies['messages'].value, 'registered')
+
+    def test_client_errors_are_not_stored(self):
+        self.response = HttpResponse(status=400)
+        self.post()
+        self.post()
+        self.assertEqual(self.calls, 2)
+
+    def test_reusing_a_key_for_another_request_is_rejected(self):
+        self.post(course_ids=[1])
+        self.assertEqual(self.post(course_ids=[2]).status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    def test_duplicates_wait_for_the_running_request(self):
+        started, finish = threading.Event(), threading.Event()
+
+        @idempotent
+        def view(request):
+            self.calls += 1
+            started.set()
+            finish.wait(5)
+            return HttpResponse("registered")
+        self.view = view
+
+        first = threading.Thread(target=self.post, kwargs={'course_ids': [1]})
+        first.start()
+        started.wait(5)
+        threading.Timer(0.2, finish.set).start()
+        duplicate = self.post(course_ids=[1])
+        first.join()
+        self.assertEqual(duplicate.content, b"registered")
+        self.assertEqual(duplicate['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.calls, 1)
+
+    @mock.patch('student.idempotency.LOCK_WAIT', 0)
+    def test_duplicates_of_a_running_request_get_a_conflict(self):
+        duplicates = []
+
+        @idempotent
+        def view(request):
+            self.calls += 1
+            duplicates.append(self.post(course_ids=[1]))
+            return HttpResponse("registered")
+        self.view = view
+
+        self.post(course_ids=[1])
+        self.assertEqual(duplicates[0].status_code, 409)
+        self.assertEqual(duplicates[0]['Retry-After'], '1')
+        self.assertEqual(self.calls, 1)
+
+class CartTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.course = self.make_course(slots=1)
+        monday = TimeSlots.Weekday.MONDAY
+        self.course.time_slot.add(TimeSlots.objects.create( # pyright: ignore
+            id=1, day=monday, start_time=datetime.time(8), end_time=datetime.time(10),
+        ))
+        self.networks = self.offer("Networks", TimeSlots.objects.create( # pyright: ignore
+            id=2, day=monday, start_time=datetime.time(10), end_time=datetime.time(12),
+        ))
+        self.compilers = self.offer("Compilers", TimeSlots.objects.create( # pyright: ignore
+            id=3, day=monday, start_time=datetime.time(9), end_time=datetime.time(11),
+        ))
+        self.student = make_student(self.major, 0)
+        self.client.force_login(self.student)
+
+    def offer(self, name, slot):
+        course = Course.objects.create( # pyright: ignore
+            unit=Unit.objects.create(name=name, unit_size=3), # pyright: ignore
+            instructor=self.course.instructor, semester=self.semester, slots=10, price=100,
+        )
+        course.time_slot.add(slot)
+        return course
+
+    def post(self, *courses, **extra):
+        return self.client.post(reverse('register_cart'), {'course_ids': [course.pk for course in courses]}, **extra)
+
+    def registered(self):
+        return set(CourseStudentStatus.objects.filter(student=self.student).values_list('course_id', flat=True)) # pyright: ignore
+
+    def test_cart_is_registered(self):
+        response = self.post(self.course, self.networks)
+        self.assertRedirects(response, reverse('available_courses'), fetch_redirect_response=False)
+        self.assertEqual(self.registered(), {self.course.pk, self.networks.pk})
+        self.assertIn("2 courses", str(list(get_messages(response.wsgi_request))[0]))
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 1)
+
+    def test_a_full_course_registers_nothing(self):
+        register_student(make_student(self.major, 1), self.course)
+        response = self.post(self.course, self.networks)
+        self.assertEqual(self.registered(), set())
+        self.assertEqual(
+            [str(message) for message in get_messages(response.wsgi_request)],
+            [f"Course {self.course.pk}: Course is full."],
+        )
+        self.networks.refresh_from_db()
+        self.assertEqual(self.networks.enrolled_count, 0)
+
+    def test_courses_in_the_cart_must_not_clash(self):
+        response = self.post(self.course, self.compilers, headers={'accept': 'application/json'})
+        self.assertEqual(response.json(), {
+            'registered': False,
+            'results': [
+                {'course_id': self.course.pk, 'ok': True, 'error': None},
+                {'course_id': self.compilers.pk, 'ok': False, 'error': "Schedule conflict with another course."},
+            ],
+        })
+        self.assertEqual(self.registered(), set())
+
+    def test_json_response(self):
+        response = self.post(self.course, self.networks, headers={'accept': 'application/json'})
+        self.assertEqual(response.json(), {
+            'registered': True,
+            'results': [
+                {'course_id': self.course.pk, 'ok': True, 'error': None},
+                {'course_id': self.networks.pk, 'ok': True, 'error': None},
+            ],
+        })
+        self.assertEqual(self.registered(), {self.course.pk, self.networks.pk})
+
+
+class WaitlistViewTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.course = self.make_course(slots=1)
+        register_student(make_student(self.major, 0), self.course)
+        join_waitlist(make_student(self.major, 1), self.course)
+        self.student = make_student(self.major, 2)
+        self.client.force_login(self.student)
+
+    def test_selecting_a_full_course_joins_its_waitlist(self):
+        response = self.client.get(reverse('select_course', args=[self.course.pk]))
+        self.assertRedirects(response, reverse('available_courses'), fetch_redirect_response=False)
+        self.assertEqual(
+            [str(message) for message in get_messages(response.wsgi_request)],
+            ["Course is full. You are number 2 on its waitlist."],
+        )
+        self.assertEqual(self.client.get(reverse('waitlist_status')).json(), {
+            'waitlist': [{'course_id': self.course.pk, 'course': "Algorithms", 'position': 2}],
+        })
+
+    def test_retried_selection_replays_the_message(self):
+        url = reverse('select_course', args=[self.course.pk]) + '?idempotency_key=k1'
+        response = self.client.get(url)
+        replay = self.client.get(url)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay['Location'], reverse('available_courses'))
+        self.assertEqual(replay.cookies['messages'].value, response.cookies['messages'].value)
+        self.assertEqual(WaitlistEntry.objects.filter(student=self.student).count(), 1) # pyright: ignore
+
+    def test_position_and_leaving_in_the_course_list(self):
+        join_waitlist(self.student, self.course)
+        response = self.client.get(reverse('available_courses'))
+        self.assertEqual([entry.position for entry in response.context['waitlist']], [2])
+        leave_url = reverse('leave_waitlist', args=[self.course.pk])
+        self.assertContains(response, f'action="{leave_url}"')
+
+        self.assertEqual(self.client.get(leave_url).status_code, 405)
+        response = self.client.post(leave_url)
+        self.assertRedirects(response, reverse('available_courses'), fetch_redirect_response=False)
+        self.assertFalse(WaitlistEntry.objects.filter(student=self.student).exists()) # pyright: ignore
+        self.assertEqual(self.client.get(reverse('waitlist_status')).json(), {'waitlist': []})
+
+
+class SeatAvailabilityTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.course = self.make_course(slots=2)
+        self.client.force_login(make_student(self.major, 0))
+        self.url = reverse('seat_availability')
+
+    def test_json_body(self):
+        self.assertEqual(self.client.get(self.url).json(), {
+            'seats': {str(self.course.pk): {'slots': 2, 'enrolled': 0, 'remaining': 2}},
+        })
+        register_student(make_student(self.major, 1), self.course)
+        response = self.client.get(self.url, {'ids': f'{self.course.pk},'})
+        self.assertEqual(response.json()['seats'][str(self.course.pk)], {'slots': 2, 'enrolled': 1, 'remaining': 1})
+        self.assertEqual(self.client.get(self.url, {'ids': 'x'}).status_code, 400)
+
+    def test_unchanged_seats_are_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_registering_and_dropping_change_the_etag(self):
+        etags = [self.client.get(self.url)['ETag']]
+        with self.captureOnCommitCallbacks(execute=True):
+            status = register_student(make_student(self.major, 1), self.course)
+        etags.append(self.client.get(self.url)['ETag'])
+        with self.captureOnCommitCallbacks(execute=True):
+            status.delete()
+        response = self.client.get(self.url, headers={'if-none-match': etags[-1]})
+        self.assertEqual(response.status_code, 200)
+        etags.append(response['ETag'])
+        self.assertEqual(len(set(etags)), 3)
+        self.assertEqual(response.json()['seats'][str(self.course.pk)]['enrolled'], 0)
+
+
+class PaymentTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.course = self.make_course(slots=10)
+        monday = TimeSlots.Weekday.MONDAY
+        self.course.time_slot.add(TimeSlots.objects.create( # pyright: ignore
+            id=1, day=monday, start_time=datetime.time(8), end_time=datetime.time(10),
+        ))
+        self.networks = self.offer("Networks", TimeSlots.objects.create( # pyright: ignore
+            id=2, day=monday, start_time=datetime.time(10), end_time=datetime.time(12),
+        ))
+        self.compilers = self.offer("Compilers", TimeSlots.objects.create( # pyright: ignore
+            id=3, day=monday, start_time=datetime.time(9), end_time=datetime.time(11),
+        ))
+        self.student = make_student(self.major, 0)
+        self.client.force_login(self.student)
+
+        self.paid_at = datetime.datetime(2024, 9, 2, tzinfo=datetime.timezone.utc)
+        graphics = self.offer("Graphics", TimeSlots.objects.create( # pyright: ignore
+            id=4, day=TimeSlots.Weekday.TUESDAY, start_time=datetime.time(8), end_time=datetime.time(10),
+        ))
+        self.paid = CourseStudentStatus.objects.create( # pyright: ignore
+            student=self.student, course=graphics, paid=True, registered_at=self.paid_at,
+        )
+        self.canceled = CourseStudentStatus.objects.create( # pyright: ignore
+            student=self.student, course=self.compilers, paid=False, canceled=True,
+        )
+        past = Semester.objects.create( # pyright: ignore
+            codename=4022, start_date=datetime.date(2024, 2, 1), end_date=datetime.date(2024, 6, 1), active=False,
+        )
+        self.past = CourseStudentStatus.objects.create( # pyright: ignore
+            student=self.student, paid=False,
+            course=Course.objects.create( # pyright: ignore
+                unit=self.course.unit, instructor=self.course.instructor, semester=past, slots=10, price=100,
+            ),
+        )
+        self.outstanding = [register_student(self.student, course) for course in (self.course, self.networks)]
+
+    def offer(self, name, slot):
+        course = Course.objects.create( # pyright: ignore
+            unit=Unit.objects.create(name=name, unit_size=3), # pyright: ignore
+            instructor=self.course.instructor, semester=self.semester, slots=10, price=100,
+        )
+        course.time_slot.add(slot)
+        return course
+
+    def paid_ids(self):
+        return set(CourseStudentStatus.objects.filter(student=self.student, paid=True).values_list('pk', flat=True)) # pyright: ignore
+
+    def test_only_outstanding_rows_are_paid(self):
+        response = self.client.post(reverse('payment_gateway_all'), {'payment_result': 'success'})
+        self.assertRedirects(response, reverse('payment_panel'), fetch_redirect_response=False)
+        self.assertEqual(self.paid_ids(), {self.paid.pk, *(status.pk for status in self.outstanding)})
+        self.paid.refresh_from_db()
+        self.assertEqual(self.paid.registered_at, self.paid_at)
+        for status in self.outstanding:
+            status.refresh_from_db()
+            self.assertIsNotNone(status.registered_at)
+
+    def test_a_clash_pays_nothing(self):
+        # Registered without the clash check, e.g. before a time slot was moved.
+        clashing = CourseStudentStatus.objects.create( # pyright: ignore
+            student=self.student, course=self.offer("Databases", TimeSlots.objects.get(pk=3)), paid=False, # pyright: ignore
+        )
+        paid, results = pay_outstanding(self.student)
+        self.assertFalse(paid)
+        self.assertEqual(results[clashing], "Schedule conflict with another course.")
+        self.assertEqual([error for status, error in results.items() if status != clashing], [None, None])
+
+        response = self.client.post(reverse('payment_gateway_all'), {'payment_result': 'success'})
+        self.assertRedirects(response, reverse('payment_gateway_all'), fetch_redirect_response=False)
+        self.assertEqual(self.paid_ids(), {self.paid.pk})
+
+    def test_panel_reads_the_registrations_in_one_query(self):
+        # The session, the user with their profile, and the registrations.
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('payment_panel'))
+        self.assertEqual(response.context['failed_transactions'], self.outstanding)
+        self.assertEqual(response.context['succeeded_transactions'], [self.paid])
+        self.assertEqual(response.context['outstanding_total'], 200)
@@ -8,6 +8,14 @@ urlpatterns = [
     path('available-courses/', views.available_courses, name='available_courses'),
     path('other-courses/', views.other_courses, name='other_courses'),
     path('select-course/<int:course_id>/', views.select_course, name='select_course'),
+    path('register-cart/', views.register_cart, name='register_cart'),
+    path('seats/', views.seat_availability, name='seat_availability'),
+    path('seats/stream/', views.seat_stream, name='seat_stream'),
+    path('seats/updates/', views.seat_updates, name='seat_updates'),
+
+    # Waitlist
+    path('waitlist/', views.waitlist_status, name='waitlist_status'),
+    path('waitlist/<int:course_id>/leave/', views.leave_waitlist, name='leave_waitlist'),
     
     # Scores
     path('scores/', views.check_scores, name='check_scores'),
@@ -16,7 +24,12 @@ urlpatterns = [
     path("payments/", views.payment_panel, name="payment_panel"),
     path("payments/<int:css_id>/", views.payment_panel, name="payment_checkout"),
     path('payment/gateway/<int:css_id>/', views.payment_gateway, name='payment_gateway'),
+    path('payment/gateway/all/', views.payment_gateway_all, name='payment_gateway_all'),
 
     #weekly-program
     path('weekly-program/', views.student_weekly_program, name='student_weekly_program'),
+
+    # Waiting room
+    path('waiting-room/', views.waiting_room, name='waiting_room'),
+    path('waiting-room/status/', views.waiting_room_status, name='waiting_room_status'),
 ]
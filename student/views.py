@@ -1,122 +1,261 @@
+import asyncio
+import json
+
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+from django.db import transaction
 from django.db.models import Prefetch, Count, Sum
-from courses.models import Course, CourseStudentStatus, MajorUnit, Unit, TimeSlots
+from courses.models import Course, CourseStudentStatus, MajorUnit, Unit, TimeSlots, WaitlistEntry
+from courses.eligibility import eligible_courses
+from courses.exceptions import CourseFull, RegistrationError, ScheduleConflict
+from courses.registration import join_waitlist, pay_outstanding, register_checked, register_courses, waitlist_positions
+from courses.catalog import catalog_version
+from courses.seat_events import publisher as seat_publisher
+from courses.seats import seats_version
+from courses.state import load_registration_state
+from .idempotency import idempotent, new_key
+from .waiting_room import check_admission, get_config as get_waiting_room_config
 from django.core.exceptions import ObjectDoesNotExist
+from users.models import Student
+
+def _as_student(profile):
+    if not isinstance(profile, Student):
+        raise Student.DoesNotExist("The user is not a student.")
+    return profile
+
+def get_student(request):
+    """The logged in student, loaded with the user by users.middleware."""
+    return _as_student(request.profile)
 
 @login_required(login_url="login")
 def available_courses(request):
-    student = request.user.student
-    major_units = Unit.objects.filter(majors=student.major) # pyright: ignore
-    available_courses = Course.objects.filter(unit__in=major_units, semester__active=True) # pyright: ignore
-    selected_course_ids = list(CourseStudentStatus.objects.filter( # pyright: ignore
-        student=student,
-    ).values_list('course_id', flat=True))
-    passed_course_statuses = CourseStudentStatus.objects.filter(
-        student=student,
-        passed=True # pyright: ignore
-    ).select_related('course__unit')
-
-    passed_unit_ids = set()
-    for status in passed_course_statuses:
-        if status.course and status.course.unit:
-             passed_unit_ids.add(status.course.unit.id)
-
-    eligible_courses = []
-    for course in available_courses:
-        unit = course.unit
-        if unit:
-            prereq_unit_ids = set(unit.prerequisites.values_list('id', flat=True)) # pyright: ignore
-            if prereq_unit_ids.issubset(passed_unit_ids):
-                eligible_courses.append(course)
+    student = get_student(request)
+    eligible, selected_course_ids = eligible_courses(student)
 
     return render(request, "student/available_courses.html", {
-        "available_courses": eligible_courses, # Pass only eligible courses
-        "selected_course_ids": selected_course_ids
+        "available_courses": eligible, # Pass only eligible courses
+        "selected_course_ids": selected_course_ids,
+        "waitlist": waitlist_positions(student),
+        "idempotency_key": new_key(),
     })
 
 @login_required(login_url="login")
 def other_courses(request):
-    student = request.user.student
-    taken_courses = CourseStudentStatus.objects.filter(student=student).values_list("course_id", flat=True) # pyright: ignore
-    other_courses_queryset = Course.objects.filter( # pyright: ignore
-        unit__majors=student.major,
-        semester__active=True
-    ).exclude(id__in=taken_courses)
-
-    passed_course_statuses = CourseStudentStatus.objects.filter(   # pyright: ignore
-        student=student,
-        passed=True # pyright: ignore
-    ).select_related('course__unit')
-
-    passed_unit_ids = set()
-    for status in passed_course_statuses:
-        if status.course and status.course.unit:
-             passed_unit_ids.add(status.course.unit.id)
-
-    eligible_other_courses = []
-    for course in other_courses_queryset:
-        unit = course.unit
-        if unit:
-            prereq_unit_ids = set(unit.prerequisites.values_list('id', flat=True)) # pyright: ignore
-            if prereq_unit_ids.issubset(passed_unit_ids):
-                eligible_other_courses.append(course)
-
-    selected_course_ids = list(taken_courses) 
+    student = get_student(request)
+    eligible_other, selected_course_ids = eligible_courses(student, exclude_taken=True)
 
     return render(request, "student/other_courses.html", {
-        "other_courses": eligible_other_courses, # Pass only eligible courses
-        "selected_course_ids": selected_course_ids
+        "other_courses": eligible_other, # Pass only eligible courses
+        "selected_course_ids": selected_course_ids,
+        "idempotency_key": new_key(),
     })
 
 @login_required(login_url="login")
+@idempotent
 def select_course(request, course_id):
-    student = request.user.student
+    student = get_student(request)
     course = get_object_or_404(Course, id=course_id)
 
-    # 1. Already registered
-    if CourseStudentStatus.objects.filter(student=student, course=course).exists():
-        messages.error(request, "You are already registered in this course.")
+    # Passed units, clashes, capacity and duplicates are all checked in
+    # the registering transaction.
+    try:
+        register_checked(student, course)
+    except ScheduleConflict as e:
+        messages.error(request, str(e))
+        return redirect("student_weekly_program")
+    except CourseFull:
+        position = join_waitlist(student, course)
+        messages.info(request, f"Course is full. You are number {position} on its waitlist.")
         return redirect("available_courses")
-
-    # 2. Course full
-    current_enrolled = CourseStudentStatus.objects.filter(course=course).count()
-    if current_enrolled >= course.slots:
-        messages.error(request, "Course is full.")
+    except RegistrationError as e:
+        messages.error(request, str(e))
         return redirect("available_courses")
 
-    # 3. Already passed this course
-    if CourseStudentStatus.objects.filter(student=student, course__unit=course.unit, passed=True).exists():
-        messages.error(request, "You have already passed this course.")
-        return redirect("available_courses")
+    messages.success(request, f"You have successfully registered for {course.unit.name}!")
+    return redirect("available_courses")
 
-    # 4. Check for schedule conflicts
-    course_times = set(course.time_slot.all())  # Course has ManyToMany with TimeSlots
+@login_required(login_url="login")
+@require_POST
+@idempotent
+def register_cart(request):
+    student = get_student(request)
+    try:
+        course_ids = [int(pk) for pk in request.POST.getlist("course_ids")]
+    except ValueError:
+        return HttpResponseBadRequest("Invalid course id.")
 
-    for css in CourseStudentStatus.objects.filter(student=student, course__semester__active=True):
-        registered_times = set(css.course.time_slot.all())
-        if course_times & registered_times:
-            messages.error(request, "Schedule conflict with another course.")
-            return redirect("student_weekly_program")
+    if not course_ids:
+        registered, results = False, {}
+        messages.error(request, "No course was selected.")
+    else:
+        try:
+            registered, results = register_courses(student, course_ids)
+        except RegistrationError as e:
+            registered, results = False, {pk: str(e) for pk in course_ids}
+
+    if request.accepts("application/json") and not request.accepts("text/html"):
+        return JsonResponse({
+            "registered": registered,
+            "results": [
+                {"course_id": pk, "ok": error is None, "error": error}
+                for pk, error in results.items()
+            ],
+        })
+
+    if registered:
+        messages.success(request, f"You have successfully registered for {len(results)} courses!")
+    for pk, error in results.items():
+        if error:
+            messages.error(request, f"Course {pk}: {error}")
+    return redirect("available_courses")
 
-    # 5. Register student
-    CourseStudentStatus.objects.create(
-        student=student,
-        course=course,
-        paid=False,
-        canceled=False
-    )
+@login_required(login_url="login")
+def waitlist_status(request):
+    student = get_student(request)
+    return JsonResponse({
+        "waitlist": [
+            {
+                "course_id": entry.course_id,
+                "course": entry.course.unit.name if entry.course.unit else None,
+                "position": entry.position,
+            }
+            for entry in waitlist_positions(student)
+        ],
+    })
 
-    messages.success(request, f"You have successfully registered for {course.unit.name}!")
+@login_required(login_url="login")
+@require_POST
+def leave_waitlist(request, course_id):
+    student = get_student(request)
+    WaitlistEntry.objects.filter(student=student, course_id=course_id).delete() # pyright: ignore
+    messages.success(request, "You have left the waitlist.")
     return redirect("available_courses")
 
+## Seat availability
+def seat_availability_etag(request):
+    # Seat counts change with enrolled_count, capacity with the catalog.
+    return f"{seats_version()}.{catalog_version()}"
+
+@condition(etag_func=seat_availability_etag)
+@cache_control(private=True, no_cache=True)
+@login_required(login_url="login")
+def seat_availability(request):
+    """
+    Remaining seats for `?ids=1,2,3`, or for the whole active semester.
+    Unchanged data is answered with a 304 from the cache alone.
+    """
+    courses = Course.objects.all() # pyright: ignore
+    ids = request.GET.get("ids")
+    if ids:
+        try:
+            courses = courses.filter(pk__in=[int(pk) for pk in ids.split(",") if pk])
+        except ValueError:
+            return HttpResponseBadRequest("Invalid course id.")
+    else:
+        courses = courses.filter(semester__active=True)
+
+    return JsonResponse({
+        "seats": {
+            pk: {"slots": slots, "enrolled": enrolled, "remaining": max(slots - enrolled, 0)}
+            for pk, slots, enrolled in courses.values_list("id", "slots", "enrolled_count")
+        },
+    })
+
+## Live seat counts
+SSE_KEEPALIVE_SECONDS = 15
+LONG_POLL_SECONDS = 25
+
+async def _remaining_seats():
+    return {
+        pk: max(slots - enrolled, 0)
+        async for pk, slots, enrolled in Course.objects.filter( # pyright: ignore
+            semester__active=True
+        ).values_list("id", "slots", "enrolled_count")
+    }
+
+def _sse_message(seq, seats):
+    return f"id: {seq}\nevent: seats\ndata: {json.dumps({'seq': seq, 'seats': seats})}\n\n"
+
+@login_required(login_url="login")
+async def seat_stream(request):
+    """
+    Server-sent events with the remaining seats of the active semester:
+    a full snapshot on connect (or the missed events after Last-Event-ID),
+    then one event per published change.
+    """
+    try:
+        last_seq = int(request.headers.get("Last-Event-ID", ""))
+    except ValueError:
+        last_seq = None
+
+    async def events():
+        # Subscribe first, so nothing published while loading the snapshot is lost.
+        queue = seat_publisher.subscribe()
+        try:
+            backlog = seat_publisher.events_since(last_seq) if last_seq is not None else None
+            if backlog is None:
+                seq = seat_publisher.seq
+                yield _sse_message(seq, await _remaining_seats())
+            else:
+                for event in backlog:
+                    yield _sse_message(event.seq, event.seats)
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse_message(event.seq, event.seats)
+        finally:
+            seat_publisher.unsubscribe(queue)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+@login_required(login_url="login")
+async def seat_updates(request):
+    """
+    Long-poll fallback for seat_stream. Without `since` it returns the full
+    counts; otherwise it waits for changes after `since` and returns them merged.
+    """
+    try:
+        since = int(request.GET["since"])
+    except (KeyError, ValueError):
+        since = None
+
+    queue = seat_publisher.subscribe()
+    try:
+        events = seat_publisher.events_since(since) if since is not None else None
+        if events is None:
+            seq = seat_publisher.seq
+            return JsonResponse({"seq": seq, "seats": await _remaining_seats(), "full": True})
+        if not events:
+            try:
+                events = [await asyncio.wait_for(queue.get(), LONG_POLL_SECONDS)]
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        seat_publisher.unsubscribe(queue)
+
+    seats = {}
+    for event in events:
+        seats.update(event.seats)
+    return JsonResponse({"seq": events[-1].seq if events else since, "seats": seats, "full": False})
+
 ## Checking Scores
 @login_required(login_url="login")
 def check_scores(request):
-    student = request.user.student
+    student = get_student(request)
     
-    scores = CourseStudentStatus.objects.filter(student=student).select_related('course__unit', 'course__instructor')
+    scores = CourseStudentStatus.objects.filter(student=student).select_related('course__unit', 'course__instructor', 'course__semester')
 
     passed_units_size = CourseStudentStatus.objects.filter(
         student=student,
@@ -124,6 +263,7 @@ def check_scores(request):
     ).aggregate(total_size=Sum('course__unit__unit_size'))['total_size'] or 0
 
     return render(request, 'student/scores.html', {
+        'student': student,
         'scores': scores,
         'passed_units_size': passed_units_size,
     })
@@ -131,7 +271,7 @@ def check_scores(request):
 ## Canceling Courses     !LATER!
 '''
 def cancel_course(request, css_id):
-    student = request.user.student
+    student = get_student(request)
     course_status = get_object_or_404(CourseStudentStatus, id=css_id, student=student)
 
     if course_status.canceled:
@@ -149,7 +289,7 @@ def cancel_course(request, css_id):
 @login_required(login_url="login")
 def student_weekly_program(request):
 
-    student_profile = request.user.student
+    student_profile = get_student(request)
 
     enrolled_courses = CourseStudentStatus.objects.filter(
         student=student_profile,
@@ -171,13 +311,15 @@ def student_weekly_program(request):
 @login_required(login_url="login")
 def payment_panel(request, css_id=None):
     try:
-        student = request.user.student
+        student = get_student(request)
     except ObjectDoesNotExist:
         messages.error(request, "⚠️ شما به عنوان دانشجو ثبت‌نام نشده‌اید. لطفاً ابتدا پروفایل دانشجویی خود را تکمیل کنید.")
         return redirect("hub")
     # --- Handle a checkout (if css_id provided) ---
     if css_id:
-        course_status = get_object_or_404(CourseStudentStatus, id=css_id, student=student)
+        course_status = get_object_or_404(
+            CourseStudentStatus.objects.select_related("course__unit"), id=css_id, student=student
+        )
         if course_status.paid:
             messages.info(request, "You have already paid for this course.")
         else:
@@ -188,24 +330,20 @@ def payment_panel(request, css_id=None):
         return redirect("payment_panel")  # refresh the page
 
     # --- Prepare lists ---
-    failed_transactions = CourseStudentStatus.objects.filter(
+    transactions = list(CourseStudentStatus.objects.filter(
         student=student,
-        paid=False,
         course__semester__active=True,
         canceled=False
-    ).select_related("course__unit", "course__instructor__user_ptr", "course__semester")
+    ).select_related("course__unit", "course__instructor__user_ptr", "course__semester").order_by("paid", "id"))
 
-    succeeded_transactions = CourseStudentStatus.objects.filter(
-        student=student,
-        paid=True,
-        course__semester__active=True,
-        canceled=False
-    ).select_related("course__unit", "course__instructor__user_ptr", "course__semester")
+    failed_transactions = [css for css in transactions if not css.paid]
+    succeeded_transactions = [css for css in transactions if css.paid]
 
     return render(request, "student/payment_panel.html", {
         "student": student,
         "failed_transactions": failed_transactions,
         "succeeded_transactions": succeeded_transactions,
+        "outstanding_total": sum(css.course.price for css in failed_transactions),
     })
 
 
@@ -213,8 +351,9 @@ def payment_panel(request, css_id=None):
 from django.utils import timezone
 
 @login_required(login_url="login")
+@idempotent
 def payment_gateway(request, css_id):
-    student = request.user.student
+    student = get_student(request)
     course_status = get_object_or_404(CourseStudentStatus, id=css_id, student=student)
 
     if course_status.paid:
@@ -227,31 +366,19 @@ def payment_gateway(request, css_id):
         payment_result = request.POST.get("payment_result")
 
         if payment_result == "success":
-            enrolled_courses = CourseStudentStatus.objects.filter(
-                student=student,
-                course__semester__active=True,
-                paid=True,
-                canceled=False
-            ).exclude(course=course).select_related('course')
-
-            has_conflict = False
-            current_times = set(course.time_slot.all())
-
-            for css in enrolled_courses:
-                other_times = set(css.course.time_slot.all())
-                if current_times & other_times: 
-                    has_conflict = True
-                    break
+            with transaction.atomic():
+                # Read from the database, not the cached state, see courses.state.
+                state = load_registration_state(student)
+                has_conflict = bool(course.occupancy & state.occupied_mask(exclude_course_id=course.id, paid_only=True))
+                if not has_conflict:
+                    course_status.paid = True
+                    course_status.registered_at = timezone.now()
+                    course_status.save()
 
             if has_conflict:
                 messages.error(request, "❌ تداخل زمانی با یک یا چند درس ثبت‌نام شده دارید.")
                 return redirect('payment_gateway', css_id=css_id)
 
-    
-            course_status.paid = True
-            course_status.registered_at = timezone.now()
-            course_status.save()
-
             messages.success(request, f"✅ پرداخت شما برای «{course.unit.name}» با موفقیت انجام شد.")
             return redirect('payment_panel')
 
@@ -262,4 +389,61 @@ def payment_gateway(request, css_id):
     return render(request, 'student/payment_gateway.html', {
         'course': course,
         'css_id': css_id,
+        'idempotency_key': new_key(),
+    })
+
+
+@login_required(login_url="login")
+@idempotent
+def payment_gateway_all(request):
+    student = get_student(request)
+    statuses = list(CourseStudentStatus.objects.filter(
+        student=student,
+        paid=False,
+        canceled=False,
+        course__semester__active=True
+    ).select_related('course__unit'))
+
+    if not statuses:
+        messages.info(request, "هیچ پرداخت معوقی ندارید.")
+        return redirect('payment_panel')
+
+    if request.method == "POST":
+        payment_result = request.POST.get("payment_result")
+
+        if payment_result == "success":
+            paid, results = pay_outstanding(student)
+            if paid:
+                messages.success(request, f"✅ پرداخت {len(results)} درس با موفقیت انجام شد.")
+                return redirect('payment_panel')
+
+            for course_status, error in results.items():
+                if error:
+                    messages.error(request, f"❌ {course_status.course.unit.name}: {error}")
+            return redirect('payment_gateway_all')
+
+        elif payment_result == "failure":
+            messages.error(request, "❌ پرداخت ناموفق بود. لطفاً دوباره تلاش کنید.")
+            return redirect('payment_gateway_all')
+
+    return render(request, 'student/payment_gateway.html', {
+        'statuses': statuses,
+        'total': sum(css.course.price for css in statuses),
+        'idempotency_key': new_key(),
+    })
+
+
+## Waiting Room
+def waiting_room(request):
+    return render(request, 'student/waiting_room.html', {
+        'poll_interval': get_waiting_room_config()['POLL_INTERVAL'],
+    })
+
+def waiting_room_status(request):
+    """Cheap polling endpoint: touches the session and the queue backend only."""
+    position = check_admission(request.session)
+    return JsonResponse({
+        'admitted': position == 0,
+        'position': position,
+        'next': request.session.get('waiting_room_next') or reverse('available_courses'),
     })
@@ -0,0 +1,181 @@
+"""
+Waiting room in front of the student registration views.
+
+Every student that reaches a guarded view without a valid admission gets
+a ticket. Tickets are admitted strictly in order at `ADMIT_RATE` tickets
+per second, with up to `BURST` tickets let through at once when the room
+is quiet, so the load on the registration views stays bounded however
+many students arrive at the same moment.
+
+The queue state lives in a backend, chosen with the `BACKEND` key of the
+`WAITING_ROOM` setting. `InProcessQueueBackend` keeps it in memory and is
+meant for a single process and for tests: with several workers each one
+runs its own queue, and the real admit rate is `ADMIT_RATE` times the
+number of workers. `CacheQueueBackend` keeps it in Django's cache, so
+workers share one queue as long as that cache is shared too (not
+LocMemCache).
+
+A student whose admission runs out in the middle of a form may still
+submit it for `POST_GRACE` seconds; other POSTs without an admission get
+a 503 with Retry-After rather than a redirect that would drop the data.
+"""
+import threading
+from abc import ABC, abstractmethod
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+DEFAULTS = {
+    'ENABLED': False,
+    'BACKEND': 'student.waiting_room.InProcessQueueBackend',
+    'ADMIT_RATE': 20,        # tickets admitted per second
+    'BURST': 50,             # tickets admitted at once when the queue is empty
+    'ADMISSION_TTL': 15 * 60,  # seconds an admitted student may use the views
+    'POLL_INTERVAL': 3,      # seconds between status polls
+    'POST_GRACE': 5 * 60,    # seconds after the admission a started POST is still let in
+    'CACHE_ALIAS': 'default',
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'WAITING_ROOM', {})}
+
+
+class BaseQueueBackend(ABC):
+    """
+    Ordered token bucket. `issued` is the last ticket handed out and
+    `admitted` the highest ticket allowed in; `admitted` grows by
+    `admit_rate` per second and never gets more than `burst` ahead of
+    `issued`.
+    """
+
+    def __init__(self, admit_rate, burst, **options):
+        self.admit_rate = admit_rate
+        self.burst = burst
+
+    def advance(self, state, now):
+        issued, admitted, updated = state
+        admitted = min(issued + self.burst, admitted + (now - updated) * self.admit_rate)
+        return issued, admitted, now
+
+    @abstractmethod
+    def join(self):
+        """Hands out the next ticket."""
+
+    @abstractmethod
+    def position(self, ticket):
+        """
+        Number of tickets ahead of `ticket` (0 once admitted), or None if
+        the ticket was not issued by this queue.
+        """
+
+    def _join(self, state, now):
+        issued, admitted, updated = self.advance(state, now)
+        return issued + 1, (issued + 1, admitted, updated)
+
+    def _position(self, state, ticket, now):
+        issued, admitted, updated = self.advance(state, now)
+        if ticket > issued:
+            return None, (issued, admitted, updated)
+        return max(0, ticket - int(admitted)), (issued, admitted, updated)
+
+
+class InProcessQueueBackend(BaseQueueBackend):
+    def __init__(self, admit_rate, burst, **options):
+        super().__init__(admit_rate, burst)
+        self._lock = threading.Lock()
+        self._state = (0, float(burst), time.monotonic())
+
+    def join(self):
+        with self._lock:
+            ticket, self._state = self._join(self._state, time.monotonic())
+            return ticket
+
+    def position(self, ticket):
+        with self._lock:
+            position, self._state = self._position(self._state, ticket, time.monotonic())
+            return position
+
+
+class CacheQueueBackend(BaseQueueBackend):
+    KEY = 'waiting_room:state'
+    LOCK_KEY = 'waiting_room:lock'
+    LOCK_TIMEOUT = 5
+
+    def __init__(self, admit_rate, burst, cache_alias='default', **options):
+        super().__init__(admit_rate, burst)
+        self.cache = caches[cache_alias]
+
+    def _update(self, func):
+        # cache.add is atomic on every shared backend, so it doubles as a lock.
+        while not self.cache.add(self.LOCK_KEY, 1, self.LOCK_TIMEOUT):
+            time.sleep(0.005)
+        try:
+            now = time.time()
+            state = self.cache.get(self.KEY) or (0, float(self.burst), now)
+            result, state = func(state, now)
+            self.cache.set(self.KEY, state, None)
+            return result
+        finally:
+            self.cache.delete(self.LOCK_KEY)
+
+    def join(self):
+        return self._update(self._join)
+
+    def position(self, ticket):
+        return self._update(lambda state, now: self._position(state, ticket, now))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            config = get_config()
+            _backend = import_string(config['BACKEND'])(
+                admit_rate=config['ADMIT_RATE'],
+                burst=config['BURST'],
+                cache_alias=config['CACHE_ALIAS'],
+            )
+        return _backend
+
+
+def reset_backend():
+    global _backend
+    with _backend_lock:
+        _backend = None
+
+
+def check_admission(session):
+    """
+    Returns 0 when the session may use the registration views, otherwise
+    its position in the queue. Joins the queue on first call.
+    """
+    config = get_config()
+    now = time.time()
+    if session.get('waiting_room_admitted_until', 0) > now:
+        return 0
+
+    backend = get_backend()
+    ticket = session.get('waiting_room_ticket')
+    position = backend.position(ticket) if ticket is not None else None
+    if position is None:
+        ticket = backend.join()
+        session['waiting_room_ticket'] = ticket
+        position = backend.position(ticket)
+
+    if position == 0:
+        session.pop('waiting_room_ticket', None)
+        session['waiting_room_admitted_until'] = now + config['ADMISSION_TTL']
+    return position
+
+
+def in_post_grace(session):
+    """Whether the session's admission ran out less than POST_GRACE seconds ago."""
+    admitted_until = session.get('waiting_room_admitted_until')
+    return admitted_until is not None and admitted_until + get_config()['POST_GRACE'] > time.time()
@@ -53,8 +53,17 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.ProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'student.middleware.WaitingRoomMiddleware',
+]
+
+# Sessions store the path of the backend that logged the user in, so
+# ModelBackend stays listed for the sessions it started.
+AUTHENTICATION_BACKENDS = [
+    'users.backends.ProfileBackend',
+    'django.contrib.auth.backends.ModelBackend',
 ]
 
 ROOT_URLCONF = 'student_registration.urls'
@@ -87,6 +96,27 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts and wait for it,
+            # instead of failing when concurrent registrations collide.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        'TEST': {
+            # A file database, so threaded tests share it with real locking.
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    }
+}
+
+# Registration state and the waiting room live in the cache. Point this at
+# a shared backend (Redis, Memcached) when running several processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
     }
 }
 
@@ -96,6 +126,19 @@ INTERNAL_IPS = [
     "127.0.0.1",
 ]
 
+# Waiting room in front of the student registration views, see
+# student/waiting_room.py for the available keys. Before enabling it on a
+# multi-worker deployment, point CACHES at a shared backend: the queue
+# lives in the cache, and a per-process queue multiplies ADMIT_RATE by
+# the number of workers.
+WAITING_ROOM = {
+    'ENABLED': False,
+    'BACKEND': 'student.waiting_room.CacheQueueBackend',
+    'ADMIT_RATE': 20,
+    'BURST': 50,
+    'ADMISSION_TTL': 15 * 60,
+}
+
 NPM_BIN_PATH = "/run/current-system/sw/bin/npm"
 
 # Password validation
@@ -0,0 +1,25 @@
+from django.contrib.auth.backends import ModelBackend
+
+from .models import User
+
+# Reverse one-to-one joins to every role's table: the user's concrete
+# profile is loaded by the same query as the user (see users.middleware).
+PROFILE_RELATED = ('student__major', 'student__first_semester', 'instructor', 'admin')
+
+
+class ProfileBackend(ModelBackend):
+    """ModelBackend that loads the session user together with their role profile."""
+
+    def get_user(self, user_id):
+        try:
+            user = User._default_manager.select_related(*PROFILE_RELATED).get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        try:
+            user = await User._default_manager.select_related(*PROFILE_RELATED).aget(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
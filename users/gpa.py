@@ -0,0 +1,90 @@
+"""
+Running GPA totals.
+
+Every student keeps the sum of grade × unit size (`gpa_points`) and of
+unit sizes (`gpa_units`) over their counted registrations: passed, graded
+and not canceled. Saving a CourseStudentStatus applies the difference it
+makes to these totals with one atomic UPDATE, so grading a course no
+longer rescans each student's history.
+
+recalculate_gpas() rebuilds the totals from scratch in a fixed number of
+queries. It is the verification path (`manage.py verify_gpa`) and is
+also used when unit sizes change.
+"""
+import math
+
+from django.db.models import F, FloatField, Sum
+from django.db.models.functions import Coalesce, NullIf
+
+
+def counted_grade(grade, passed, canceled):
+    """The grade a registration adds to the GPA, or None if it does not count."""
+    if passed and grade is not None and not canceled:
+        return grade
+    return None
+
+
+def apply_gpa_delta(student_id, points, units):
+    """Adds the deltas to the student's totals and updates their GPA in the same statement."""
+    from .models import Student
+
+    new_points = F('gpa_points') + points
+    new_units = F('gpa_units') + units
+    Student.objects.filter(pk=student_id).update( # pyright: ignore
+        gpa_points=new_points,
+        gpa_units=new_units,
+        gpa=Coalesce(new_points / NullIf(new_units, 0), 0.0, output_field=FloatField()),
+    )
+
+
+def gpa_totals(student_ids=None):
+    """{student_id: (points, units)} computed from the registrations with one query."""
+    from courses.models import CourseStudentStatus
+
+    rows = CourseStudentStatus.objects.filter( # pyright: ignore
+        passed=True,
+        grade__isnull=False,
+        canceled=False,
+        course__unit__unit_size__gt=0
+    )
+    if student_ids is not None:
+        rows = rows.filter(student_id__in=student_ids)
+
+    return {
+        student_id: (points, units)
+        for student_id, points, units in rows.values('student_id').annotate(
+            points=Sum(F('grade') * F('course__unit__unit_size'), output_field=FloatField()),
+            units=Sum('course__unit__unit_size'),
+        ).values_list('student_id', 'points', 'units')
+    }
+
+
+def recalculate_gpas(student_ids=None, fix=True):
+    """
+    Recomputes the totals and GPA of the given students (all of them by
+    default) from their registrations and compares them with the stored
+    values. With `fix`, the students that were off are corrected with a
+    bulk update. Returns the ids of those students.
+    """
+    from .models import Student
+
+    totals = gpa_totals(student_ids)
+    students = Student.objects.only('gpa', 'gpa_points', 'gpa_units') # pyright: ignore
+    if student_ids is not None:
+        students = students.filter(pk__in=student_ids)
+
+    stale = []
+    for student in students.iterator():
+        points, units = totals.get(student.pk, (0.0, 0))
+        gpa = points / units if units else 0.0
+        if (
+            student.gpa_units != units
+            or not math.isclose(student.gpa_points, points, abs_tol=1e-6)
+            or not math.isclose(student.gpa, gpa, abs_tol=1e-6)
+        ):
+            student.gpa_points, student.gpa_units, student.gpa = points, units, gpa
+            stale.append(student)
+
+    if fix and stale:
+        Student.objects.bulk_update(stale, ['gpa', 'gpa_points', 'gpa_units'], batch_size=500) # pyright: ignore
+    return [student.pk for student in stale]
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.student_import import CHUNK_SIZE, StudentImportError, import_students
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports students from a CSV file with national_id, email and major "
+        "columns (see users.student_import for the optional ones)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="The CSV file, UTF-8 encoded.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help=f"Rows written per transaction (default {CHUNK_SIZE}).")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Password hashing processes (default: one per CPU, 0: none).")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        started = time.monotonic()
+
+        def progress(result):
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f"{result.processed} rows read, {result.imported} imported, "
+                f"{len(result.errors)} errors ({result.processed / elapsed:.0f} rows/s)"
+            )
+
+        try:
+            lines = open(options['path'], encoding='utf-8-sig', newline='')
+        except OSError as e:
+            raise CommandError(f"Can't read {options['path']}: {e}")
+        try:
+            with lines:
+                result = import_students(
+                    lines, chunk_size=options['chunk_size'], workers=options['workers'], progress=progress,
+                )
+        except (StudentImportError, UnicodeDecodeError) as e:
+            raise CommandError(str(e))
+
+        for row_number, message in result.errors:
+            self.stdout.write(f"Row {row_number}: {message}")
+        style = self.style.SUCCESS if not result.errors else self.style.WARNING
+        self.stdout.write(style(f"Imported {result.imported} of {result.processed} students."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from users.gpa import recalculate_gpas
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes every student's GPA totals from their registrations and "
+        "reports the students whose incrementally maintained values are off."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Write the recomputed values back.")
+        parser.add_argument('--student', type=int, action='append', dest='students',
+                            help="Only check this student (by primary key); may be repeated.")
+
+    def handle(self, *args, **options):
+        stale = recalculate_gpas(options['students'], fix=options['fix'])
+        if not stale:
+            self.stdout.write(self.style.SUCCESS("All GPA totals are consistent."))
+            return
+
+        for pk in stale:
+            self.stdout.write(f"Student {pk}: stored GPA totals are off.")
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(stale)} students."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(stale)} students are off; run with --fix to correct them."))
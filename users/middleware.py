@@ -0,0 +1,60 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from .models import User
+
+PROFILE_ATTRIBUTES = {
+    User.Role.STUDENT: 'student',
+    User.Role.INSTRUCTOR: 'instructor',
+    User.Role.ADMIN: 'admin',
+}
+
+
+def _profile_attribute(user):
+    if user is None or isinstance(user, AnonymousUser) or not user.is_authenticated:
+        return None
+    return PROFILE_ATTRIBUTES.get(user.role)
+
+
+def get_profile(user):
+    """
+    The Student, Instructor or Admin row of the user, or None. Users
+    loaded by users.backends.ProfileBackend carry it already; others
+    cost one query.
+    """
+    attribute = _profile_attribute(user)
+    if attribute is None:
+        return None
+    try:
+        return getattr(user, attribute)
+    except User._meta.get_field(attribute).related_model.DoesNotExist:
+        return None
+
+
+async def aget_profile(user):
+    attribute = _profile_attribute(user)
+    if attribute is not None and not User._meta.get_field(attribute).is_cached(user):
+        return await sync_to_async(get_profile)(user)
+    return get_profile(user)
+
+
+class ProfileMiddleware(MiddlewareMixin):
+    """
+    Sets request.profile, the concrete role object of the logged in user,
+    and request.aprofile() for async views. Must come after
+    AuthenticationMiddleware.
+    """
+
+    def process_request(self, request):
+        request.profile = SimpleLazyObject(lambda: get_profile(request.user))
+
+        async def aprofile():
+            user = await request.auser()
+            # auser() and the lazy request.user cache separately; share the
+            # loaded user so templates don't load it a second time.
+            request.user = user
+            return await aget_profile(user)
+
+        request.aprofile = aprofile
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:53
+
+from django.db import migrations, models
+
+
+def populate_gpa_totals(apps, schema_editor):
+    Student = apps.get_model('users', 'Student')
+    CourseStudentStatus = apps.get_model('courses', 'CourseStudentStatus')
+    totals = {}
+    for student_id, grade, unit_size in CourseStudentStatus.objects.filter(
+        passed=True, grade__isnull=False, canceled=False, course__unit__unit_size__gt=0
+    ).values_list('student_id', 'grade', 'course__unit__unit_size'):
+        points, units = totals.get(student_id, (0.0, 0))
+        totals[student_id] = (points + grade * unit_size, units + unit_size)
+    for student_id, (points, units) in totals.items():
+        Student.objects.filter(pk=student_id).update(gpa_points=points, gpa_units=units, gpa=points / units)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_waitlistentry'),
+        ('users', '0002_alter_student_options_remove_student_enrollment_year_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='gpa_points',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='gpa_units',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_gpa_totals, migrations.RunPython.noop),
+    ]
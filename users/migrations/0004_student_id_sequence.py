@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_student_gpa_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentIdSequence',
+            fields=[
+                ('prefix', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -2,6 +2,22 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from datetime import datetime
 
+
+def save_fields_without(instance, maintained, update_fields=None):
+    """
+    The update_fields for saving `instance` without writing back the
+    `maintained` fields, which are only changed with atomic updates. A
+    full save of a stale instance would otherwise overwrite them.
+    """
+    if update_fields is not None:
+        return update_fields
+    deferred = instance.get_deferred_fields()
+    return [
+        f.name for f in instance._meta.concrete_fields
+        if not f.primary_key and f.attname not in deferred
+        and f.name not in maintained
+    ]
+
 class Major(models.Model):
     name = models.CharField(max_length=255)
     codename = models.CharField(max_length=5, null=True)
@@ -9,6 +25,14 @@ class Major(models.Model):
     def __str__(self): # type: ignore 
         return self.name
 
+class StudentIdSequence(models.Model):
+    """Last sequence number handed out for a student ID prefix, see users.student_ids."""
+    prefix = models.CharField(max_length=10, primary_key=True)
+    last_value = models.PositiveIntegerField(default=0) # pyright: ignore
+
+    def __str__(self): # type: ignore 
+        return f"{self.prefix}: {self.last_value}"
+
 class User(AbstractUser):
     national_id = models.CharField(max_length=20, unique=True, null=False)
     phone_number = models.CharField(max_length=15, blank=True, null=True)
@@ -69,68 +93,48 @@ class Student(User):
     first_semester = models.ForeignKey("courses.Semester", on_delete=models.SET_NULL, null=True)
     student_id = models.CharField(max_length=15, unique=True, blank=True)
     gpa = models.FloatField()
+    # Running totals behind `gpa`, see users.gpa.
+    gpa_points = models.FloatField(default=0, editable=False)
+    gpa_units = models.PositiveIntegerField(default=0, editable=False)
     major = models.ForeignKey(Major, null=True, blank=True, on_delete=models.SET_NULL)
     funded = models.BooleanField(default=False) # type: ignore
     verified = models.BooleanField(default=False) # type: ignore
     
+    GPA_FIELDS = ('gpa', 'gpa_points', 'gpa_units')
+
     class Meta: # type: ignore 
         verbose_name = "Student"
         verbose_name_plural = "Students"
     
-    def generate_student_id(self):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._from_db = True
+        return instance
+
+    def student_id_prefix(self):
         if self.major:
             major_code = self.major.codename  # pyright: ignore
 
         year = str(self.first_semester.codename)[-3:-1] # pyright: ignore
         
-        prefix = f"{major_code}{year}" # pyright: ignore
-        last_student = Student.objects.filter(
-            student_id__startswith=prefix
-        ).order_by('-student_id').first()
-        
-        if last_student:
-            try:
-                last_sequence = int(last_student.student_id[len(prefix):])
-                sequence = last_sequence + 1
-            except (ValueError, IndexError):
-                sequence = 1
-        else:
-            sequence = 1
-        sequence_str = f"{sequence:04d}"
-        student_id = f"{prefix}{sequence_str}"
-        
-        return student_id
+        return f"{major_code}{year}" # pyright: ignore
+
+    def generate_student_id(self):
+        from .student_ids import reserve_student_ids
+        return reserve_student_ids(self.student_id_prefix())[0]
 
     def calculate_gpa(self):
-        try:
-            from courses.models import CourseStudentStatus
-            passed_courses_grades = CourseStudentStatus.objects.filter(         # pyright: ignore
-                student=self,
-                passed=True,
-                grade__isnull=False,
-                canceled=False
-            ).select_related('course__unit')
-
-            total_weighted_points = 0
-            total_units_attempted = 0
-
-            for status in passed_courses_grades:
-                unit_size = status.course.unit.unit_size if status.course and status.course.unit else 0
-                if unit_size > 0 and status.grade is not None:
-                    total_weighted_points += status.grade * unit_size
-                    total_units_attempted += unit_size
-
-            if total_units_attempted > 0:
-                new_gpa = total_weighted_points / total_units_attempted
-            else:
-                new_gpa = 0.0
-
-            if self.gpa != new_gpa:
-                self.gpa = new_gpa
-                self.save(update_fields=['gpa'])
-
-        except Exception as e:
-            print(f"Error calculating GPA for student {self.student_id if hasattr(self, 'student_id') else 'ID_NA'}: {e}")
+        """
+        Recomputes the GPA totals from scratch. The totals are kept up to
+        date incrementally by CourseStudentStatus.save(); this is the
+        on-demand verification path. Returns True if they were off.
+        """
+        from .gpa import recalculate_gpas
+        stale = bool(recalculate_gpas([self.pk]))
+        if stale:
+            self.refresh_from_db(fields=self.GPA_FIELDS)
+        return stale
 
     def save(self, *args, **kwargs):
         self.role = User.Role.STUDENT
@@ -139,4 +143,6 @@ class Student(User):
             self.first_semester = Semester.objects.filter(active=True).first() # pyright: ignore
         if not self.student_id:
             self.student_id = self.generate_student_id()
+        if getattr(self, '_from_db', False):
+            kwargs['update_fields'] = save_fields_without(self, self.GPA_FIELDS, kwargs.get('update_fields'))
         super().save(*args, **kwargs)
@@ -0,0 +1,60 @@
+"""
+Student ID allocation.
+
+A student ID is a prefix (major code and entry year, see
+Student.student_id_prefix) followed by a sequence number of at least
+SEQUENCE_DIGITS digits. Each prefix has a StudentIdSequence row holding
+the last number handed out. Taking numbers is one conditional UPDATE of
+that row, which the database serializes, so concurrent signups never
+get the same ID and the cost does not grow with the number of students.
+
+Bulk imports reserve a whole block with one update. Numbers taken by a
+save that later fails are not reused; IDs may have gaps but never repeat.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Student, StudentIdSequence
+
+SEQUENCE_DIGITS = 4
+
+
+def format_student_id(prefix, sequence):
+    return f"{prefix}{sequence:0{SEQUENCE_DIGITS}d}"
+
+
+def _last_issued(prefix):
+    """Highest sequence already used by a student with this prefix."""
+    last = 0
+    for student_id in Student.objects.filter(student_id__startswith=prefix).values_list('student_id', flat=True): # pyright: ignore
+        suffix = student_id[len(prefix):]
+        if suffix.isdigit():
+            last = max(last, int(suffix))
+    return last
+
+
+def _create_sequence(prefix):
+    # Prefixes that predate the counter table start after their highest
+    # existing ID; that scan only ever happens once per prefix.
+    try:
+        with transaction.atomic():
+            StudentIdSequence.objects.create(prefix=prefix, last_value=_last_issued(prefix)) # pyright: ignore
+    except IntegrityError:
+        pass  # Another request created it first.
+
+
+def reserve_student_ids(prefix, count=1):
+    """
+    Takes the next `count` sequence numbers of the prefix and returns the
+    corresponding student IDs in order.
+    """
+    if count < 1:
+        return []
+    with transaction.atomic():
+        sequences = StudentIdSequence.objects.filter(prefix=prefix) # pyright: ignore
+        if not sequences.update(last_value=F('last_value') + count):
+            _create_sequence(prefix)
+            sequences.update(last_value=F('last_value') + count)
+        # The row stays locked by the update until the transaction ends.
+        last = sequences.values_list('last_value', flat=True).get()
+    return [format_student_id(prefix, sequence) for sequence in range(last - count + 1, last + 1)]
@@ -0,0 +1,269 @@
+"""
+Bulk student import.
+
+A CSV with one student per row is streamed in chunks of `chunk_size`
+rows. Each chunk is validated against the database with a handful of
+queries, its passwords are hashed in a process pool, its student IDs are
+reserved as one block per prefix (see users.student_ids), and the parent
+User rows are written with one batched insert and the child Student
+rows with one executemany, in one transaction. Rows that fail validation are reported with
+their row number and skipped; the other rows of the file are imported.
+
+Columns (the header row names them, in any order):
+
+    national_id, email, major            required; major is the major's codename
+    first_name, last_name, phone_number  optional
+    username                             optional, defaults to national_id
+    first_semester                       optional codename, defaults to the active semester
+    funded                               optional, yes/true/1
+    password                             optional; rows without one get an unusable password.
+                                         Only the management command takes it, see import_students().
+
+bulk_create bypasses save() and the model signals, so everything those
+would do for a signup is done here explicitly: role, username, student
+ID, GPA totals and the admin search index.
+"""
+import csv
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, connection, transaction
+
+from courses.models import Semester
+from .models import Major, Student, User
+from .student_ids import reserve_student_ids
+
+CHUNK_SIZE = 1000
+REQUIRED_COLUMNS = ('national_id', 'email', 'major')
+UNIQUE_FIELDS = ('national_id', 'email', 'username')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'بله'}
+
+
+class StudentImportError(Exception):
+    """The file can't be read as a student sheet at all."""
+
+
+class ImportResult:
+    def __init__(self):
+        self.processed = 0
+        self.imported = 0
+        self.errors = []
+        self.student_ids = []
+
+    def error(self, row_number, message):
+        self.errors.append((row_number, message))
+
+
+def _init_worker():
+    # Forked workers inherit the configured project; spawned ones don't.
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+class PasswordHasher:
+    """
+    Hashes passwords in a process pool, which is only started once a
+    chunk has passwords to hash. With workers=0 they are hashed in this
+    process.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self.pool = None
+
+    def hash(self, passwords):
+        given = [password for password in passwords if password]
+        if self.workers == 0 or not given:
+            hashed = iter([make_password(password) for password in given])
+        else:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+            hashed = self.pool.map(make_password, given, chunksize=max(len(given) // 64, 1))
+        # Rows without a password get an unusable one.
+        return [next(hashed) if password else make_password(None) for password in passwords]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def _max_length(field_name):
+    return User._meta.get_field(field_name).max_length
+
+
+def _validate(row, majors, semesters, active_semester, seen):
+    """Returns the cleaned values of a row, or raises ValueError."""
+    values = {key: (row.get(key) or '').strip() for key in (
+        'national_id', 'email', 'major', 'first_name', 'last_name', 'phone_number',
+        'username', 'first_semester', 'funded', 'password',
+    )}
+    for column in REQUIRED_COLUMNS:
+        if not values[column]:
+            raise ValueError(f"'{column}' is missing.")
+    values['username'] = values['username'] or values['national_id']
+    for field_name in ('national_id', 'email', 'first_name', 'last_name', 'phone_number', 'username'):
+        if len(values[field_name]) > _max_length(field_name):
+            raise ValueError(f"'{field_name}' is longer than {_max_length(field_name)} characters.")
+    try:
+        validate_email(values['email'])
+    except ValidationError:
+        raise ValueError(f"'{values['email']}' is not a valid email address.")
+
+    codename, values['major'] = values['major'], majors.get(values['major'])
+    if values['major'] is None:
+        raise ValueError(f"There is no major with the codename '{codename}'.")
+    if values['first_semester']:
+        semester = semesters.get(values['first_semester'])
+        if semester is None:
+            raise ValueError(f"There is no semester {values['first_semester']}.")
+        values['first_semester'] = semester
+    elif active_semester is None:
+        raise ValueError("No first semester was given and no semester is active.")
+    else:
+        values['first_semester'] = active_semester
+    values['funded'] = values['funded'].lower() in TRUE_VALUES
+
+    for field_name in UNIQUE_FIELDS:
+        key = (field_name, values[field_name])
+        if key in seen:
+            raise ValueError(f"{field_name} '{values[field_name]}' appears more than once in the file.")
+        seen.add(key)
+    return values
+
+
+def _taken(rows):
+    """The (field, value) pairs of the chunk that already belong to a user."""
+    taken = set()
+    for field_name in UNIQUE_FIELDS:
+        existing = User.objects.filter( # pyright: ignore
+            **{f'{field_name}__in': [values[field_name] for _, values in rows]}
+        ).values_list(field_name, flat=True)
+        taken.update((field_name, value) for value in existing)
+    return taken
+
+
+def _insert(rows, passwords):
+    """Inserts the users and students of a chunk; returns the students."""
+    by_prefix = {}
+    for index, (_, values) in enumerate(rows):
+        prefix = Student(major=values['major'], first_semester=values['first_semester']).student_id_prefix()
+        by_prefix.setdefault(prefix, []).append(index)
+    student_ids = [None] * len(rows)
+    for prefix, indexes in by_prefix.items():
+        for index, student_id in zip(indexes, reserve_student_ids(prefix, len(indexes))):
+            student_ids[index] = student_id
+
+    users = User.objects.bulk_create([ # pyright: ignore
+        User(
+            national_id=values['national_id'], username=values['username'], email=values['email'],
+            first_name=values['first_name'], last_name=values['last_name'],
+            phone_number=values['phone_number'] or None, password=password, role=User.Role.STUDENT,
+        )
+        for (_, values), password in zip(rows, passwords)
+    ])
+
+    students = []
+    for user, (_, values), student_id in zip(users, rows, student_ids):
+        student = Student(
+            user_ptr_id=user.pk, student_id=student_id, first_semester=values['first_semester'],
+            major=values['major'], funded=values['funded'], verified=False, gpa=0,
+        )
+        students.append(student)
+    # bulk_create refuses multi-table children, but their parent rows
+    # exist already: only the students' own table is left to insert.
+    fields = Student._meta.local_concrete_fields
+    quote_name = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote_name(Student._meta.db_table),
+        ', '.join(quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(getattr(student, field.attname), connection) for field in fields]
+            for student in students
+        ])
+    for student in students:
+        student._state.adding = False
+    return students
+
+
+def import_students(lines, chunk_size=CHUNK_SIZE, workers=None, progress=None, passwords=True):
+    """
+    Imports the students of a CSV, given as an iterable of text lines.
+
+    `workers` is the size of the password hashing pool (None: one per
+    CPU, 0: hash in this process). Without `passwords`, a file with a
+    password column is refused: hashing takes a fraction of a second per
+    row, too long for a web request. `progress` is called with the
+    ImportResult after every chunk. Returns the ImportResult.
+    """
+    from admins.search import index_users
+
+    reader = csv.DictReader(lines)
+    header = [column.strip().lower() for column in reader.fieldnames or []]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise StudentImportError(f"The first row must name the {', '.join(repr(c) for c in missing)} column(s).")
+    if not passwords and 'password' in header:
+        raise StudentImportError(
+            "Passwords can't be set from an upload. Remove the 'password' column "
+            "(the students get no usable password) or import the file with `manage.py import_students`."
+        )
+    reader.fieldnames = header
+
+    majors = {major.codename: major for major in Major.objects.exclude(codename=None)} # pyright: ignore
+    semesters = {str(semester.codename): semester for semester in Semester.objects.all()} # pyright: ignore
+    active_semester = Semester.objects.filter(active=True).first() # pyright: ignore
+    result = ImportResult()
+    seen = set()
+    hasher = PasswordHasher(workers)
+
+    def flush(chunk):
+        result.processed += len(chunk)
+        taken = _taken(chunk)
+        rows = []
+        for row_number, values in chunk:
+            clash = next((f for f in UNIQUE_FIELDS if (f, values[f]) in taken), None)
+            if clash:
+                result.error(row_number, f"A user with {clash} '{values[clash]}' already exists.")
+            else:
+                rows.append((row_number, values))
+        if rows:
+            hashed = hasher.hash([values['password'] for _, values in rows])
+            try:
+                with transaction.atomic():
+                    students = _insert(rows, hashed)
+                    index_users([student.pk for student in students])
+            except IntegrityError as e:
+                for row_number, _ in rows:
+                    result.error(row_number, f"The row could not be saved: {e}")
+            else:
+                result.imported += len(students)
+                result.student_ids.extend(student.student_id for student in students)
+        if progress is not None:
+            progress(result)
+
+    try:
+        chunk = []
+        for row_number, row in enumerate(reader, start=2):
+            if not any((value or '').strip() for value in row.values() if isinstance(value, str)):
+                continue
+            try:
+                chunk.append((row_number, _validate(row, majors, semesters, active_semester, seen)))
+            except ValueError as e:
+                result.processed += 1
+                result.error(row_number, str(e))
+            if len(chunk) == chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    finally:
+        hasher.close()
+    result.errors.sort()
+    return result
@@ -1,3 +1,129 @@
-from django.test import TestCase
+import datetime
+import io
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from courses.models import Semester
+from .backends import ProfileBackend
+from .middleware import ProfileMiddleware, get_profile
+from .models import Admin, Major, Student, StudentIdSequence, User
+from .student_ids import reserve_student_ids
+from .student_import import StudentImportError, import_students
+
+
+class StudentFixtureMixin:
+    def setUp(self):
+        Semester.objects.create( # pyright: ignore
+            codename=4031,
+            start_date=datetime.date(2024, 9, 1),
+            end_date=datetime.date(2025, 1, 1),
+            active=True,
+        )
+        self.major = Major.objects.create(name="Computer Science", codename="CS") # pyright: ignore
+
+    def make_student(self, n, **kwargs):
+        return Student.objects.create( # pyright: ignore
+            national_id=f"s{n}", username=f"s{n}", email=f"s{n}@example.com",
+            gpa=0, major=self.major, **kwargs,
+        )
+
+
+class StudentIdTests(StudentFixtureMixin, TestCase):
+    def test_signups_take_consecutive_ids(self):
+        ids = [self.make_student(n).student_id for n in range(3)]
+        self.assertEqual(ids, ["CS030001", "CS030002", "CS030003"])
+        self.assertEqual(StudentIdSequence.objects.get(prefix="CS03").last_value, 3) # pyright: ignore
+
+    def test_sequence_starts_after_existing_ids(self):
+        self.make_student(0, student_id="CS030041")
+        self.assertEqual(self.make_student(1).student_id, "CS030042")
+
+    def test_block_reservation(self):
+        self.assertEqual(reserve_student_ids("CS03", 3), ["CS030001", "CS030002", "CS030003"])
+        self.assertEqual(self.make_student(0).student_id, "CS030004")
+        self.assertEqual(reserve_student_ids("CS03", 0), [])
+
+
+class StudentImportTests(StudentFixtureMixin, TestCase):
+    CSV = (
+        "national_id,first_name,last_name,email,major,funded,password\n"
+        "n1,Ali,Rezaei,n1@example.com,CS,yes,secret-1\n"
+        "n2,Sara,Ahmadi,n2@example.com,CS,,\n"
+        "n1,Dup,Licate,other@example.com,CS,,\n"
+        "n3,No,Major,n3@example.com,XX,,\n"
+        "s0,Already,Here,s0-new@example.com,CS,,\n"
+    )
+
+    def test_import(self):
+        self.make_student(0)
+        result = import_students(io.StringIO(self.CSV), chunk_size=2, workers=0)
+
+        self.assertEqual((result.processed, result.imported), (5, 2))
+        self.assertEqual([row for row, _ in result.errors], [4, 5, 6])
+        self.assertEqual(result.student_ids, ["CS030002", "CS030003"])
+        first = Student.objects.get(national_id="n1") # pyright: ignore
+        self.assertEqual((first.student_id, first.username, first.role, first.funded), ("CS030002", "n1", User.Role.STUDENT, True))
+        self.assertTrue(first.check_password("secret-1"))
+        self.assertFalse(Student.objects.get(national_id="n2").has_usable_password()) # pyright: ignore
+
+    @mock.patch('users.student_import.ProcessPoolExecutor')
+    def test_uploads_refuse_passwords(self, pool):
+        self.client.force_login(Admin.objects.create( # pyright: ignore
+            national_id="a1", username="a1", email="a1@example.com", title="Registrar", is_staff=True,
+        ))
+        upload = SimpleUploadedFile('students.csv', self.CSV.encode())
+        response = self.client.post(reverse('admin_student_import'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("manage.py import_students", response.context['form'].errors['file'][0])
+        self.assertFalse(Student.objects.filter(national_id="n1").exists()) # pyright: ignore
+
+        without_passwords = "\n".join(line.rsplit(",", 1)[0] for line in self.CSV.splitlines())
+        upload = SimpleUploadedFile('students.csv', without_passwords.encode())
+        response = self.client.post(reverse('admin_student_import'), {'file': upload})
+        self.assertEqual(response.context['result'].imported, 3)
+        self.assertFalse(pool.called)
+        self.assertFalse(Student.objects.get(national_id="n1").has_usable_password()) # pyright: ignore
+
+    def test_missing_columns(self):
+        with self.assertRaises(StudentImportError):
+            import_students(io.StringIO("national_id,email\nn1,n1@example.com\n"), workers=0)
+
+
+class ProfileTests(StudentFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.student = self.make_student(0)
+
+    def request(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+
+        async def auser():
+            return user
+        request.auser = auser
+        ProfileMiddleware(lambda request: None).process_request(request)
+        return request
+
+    def test_profile_is_loaded_with_the_user(self):
+        user = ProfileBackend().get_user(self.student.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.request(user).profile, self.student)
+        self.assertIsNone(get_profile(AnonymousUser()))
+        self.assertIsNone(get_profile(User.objects.create(national_id="u1", username="u1", role=User.Role.STUDENT))) # pyright: ignore
+
+    async def test_aprofile(self):
+        user = await User.objects.aget(pk=self.student.pk) # pyright: ignore
+        request = self.request(user)
+        self.assertEqual(await request.aprofile(), self.student)
+        self.assertIsNone(await self.request(AnonymousUser()).aprofile())
+
+    def test_sessions_of_either_backend(self):
+        for backend in ('users.backends.ProfileBackend', 'django.contrib.auth.backends.ModelBackend'):
+            self.client.force_login(self.student, backend=backend)
+            response = self.client.get(reverse('hub'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['profile'], self.student)
@@ -101,17 +101,19 @@ def admin_signup(request):
     
     return render(request, 'users/signup_admin.html', {'form': form})
 '''
+HUB_TEMPLATES = {
+    User.Role.STUDENT: 'hub/student_hub.html',
+    User.Role.INSTRUCTOR: 'hub/instructor_hub.html',
+    User.Role.ADMIN: 'hub/admin_hub.html',
+}
+
 @login_required(login_url="login")
 def hub(request):
-    user = request.user 
-
+    # request.profile is the user's Student/Instructor/Admin row, loaded
+    # with the user by users.middleware.
     context = {
-            'user' : user
+            'user' : request.user,
+            'profile': request.profile,
             }
 
-    if user.role == User.Role.STUDENT:
-        return render(request, 'hub/student_hub.html', context)
-    if user.role == User.Role.INSTRUCTOR:
-        return render(request, 'hub/instructor_hub.html', context)
-    if user.role == User.Role.ADMIN:
-        return render(request, 'hub/admin_hub.html', context)
+    return render(request, HUB_TEMPLATES[request.user.role], context)